@@ -0,0 +1,203 @@
+import os
+import math
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+
+from instrumentation import ADMISSION_ACTIVE, ADMISSION_QUEUE_DEPTH, ADMISSION_REJECTED, ADMISSION_WAIT
+
+logger = logging.getLogger(__name__)
+
+# Admission control: at most ADMISSION_MAX_CONCURRENCY requests run at once, the rest queue
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "True") == "True"
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "32"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "128"))
+# Well below the backend's 30 s timeout, so a shed request fails fast instead of timing out
+ADMISSION_MAX_QUEUE_WAIT_MS = int(os.getenv("ADMISSION_MAX_QUEUE_WAIT_MS", "5000"))
+# Batch/eval traffic never takes more than this many slots, even when interactive traffic is idle
+ADMISSION_BATCH_MAX_CONCURRENCY = int(os.getenv("ADMISSION_BATCH_MAX_CONCURRENCY", "8"))
+
+# Lanes in priority order: a free slot always goes to the first lane with a waiter
+LANES = ("interactive", "batch")
+
+
+class Overloaded(Exception):
+    """Raised when a request is shed; `status_code` is 429 (queue full) or 503 (waited too long)."""
+
+    def __init__(self, lane: str, reason: str, status_code: int, retry_after: int):
+        super().__init__(f"{lane} request shed: {reason}")
+        self.lane = lane
+        self.reason = reason
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class Lane:
+    """
+    Waiters of one priority level, queued per session and served round-robin across
+    sessions, so one client sending a burst cannot push everyone else's turns back.
+    """
+
+    def __init__(self, name: str, max_concurrency: int):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.active = 0
+        self.sessions: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self.waiting = 0
+
+    def push(self, session_id: str, waiter: asyncio.Future):
+        self.sessions.setdefault(session_id, deque()).append(waiter)
+        self.waiting += 1
+
+    def pop(self) -> Optional[asyncio.Future]:
+        while self.sessions:
+            session_id, waiters = next(iter(self.sessions.items()))
+            waiter = waiters.popleft()
+            # Rotate the session to the back so the next slot goes to another session
+            del self.sessions[session_id]
+            if waiters:
+                self.sessions[session_id] = waiters
+            if not waiter.done():
+                self.waiting -= 1
+                return waiter
+        return None
+
+    def remove(self, session_id: str, waiter: asyncio.Future):
+        waiters = self.sessions.get(session_id)
+        if waiters is not None and waiter in waiters:
+            waiters.remove(waiter)
+            self.waiting -= 1
+            if not waiters:
+                del self.sessions[session_id]
+
+
+class AdmissionController:
+    """
+    Bounded concurrency with a priority-laned fair queue. A request that finds no free
+    slot waits up to `max_wait_ms`; it is shed with 429 when the queue is already full and
+    with 503 when its wait runs out, both with a Retry-After estimated from the current
+    queue and the average service time.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, max_wait_ms: int, lane_limits: Dict[str, int],
+                 enabled: bool = True):
+        self.enabled = enabled
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait_ms = max_wait_ms
+        self.lanes = {name: Lane(name, lane_limits.get(name, max_concurrency)) for name in LANES}
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.service_seconds = 1.0  # moving average of how long a slot is held
+
+    @property
+    def queued(self) -> int:
+        return sum(lane.waiting for lane in self.lanes.values())
+
+    def _can_run(self, lane: Lane) -> bool:
+        return self.active < self.max_concurrency and lane.active < lane.max_concurrency
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil((self.queued + 1) * self.service_seconds / self.max_concurrency))
+
+    def _reject(self, lane: Lane, reason: str, status_code: int) -> Overloaded:
+        self.rejected += 1
+        ADMISSION_REJECTED.labels(lane.name, reason).inc()
+        return Overloaded(lane.name, reason, status_code, self.retry_after())
+
+    def _grant(self, lane: Lane):
+        self.active += 1
+        lane.active += 1
+        ADMISSION_ACTIVE.labels(lane.name).set(lane.active)
+
+    def _update_gauges(self):
+        for lane in self.lanes.values():
+            ADMISSION_QUEUE_DEPTH.labels(lane.name).set(lane.waiting)
+
+    def _dispatch(self):
+        """Hands free slots to waiters: highest-priority lane first, round-robin across its sessions."""
+        for lane in self.lanes.values():
+            while lane.waiting and self._can_run(lane):
+                waiter = lane.pop()
+                if waiter is None:
+                    break
+                self._grant(lane)
+                waiter.set_result(None)
+        self._update_gauges()
+
+    async def acquire(self, lane_name: str, session_id: Optional[str]) -> float:
+        """Waits for a slot and returns the queue wait in ms; raises Overloaded when shed."""
+        if not self.enabled:
+            return 0.0
+        lane = self.lanes.get(lane_name, self.lanes[LANES[0]])
+        start = time.monotonic()
+        ahead = any(self.lanes[name].waiting for name in LANES[:LANES.index(lane.name) + 1])
+        if self._can_run(lane) and not ahead:
+            self._grant(lane)
+            self.admitted += 1
+            ADMISSION_WAIT.labels(lane.name).observe(0)
+            return 0.0
+        if self.queued >= self.max_queue:
+            raise self._reject(lane, "queue_full", 429)
+
+        waiter = asyncio.get_running_loop().create_future()
+        session_key = session_id or f"anonymous-{id(waiter)}"
+        lane.push(session_key, waiter)
+        self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.max_wait_ms / 1000)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was granted just as the wait ended: give it back
+                self.release(lane.name)
+            else:
+                waiter.cancel()
+                lane.remove(session_key, waiter)
+                self._update_gauges()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise self._reject(lane, "queue_timeout", 503)
+
+        waited = time.monotonic() - start
+        self.admitted += 1
+        ADMISSION_WAIT.labels(lane.name).observe(waited)
+        return round(waited * 1000, 2)
+
+    def release(self, lane_name: str, admitted_at: Optional[float] = None):
+        if not self.enabled:
+            return
+        lane = self.lanes.get(lane_name, self.lanes[LANES[0]])
+        self.active -= 1
+        lane.active -= 1
+        ADMISSION_ACTIVE.labels(lane.name).set(lane.active)
+        if admitted_at is not None:
+            self.service_seconds = 0.9 * self.service_seconds + 0.1 * (time.monotonic() - admitted_at)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, lane_name: str, session_id: Optional[str]):
+        """Holds a slot for the body of the `async with`; yields the queue wait in ms."""
+        wait_ms = await self.acquire(lane_name, session_id)
+        admitted_at = time.monotonic()
+        try:
+            yield wait_ms
+        finally:
+            self.release(lane_name, admitted_at)
+
+    def stats(self) -> dict:
+        return {
+            "admission_active": self.active,
+            "admission_queued": self.queued,
+            "admission_admitted": self.admitted,
+            "admission_rejected": self.rejected,
+        }
+
+
+admission = AdmissionController(
+    ADMISSION_MAX_CONCURRENCY, ADMISSION_MAX_QUEUE, ADMISSION_MAX_QUEUE_WAIT_MS,
+    {"batch": ADMISSION_BATCH_MAX_CONCURRENCY}, ADMISSION_ENABLED
+)
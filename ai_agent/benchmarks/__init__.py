@@ -0,0 +1,4 @@
+import os
+
+# Benchmarks run against local stubs; the provider SDKs still want a key at construction time.
+os.environ.setdefault("OPENAI_API_KEY", "benchmark-stub")
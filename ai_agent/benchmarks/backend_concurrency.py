@@ -0,0 +1,86 @@
+"""
+How many concurrent chat turns one backend deployment holds, sync ChatView vs async view.
+
+Ramps closed-loop concurrency against a running backend (--levels, each client sending
+--turns-per-client turns) and reports per level the throughput, latency percentiles,
+errors and the turns actually in flight (throughput x mean latency, Little's law). With
+the agent answering in a fixed time, a deployment that holds N turns at once keeps latency
+flat up to N clients; past it, turns queue for a worker and latency grows with the load.
+
+Fails when a level's error rate exceeds --max-error-rate, or, with --expect-concurrency N,
+when a level of at most N clients holds fewer than --min-in-flight-ratio of them in flight
+(the deployment queued turns it should have served at once).
+
+Run it once per deployment against the same stubbed agent, e.g.:
+    # ai_agent/ (admission control and answer caching off: every turn costs the agent the same)
+    ADMISSION_ENABLED=False SEMANTIC_CACHE_ENABLED=False COALESCING_ENABLED=False \
+        python -m benchmarks.loadtest serve-agent --port 8001 --latency 0.4
+    # backend/, sync view: 2 workers x 8 threads
+    CHAT_ASYNC_VIEW=False AI_AGENT_URL=http://localhost:8001/chat gunicorn config.wsgi -w 2 --threads 8 -b :8000
+    # backend/, async view: one uvicorn process
+    AI_AGENT_URL=http://localhost:8001/chat uvicorn config.asgi:application --lifespan off --port 8000
+    # ai_agent/
+    python -m benchmarks.backend_concurrency --label sync --levels 8 32 128 256 --expect-concurrency 16
+"""
+import argparse
+import asyncio
+import json
+from argparse import Namespace
+
+from benchmarks import loadtest
+
+
+async def run_level(args, concurrency: int) -> dict:
+    level_args = Namespace(**vars(args), concurrency=concurrency, requests=concurrency * args.turns_per_client)
+    summary = await loadtest.run_backend(level_args)
+    latency = summary["end_to_end_ms"]
+    return {
+        "concurrency": concurrency,
+        "requests": summary["requests"],
+        "throughput_rps": summary["throughput_rps"],
+        "in_flight": round(summary["throughput_rps"] * latency["mean"] / 1000, 1) if latency else 0,
+        "latency_ms": {key: latency.get(key) for key in ("p50", "p95", "p99")},
+        "error_rate": summary["error_rate"],
+        "errors": summary["errors"],
+        "backend_db_ms_p95": summary["stages_ms"].get("backend_db_ms", {}).get("p95"),
+    }
+
+
+def check(levels: list, args) -> list:
+    """Levels that miss the error-rate or concurrency expectations, as messages."""
+    failures = []
+    for level in levels:
+        if level["error_rate"] > args.max_error_rate:
+            failures.append(f"{level['concurrency']} clients: error rate {level['error_rate']}")
+        expected = args.expect_concurrency and level["concurrency"] <= args.expect_concurrency
+        if expected and level["in_flight"] < args.min_in_flight_ratio * level["concurrency"]:
+            failures.append(f"{level['concurrency']} clients: only {level['in_flight']} turns in flight")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--label", default="backend", help="Name of the deployment under test, for the report")
+    parser.add_argument("--levels", type=int, nargs="+", default=[8, 32, 128, 256])
+    parser.add_argument("--turns-per-client", type=int, default=4)
+    parser.add_argument("--turns-per-session", type=int, default=5)
+    parser.add_argument("--pool", type=int, default=200)
+    parser.add_argument("--url", default="http://localhost:8000/api/chat/")
+    parser.add_argument("--username", default="bench")
+    parser.add_argument("--password", default="bench")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--expect-concurrency", type=int, default=0,
+                        help="Turns the deployment should hold at once; levels up to it must not queue")
+    parser.add_argument("--min-in-flight-ratio", type=float, default=0.8)
+    args = parser.parse_args()
+
+    levels = [asyncio.run(run_level(args, concurrency)) for concurrency in args.levels]
+    print(json.dumps({"label": args.label, "levels": levels}, indent=2))
+    failures = check(levels, args)
+    if failures:
+        raise SystemExit("Backend concurrency below expectations: " + "; ".join(failures))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Database time per chat turn in a running backend, first turn of a session vs follow-ups.
+
+Sends --sessions sessions of --turns turns through the chat view and the stream view
+(whichever variant CHAT_ASYNC_VIEW serves) as an existing user, and reports per view and
+turn kind the statements and DB time the view measured (QueryTimer: `backend_db_queries`,
+`backend_db_ms`; commits show in the turn time only) next to the whole turn's wall time.
+Run the backend with the agent mocked so the turn time is the backend's own; the query
+budget per turn is checked by the chat app's tests (QUERY_BUDGET in backend/chat/tests.py).
+
+Usage:
+    # backend/
+    MOCK_AI_RESPONSE=True uvicorn config.asgi:application --lifespan off --port 8000
+    # ai_agent/
+    python -m benchmarks.backend_db --sessions 50 --turns 4 --username bench --password bench
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from benchmarks import loadtest
+
+ENDPOINTS = {"chat": "", "chat-stream": "stream/"}
+
+
+def done_event(text: str) -> dict:
+    """Data of the stream's final "done" event."""
+    event = None
+    for line in text.splitlines():
+        if line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:") and event == "done":
+            return json.loads(line[len("data:"):])
+    raise ValueError("stream ended without a done event")
+
+
+async def post_turn(client: httpx.AsyncClient, path: str, payload: dict) -> dict:
+    headers = {"X-CSRFToken": client.cookies.get("csrftoken", "")}
+    start = time.perf_counter()
+    if path == ENDPOINTS["chat"]:
+        response = await client.post(path, json=payload, headers=headers)
+        response.raise_for_status()
+        data = response.json()
+    else:
+        async with client.stream("POST", path, json=payload, headers=headers) as response:
+            response.raise_for_status()
+            data = done_event((await response.aread()).decode("utf-8"))
+    data["metrics"]["turn_ms"] = (time.perf_counter() - start) * 1000
+    return data
+
+
+async def run_session(client: httpx.AsyncClient, path: str, turns: int, index: int, samples: dict):
+    session_id = None
+    for turn in range(turns):
+        payload = {"message": f"¿Cuál es la capacidad de carga del E{20 + turn}? ({index})"}
+        if session_id:
+            payload["session_id"] = session_id
+        data = await post_turn(client, path, payload)
+        session_id = str(data["session_id"])
+        samples["new" if turn == 0 else "follow_up"].append(data["metrics"])
+
+
+async def run(args) -> dict:
+    client = httpx.AsyncClient(base_url=args.url, timeout=60)
+    try:
+        # check-auth sets the CSRF cookie that SessionAuthentication requires on every POST
+        await client.get("check-auth/")
+        response = await client.post("login/", json={"username": args.username, "password": args.password},
+                                     headers={"X-CSRFToken": client.cookies.get("csrftoken", "")})
+        response.raise_for_status()
+
+        report = {}
+        for name, path in ENDPOINTS.items():
+            samples = {"new": [], "follow_up": []}
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def session(index: int):
+                async with semaphore:
+                    await run_session(client, path, args.turns, index, samples)
+
+            await asyncio.gather(*[session(i) for i in range(args.sessions)])
+            report[name] = {
+                kind: {
+                    "turns": len(turns),
+                    "queries_max": max(metrics["backend_db_queries"] for metrics in turns),
+                    "db_ms": loadtest.percentiles([metrics["backend_db_ms"] for metrics in turns]),
+                    "turn_ms": loadtest.percentiles([metrics["turn_ms"] for metrics in turns]),
+                }
+                for kind, turns in samples.items() if turns
+            }
+        return report
+    finally:
+        await client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, default=50, help="Sessions per view")
+    parser.add_argument("--turns", type=int, default=4, help="Turns per session")
+    parser.add_argument("--concurrency", type=int, default=1, help="Sessions in flight at once")
+    parser.add_argument("--url", default="http://localhost:8000/api/chat/")
+    parser.add_argument("--username", default="bench")
+    parser.add_argument("--password", default="bench")
+    args = parser.parse_args()
+
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Checks that concurrent identical questions are coalesced into one provider call per stage.
+
+Fires N identical requests at once against stubbed providers (semantic cache
+bypassed, so only single-flight can deduplicate) and compares the per-stage call
+counts with a single request. Exits non-zero if any stage was called more often
+than for one request.
+
+Usage (from ai_agent/):
+    python -m benchmarks.coalescing --requests 30
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import services
+import single_flight
+from benchmarks import stubs
+
+SUMMARY = "El usuario pregunta por la carretilla Linde E20."
+
+
+def stage_calls(fakes) -> dict:
+    calls = {f"gemini_{name}": stub.calls for name, stub in fakes.gemini.items()}
+    calls["openai_embeddings"] = fakes.openai.embeddings.calls
+    calls["supabase_rpc"] = fakes.supabase.calls
+    return calls
+
+
+async def fire(message: str, requests: int, latency: float) -> dict:
+    fakes = stubs.install(services, latency=latency)
+    start = time.time()
+    results = await asyncio.gather(*[
+        services.get_ai_response_with_summary(message, SUMMARY, use_cache=False, turn=1)
+        for _ in range(requests)
+    ])
+    return {
+        "requests": requests,
+        "wall_ms": round((time.time() - start) * 1000, 2),
+        "coalesced_requests": sum(1 for _, _, metrics in results if metrics.get("coalesced")),
+        "distinct_answers": len({answer for answer, _, _ in results}),
+        "calls": stage_calls(fakes),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--latency", type=float, default=0.1, help="Seconds per stubbed provider call")
+    args = parser.parse_args()
+
+    single = asyncio.run(fire("¿Cuál es la capacidad de carga? (single)", 1, args.latency))
+    burst = asyncio.run(fire("¿Cuál es la capacidad de carga? (burst)", args.requests, args.latency))
+    single_flight.COALESCING_ENABLED = services.COALESCING_ENABLED = False
+    uncoalesced = asyncio.run(fire("¿Cuál es la capacidad de carga? (off)", args.requests, args.latency))
+
+    print(json.dumps({"single": single, "coalesced": burst, "uncoalesced": uncoalesced}, indent=2, ensure_ascii=False))
+
+    extra = {stage: calls for stage, calls in burst["calls"].items() if calls > single["calls"][stage]}
+    if extra:
+        print(f"FAIL: stages called more than once per burst: {extra}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Cold-start-to-first-answer time of the agent.
+
+Starts a fresh agent process per run and measures, from the moment it is spawned, when
+/health first answers, when /ready reports the provider connections and models warm, and
+when the first and second /chat answers arrive. The agent's own figure
+(cold_start_to_first_answer_ms in the first response) is reported next to it.
+
+By default the agent serves stubbed providers (benchmarks.loadtest serve-agent), which
+shows the import/startup timeline; --live starts `uvicorn main:app` with the real keys,
+where the pre-warmed TLS connections show up in the first answer.
+
+Usage (from ai_agent/):
+    python -m benchmarks.cold_start --runs 3
+    python -m benchmarks.cold_start --runs 3 --no-prewarm
+    python -m benchmarks.cold_start --live --port 8011
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+import numpy as np
+
+
+def wait_for(client: httpx.Client, url: str, started: float, timeout: float, status: int = 200) -> float:
+    while time.monotonic() - started < timeout:
+        try:
+            if client.get(url).status_code == status:
+                return round((time.monotonic() - started) * 1000, 2)
+        except httpx.TransportError:
+            pass
+        time.sleep(0.01)
+    raise TimeoutError(f"{url} not available after {timeout}s")
+
+
+def run_once(args) -> dict:
+    env = dict(os.environ)
+    if args.no_prewarm:
+        env.update(CLIENT_PREWARM_ENABLED="False", MODEL_WARMUP_ENABLED="False")
+    if args.live:
+        command = [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port), "--log-level", "warning"]
+    else:
+        command = [sys.executable, "-m", "benchmarks.loadtest", "serve-agent", "--port", str(args.port), "--latency", args.latency]
+
+    base = f"http://127.0.0.1:{args.port}"
+    started = time.monotonic()
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        with httpx.Client(timeout=60) as client:
+            result = {"health_ms": wait_for(client, f"{base}/health", started, args.timeout)}
+            if not args.no_prewarm:
+                result["ready_ms"] = wait_for(client, f"{base}/ready", started, args.timeout)
+            for label in ("first_answer_ms", "second_answer_ms"):
+                request_start = time.monotonic()
+                response = client.post(f"{base}/chat", json={"message": "¿Cuál es la capacidad de carga del E20?", "bypass_cache": True})
+                response.raise_for_status()
+                result[label] = round((time.monotonic() - started) * 1000, 2)
+                result[label.replace("_answer_ms", "_request_ms")] = round((time.monotonic() - request_start) * 1000, 2)
+                if label == "first_answer_ms":
+                    result["agent_reported_first_answer_ms"] = response.json()["metrics"].get("cold_start_to_first_answer_ms")
+            result["ready"] = client.get(f"{base}/ready").json()
+        return result
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--latency", default="0.05", help="Stub latency for every provider")
+    parser.add_argument("--live", action="store_true", help="Start the real app with the configured keys")
+    parser.add_argument("--no-prewarm", action="store_true", help="Disable connection pre-warm and model warm-up")
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    runs = [run_once(args) for _ in range(args.runs)]
+    keys = [key for key, value in runs[0].items() if isinstance(value, (int, float))]
+    summary = {key: round(float(np.median([run[key] for run in runs if run.get(key) is not None])), 2) for key in keys}
+    print(json.dumps({"runs": args.runs, "prewarm": not args.no_prewarm, "live": args.live, "median_ms": summary,
+                      "last_ready": runs[-1]["ready"]}, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Checks that one agent process overlaps concurrent /chat turns.
+
+Each stubbed provider call sleeps for `--latency` seconds, so a single turn
+takes a few of those in series (embedding, search, answer, summary, ...).
+With a non-blocking pipeline N concurrent turns finish in about one turn's
+latency; a blocking pipeline would take N times as long.
+
+Usage (from ai_agent/):
+    python -m benchmarks.concurrency --requests 20 --latency 0.2
+"""
+import argparse
+import asyncio
+import time
+
+import services
+from benchmarks import stubs
+
+
+async def run(requests: int, latency: float) -> dict:
+    from main import ChatRequest, chat_endpoint
+
+    stubs.install(services, latency)
+
+    start = time.perf_counter()
+    await chat_endpoint(ChatRequest(message="capacidad de carga del E20", summary=""), traceparent=None)
+    single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        chat_endpoint(ChatRequest(message=f"capacidad de carga del E20 ({i})", summary=""), traceparent=None)
+        for i in range(requests)
+    ])
+    concurrent = time.perf_counter() - start
+
+    return {
+        "requests": requests,
+        "single_turn_s": round(single, 3),
+        "concurrent_s": round(concurrent, 3),
+        "ratio": round(concurrent / single, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.requests, args.latency))
+    print(result)
+    # Allow some slack for scheduling overhead; serialised execution would be ~N.
+    if result["ratio"] > 2:
+        raise SystemExit(f"Turns were serialised: {result['ratio']}x a single turn")
+
+
+if __name__ == "__main__":
+    main()
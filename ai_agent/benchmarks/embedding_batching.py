@@ -0,0 +1,61 @@
+"""
+Compares OpenAI embedding request counts with and without the micro-batcher.
+
+Fires N concurrent first-turn conversations with distinct questions against
+stubbed providers and reports embeddings.create calls, wall time and the
+batch-size / queue-wait histograms exposed in the metrics.
+
+Usage (from ai_agent/):
+    python -m benchmarks.embedding_batching --requests 100 --window-ms 10
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import embedding_batcher
+import services
+from benchmarks import stubs
+
+
+async def fire(requests: int, latency: float, tag: str) -> dict:
+    fakes = stubs.install(services, latency=latency)
+    start = time.time()
+    results = await asyncio.gather(*[
+        services.get_ai_response(f"¿Capacidad de carga del modelo {i}? ({tag})", "")
+        for i in range(requests)
+    ])
+    metrics = results[-1][1]
+    return {
+        "requests": requests,
+        "wall_ms": round((time.time() - start) * 1000, 2),
+        "embedding_calls": fakes.openai.embeddings.calls,
+        "batch_size_histogram": metrics.get("embedding_batch_size_histogram"),
+        "queue_wait_ms_histogram": metrics.get("embedding_queue_wait_ms_histogram"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.1, help="Seconds per stubbed provider call")
+    parser.add_argument("--window-ms", type=float, default=10)
+    parser.add_argument("--max-size", type=int, default=64)
+    args = parser.parse_args()
+
+    services.embedding_batcher = embedding_batcher.EmbeddingBatcher(
+        lambda: services.client_registry.openai, services.EMBEDDING_MODEL, args.window_ms, args.max_size
+    )
+    batched = asyncio.run(fire(args.requests, args.latency, "batched"))
+    services.EMBEDDING_BATCH_ENABLED = False
+    unbatched = asyncio.run(fire(args.requests, args.latency, "unbatched"))
+
+    print(json.dumps({
+        "batched": batched,
+        "unbatched": unbatched,
+        "request_reduction": round(1 - batched["embedding_calls"] / unbatched["embedding_calls"], 3),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
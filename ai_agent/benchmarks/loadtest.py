@@ -0,0 +1,269 @@
+"""
+Offline load test for the agent and the Django ChatView against stubbed providers.
+
+Targets:
+  agent        drives the FastAPI app in-process (ASGI transport, no sockets) with stubbed providers
+  serve-agent  serves the stubbed agent on --port, so a local backend can point AI_AGENT_URL at it
+  backend      drives a running backend's ChatView over HTTP, logging in with --username/--password
+
+Each run reports throughput, error rate and p50/p95/p99 end to end and per stage (every
+numeric *_ms key in the response metrics), and writes them as JSON under
+benchmarks/results/ together with the commit and the load/stub settings. --compare prints
+the p95 change against an earlier result file.
+
+Usage (from ai_agent/):
+    python -m benchmarks.loadtest agent --concurrency 32 --requests 2000 --gemini-latency 0.4:0.5
+    python -m benchmarks.loadtest serve-agent --port 8001 --gemini-latency 0.4:0.5
+    # backend/: MOCK_AI_RESPONSE=False AI_AGENT_URL=http://localhost:8001/chat python manage.py runserver
+    python -m benchmarks.loadtest backend --url http://localhost:8000/api/chat/ --username bench --password bench
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import httpx
+import numpy as np
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+QUESTIONS = [
+    "¿Cuál es la capacidad de carga del {model}?", "¿Qué altura de elevación alcanza el {model}?",
+    "Radio de giro del {model}", "¿Qué batería lleva el {model}?", "Velocidad de traslación del {model} con carga",
+    "Dimensiones de las horquillas del {model}", "¿El {model} tiene Linde BlueSpot?", "Peso en servicio del {model}",
+]
+MODELS = ["E20", "E25", "E30", "E35", "H25", "H30", "L14", "T20"]
+SUMMARY = "El usuario consulta especificaciones técnicas de carretillas Linde."
+
+
+def question(rng, pool: int) -> str:
+    """One of `pool` distinct questions; a small pool means more semantic cache and single-flight hits."""
+    i = int(rng.integers(pool))
+    return QUESTIONS[i % len(QUESTIONS)].format(model=MODELS[(i // len(QUESTIONS)) % len(MODELS)]) + (
+        f" (variante {i})" if i >= len(QUESTIONS) * len(MODELS) else ""
+    )
+
+
+def percentiles(values) -> dict:
+    if not values:
+        return {}
+    values = np.asarray(values, dtype=np.float64)
+    return {
+        "count": int(values.size),
+        "mean": round(float(values.mean()), 2),
+        "p50": round(float(np.percentile(values, 50)), 2),
+        "p95": round(float(np.percentile(values, 95)), 2),
+        "p99": round(float(np.percentile(values, 99)), 2),
+        "max": round(float(values.max()), 2),
+    }
+
+
+async def drive(send, concurrency: int, requests: int) -> dict:
+    """Closed loop: `concurrency` workers each send their next request as soon as the previous one returns."""
+    samples = []
+    issued = 0
+
+    async def worker(worker_id: int):
+        nonlocal issued
+        while issued < requests:
+            issued += 1
+            start = time.perf_counter()
+            try:
+                metrics = await send(worker_id)
+                error = None
+            except Exception as e:
+                metrics, error = {}, type(e).__name__
+            samples.append({"latency_ms": (time.perf_counter() - start) * 1000, "metrics": metrics, "error": error})
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker(i) for i in range(concurrency)])
+    return summarise(samples, time.perf_counter() - start)
+
+
+def summarise(samples: list, wall: float) -> dict:
+    """Samples are {"latency_ms", "metrics", "error"} dicts, one per request."""
+    ok = [s for s in samples if s["error"] is None]
+    stages = {}
+    for sample in ok:
+        for key, value in sample["metrics"].items():
+            if key.endswith("_ms") and isinstance(value, (int, float)) and not isinstance(value, bool):
+                stages.setdefault(key, []).append(value)
+    errors = {}
+    for sample in samples:
+        if sample["error"]:
+            errors[sample["error"]] = errors.get(sample["error"], 0) + 1
+
+    return {
+        "requests": len(samples),
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(ok) / wall, 2) if wall else 0.0,
+        "error_rate": round(1 - len(ok) / len(samples), 4) if samples else 0.0,
+        "errors": errors,
+        "end_to_end_ms": percentiles([s["latency_ms"] for s in ok]),
+        "stages_ms": {key: percentiles(values) for key, values in sorted(stages.items())},
+    }
+
+
+def install_stubs(args):
+    import services
+    from benchmarks import stubs
+
+    return stubs.install(
+        services,
+        latency=stubs.parse_latency(args.latency),
+        gemini_latency=stubs.parse_latency(args.gemini_latency, seed=1) if args.gemini_latency else None,
+        embedding_latency=stubs.parse_latency(args.embedding_latency, seed=2) if args.embedding_latency else None,
+        rpc_latency=stubs.parse_latency(args.rpc_latency, seed=3) if args.rpc_latency else None,
+        failure_rate=args.failure_rate,
+    )
+
+
+async def run_agent(args) -> dict:
+    import main
+
+    install_stubs(args)
+    rng = np.random.default_rng(args.seed)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://agent", timeout=60) as client:
+        async def send(worker_id: int) -> dict:
+            follow_up = rng.random() < args.follow_up_ratio
+            response = await client.post("/chat", json={
+                "message": question(rng, args.pool),
+                "summary": SUMMARY if follow_up else "",
+                "turn": int(rng.integers(2, 10)) if follow_up else 1,
+            })
+            response.raise_for_status()
+            return response.json()["metrics"]
+
+        return await drive(send, args.concurrency, args.requests)
+
+
+async def run_backend(args) -> dict:
+    rng = np.random.default_rng(args.seed)
+    clients = []
+
+    async def login() -> httpx.AsyncClient:
+        client = httpx.AsyncClient(base_url=args.url, timeout=60)
+        # check-auth sets the CSRF cookie that SessionAuthentication requires on every POST
+        await client.get("check-auth/")
+        response = await client.post("login/", json={"username": args.username, "password": args.password},
+                                     headers={"X-CSRFToken": client.cookies.get("csrftoken", "")})
+        response.raise_for_status()
+        return client
+
+    for _ in range(args.concurrency):
+        clients.append(await login())
+    sessions = [{"id": None, "turns": 0} for _ in clients]
+
+    async def send(worker_id: int) -> dict:
+        client, session = clients[worker_id], sessions[worker_id]
+        if session["turns"] >= args.turns_per_session:
+            session.update(id=None, turns=0)
+        response = await client.post("", json={"message": question(rng, args.pool), "session_id": session["id"]},
+                                     headers={"X-CSRFToken": client.cookies.get("csrftoken", "")})
+        response.raise_for_status()
+        data = response.json()
+        session.update(id=str(data["session_id"]), turns=session["turns"] + 1)
+        return data["metrics"]
+
+    try:
+        return await drive(send, args.concurrency, args.requests)
+    finally:
+        await asyncio.gather(*[client.aclose() for client in clients])
+
+
+def serve_agent(args):
+    import uvicorn
+    import main
+    import model_registry
+
+    # Provider-side context caching would replace the stubs with real models at startup
+    model_registry.CONTEXT_CACHE_ENABLED = False
+    install_stubs(args)
+    uvicorn.run(main.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(result: dict, baseline_path: str):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    rows = [("end_to_end_ms", result["end_to_end_ms"], baseline["summary"]["end_to_end_ms"])]
+    for key, stats in result["stages_ms"].items():
+        rows.append((key, stats, baseline["summary"]["stages_ms"].get(key, {})))
+    print(f"\np95 vs {baseline.get('commit', '?')} ({baseline_path}):")
+    for key, now, before in rows:
+        if now.get("p95") is None or not before.get("p95"):
+            continue
+        change = (now["p95"] - before["p95"]) / before["p95"] * 100
+        print(f"  {key:45s} {before['p95']:>10.2f} -> {now['p95']:>10.2f} ms  ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("target", choices=["agent", "serve-agent", "backend"])
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--pool", type=int, default=200, help="Distinct questions to draw from")
+    parser.add_argument("--follow-up-ratio", type=float, default=0.5, help="Share of agent requests with a summary")
+    parser.add_argument("--turns-per-session", type=int, default=5, help="Backend: turns before a worker starts a new session")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", default="0.05", help='Default stub latency: "0.05" or lognormal "median:sigma"')
+    parser.add_argument("--gemini-latency")
+    parser.add_argument("--embedding-latency")
+    parser.add_argument("--rpc-latency")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Injected error rate for every stubbed provider")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--url", default="http://localhost:8000/api/chat/")
+    parser.add_argument("--username", default="bench")
+    parser.add_argument("--password", default="bench")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/<target>-<commit>-<time>.json)")
+    parser.add_argument("--compare", help="Earlier result file to compare p95s against")
+    args = parser.parse_args()
+
+    if args.target == "serve-agent":
+        serve_agent(args)
+        return
+
+    summary = asyncio.run(run_agent(args) if args.target == "agent" else run_backend(args))
+    report(args.target, args, summary)
+
+
+def report(target: str, args, summary: dict, extra_keys=()):
+    """Prints the summary, writes the result file and compares it with --compare if given."""
+    commit = git_commit()
+    result = {
+        "target": target,
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("password", "output", "compare")},
+        "summary": summary,
+    }
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{target}-{commit}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+
+    keys = ("requests", "wall_s", "throughput_rps", "error_rate", "errors", "end_to_end_ms") + tuple(extra_keys)
+    print(json.dumps({key: summary[key] for key in keys}, indent=2, ensure_ascii=False))
+    for key, stats in summary["stages_ms"].items():
+        print(f"  {key:45s} p50 {stats['p50']:>9.2f}  p95 {stats['p95']:>9.2f}  p99 {stats['p99']:>9.2f}")
+    print(f"Results written to {output}")
+    if args.compare:
+        compare(summary, args.compare)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
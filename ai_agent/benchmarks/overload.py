@@ -0,0 +1,118 @@
+"""
+Synthetic overload of the agent with and without admission control.
+
+Requests arrive open-loop (Poisson) faster than the stubbed Gemini provider can serve
+them: --gemini-capacity concurrent calls of --gemini-latency seconds each, with the rest
+queueing at the provider. Interactive and batch traffic arrive side by side. Each request
+is given up after --client-timeout seconds, like the backend's 30 s timeout.
+
+Reports per lane how many requests were answered, how fast (p50/p95/p99 of the answered
+ones), how many were shed with 429/503 and the Retry-After they got, and how many timed out.
+
+Usage (from ai_agent/):
+    python -m benchmarks.overload --interactive-rps 20 --batch-rps 10 --duration 10
+    python -m benchmarks.overload --max-concurrency 8 --max-queue-wait-ms 3000
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+import numpy as np
+
+from benchmarks import loadtest
+
+
+async def run(args, admission_enabled: bool) -> dict:
+    import main
+    import services
+    from benchmarks import stubs
+    from admission import admission
+
+    stubs.install(services, latency=0.02, gemini_latency=args.gemini_latency, gemini_capacity=args.gemini_capacity)
+    admission.enabled = admission_enabled
+    admission.max_concurrency = args.max_concurrency
+    admission.max_wait_ms = args.max_queue_wait_ms
+    admission.lanes["interactive"].max_concurrency = args.max_concurrency
+    admission.lanes["batch"].max_concurrency = args.batch_max_concurrency
+
+    rng = np.random.default_rng(args.seed)
+    arrivals = []
+    for lane, rate in (("interactive", args.interactive_rps), ("batch", args.batch_rps)):
+        if rate > 0:
+            times = np.cumsum(rng.exponential(1 / rate, int(rate * args.duration * 2)))
+            arrivals += [(float(t), lane) for t in times if t < args.duration]
+    arrivals.sort()
+
+    results = []
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://agent", timeout=None) as client:
+        async def send(i: int, lane: str):
+            start = time.perf_counter()
+            result = {"lane": lane}
+            try:
+                response = await asyncio.wait_for(client.post("/chat", json={
+                    "message": f"{loadtest.question(rng, 64)} #{i}",
+                    "session_id": f"session-{i % args.sessions}",
+                    "bypass_cache": True,
+                    "priority": lane,
+                }), args.client_timeout)
+                result["status"] = response.status_code
+                result["retry_after"] = response.headers.get("retry-after")
+            except asyncio.TimeoutError:
+                result["status"] = "timeout"
+            result["latency_ms"] = (time.perf_counter() - start) * 1000
+            results.append(result)
+
+        tasks = []
+        begin = time.perf_counter()
+        for i, (at, lane) in enumerate(arrivals):
+            await asyncio.sleep(max(0.0, at - (time.perf_counter() - begin)))
+            tasks.append(asyncio.create_task(send(i, lane)))
+        await asyncio.gather(*tasks)
+        wall = time.perf_counter() - begin
+
+    report = {"admission": admission_enabled, "offered": len(arrivals), "wall_s": round(wall, 2), "lanes": {}}
+    for lane in ("interactive", "batch"):
+        lane_results = [r for r in results if r["lane"] == lane]
+        if not lane_results:
+            continue
+        ok = [r["latency_ms"] for r in lane_results if r["status"] == 200]
+        shed = [r for r in lane_results if r["status"] in (429, 503)]
+        retry_after = [int(r["retry_after"]) for r in shed if r["retry_after"]]
+        report["lanes"][lane] = {
+            "requests": len(lane_results),
+            "ok": len(ok),
+            "ok_latency_ms": loadtest.percentiles(ok),
+            "shed_429": sum(1 for r in shed if r["status"] == 429),
+            "shed_503": sum(1 for r in shed if r["status"] == 503),
+            "shed_latency_ms": loadtest.percentiles([r["latency_ms"] for r in shed]),
+            "retry_after_s": loadtest.percentiles(retry_after),
+            "timeouts": sum(1 for r in lane_results if r["status"] == "timeout"),
+            "errors": sum(1 for r in lane_results if r["status"] not in (200, 429, 503, "timeout")),
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--interactive-rps", type=float, default=20)
+    parser.add_argument("--batch-rps", type=float, default=10)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--sessions", type=int, default=40)
+    parser.add_argument("--gemini-latency", type=float, default=0.3)
+    parser.add_argument("--gemini-capacity", type=int, default=8, help="Concurrent Gemini calls the provider serves")
+    parser.add_argument("--max-concurrency", type=int, default=8)
+    parser.add_argument("--batch-max-concurrency", type=int, default=2)
+    parser.add_argument("--max-queue-wait-ms", type=int, default=3000)
+    parser.add_argument("--client-timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    reports = [asyncio.run(run(args, enabled)) for enabled in (False, True)]
+    print(json.dumps(reports, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Agent traffic against a rate-limited Gemini provider, with and without the rate scheduler.
+
+The stubbed provider enforces --gemini-rpm as a token bucket of --burst-seconds of quota
+and fails every call over it with a 429, like the real API. Requests arrive open-loop
+(Poisson): a --spike-rps burst for the first --spike-seconds, then --rps, so the burst
+drains the provider's quota and the rest of the run hovers around it. Every request is a
+follow-up turn, so it needs a rewrite, an answer and, on the summary cadence, a summary.
+
+Reports the provider's 429s, how many answers and rewrites fell back because of them,
+end-to-end latency and the throttle delay (`*_throttle_ms`) the scheduler added instead.
+
+Usage (from ai_agent/):
+    python -m benchmarks.rate_limits --gemini-rpm 600 --rps 2.5 --spike-rps 10 --duration 20
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+import numpy as np
+
+from benchmarks import loadtest
+
+
+async def run(args, scheduler_enabled: bool) -> dict:
+    import main
+    import services
+    import rate_limits
+    from benchmarks import stubs
+
+    quota = stubs.StubQuota(args.gemini_rpm, args.burst_seconds)
+    installed = stubs.install(services, latency=0.02, gemini_latency=args.gemini_latency, gemini_quota=quota)
+    services.gemini_budget = rate_limits.RateBudget(
+        "gemini", args.gemini_rpm, rate_limits.RATE_LIMIT_GEMINI_TPM, scheduler_enabled, args.burst_seconds
+    )
+    rate_limits.gemini_budget = services.gemini_budget
+
+    rng = np.random.default_rng(args.seed)
+    arrivals = []
+    for begin, end, rate in ((0, args.spike_seconds, args.spike_rps), (args.spike_seconds, args.duration, args.rps)):
+        if rate > 0 and end > begin:
+            times = begin + np.cumsum(rng.exponential(1 / rate, int(rate * (end - begin) * 2) + 1))
+            arrivals += [float(t) for t in times if t < end]
+
+    results = []
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://agent", timeout=None) as client:
+        async def send(i: int):
+            start = time.perf_counter()
+            response = await client.post("/chat", json={
+                "message": f"{loadtest.question(rng, 64)} #{i}",
+                "summary": loadtest.SUMMARY,
+                "turn": int(rng.integers(2, 10)),
+                "bypass_cache": True,
+            })
+            result = {"status": response.status_code, "latency_ms": (time.perf_counter() - start) * 1000}
+            if response.status_code == 200:
+                body = response.json()
+                result["answer"] = body["answer"]
+                result["metrics"] = body["metrics"]
+            results.append(result)
+
+        tasks = []
+        begin = time.perf_counter()
+        for i, at in enumerate(arrivals):
+            await asyncio.sleep(max(0.0, at - (time.perf_counter() - begin)))
+            tasks.append(asyncio.create_task(send(i)))
+        await asyncio.gather(*tasks)
+        wall = time.perf_counter() - begin
+
+    ok = [r for r in results if r["status"] == 200]
+    failed_answers = [r for r in ok if r["answer"].startswith("Error") or r["answer"] == "Lo siento, no pude generar una respuesta."]
+    rewrite_calls = installed.gemini["rewrite"].calls if "rewrite" in installed.gemini else 0
+    return {
+        "scheduler": scheduler_enabled,
+        "offered": len(arrivals),
+        "wall_s": round(wall, 2),
+        "gemini_calls": sum(model.calls for model in installed.gemini.values()),
+        "gemini_calls_per_model": {name: model.calls for name, model in installed.gemini.items()},
+        "provider_429s": quota.rejected,
+        "failed_answers": len(failed_answers),
+        "rewrite_calls": rewrite_calls,
+        "http_errors": len(results) - len(ok),
+        "latency_ms": loadtest.percentiles([r["latency_ms"] for r in ok]),
+        "generation_throttle_ms": loadtest.percentiles([r["metrics"].get("generation_throttle_ms", 0) for r in ok]),
+        "rewrite_throttle_ms": loadtest.percentiles([r["metrics"]["rewrite_throttle_ms"] for r in ok if "rewrite_throttle_ms" in r["metrics"]]),
+        "budget_overruns": services.gemini_budget.overruns,
+        "final_budget": services.gemini_budget.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--gemini-rpm", type=float, default=600, help="Provider quota, requests per minute")
+    parser.add_argument("--burst-seconds", type=float, default=5, help="Seconds of quota the provider lets through at once")
+    parser.add_argument("--rps", type=float, default=2.5)
+    parser.add_argument("--spike-rps", type=float, default=10)
+    parser.add_argument("--spike-seconds", type=float, default=3)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--gemini-latency", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    reports = [asyncio.run(run(args, enabled)) for enabled in (False, True)]
+    print(json.dumps(reports, indent=2))
+
+
+if __name__ == "__main__":
+    main()
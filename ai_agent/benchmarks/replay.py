@@ -0,0 +1,153 @@
+"""
+Replays exported production conversations against the agent.
+
+Reads the JSONL written by the backend's `export_conversations` management command
+and plays every session back with its original turn order and inter-arrival timing,
+scaled by --speed (1 = real time, 60 = one minute per second, 0 = no waiting). Each
+session keeps its own summary and recent-message window exactly like ChatView does,
+and a turn never starts before the previous answer arrived.
+
+Runs the agent in-process against stubbed providers by default, with real keys
+(--live), or against a running agent (--url). Reports latency percentiles, semantic
+cache hit rate, retrieval paths (speculative reuse vs. merge) and summary strategies,
+and writes them as a result file comparable with --compare (see benchmarks.loadtest).
+
+Usage (from ai_agent/):
+    # backend/: python manage.py export_conversations /tmp/conversations.jsonl --since 2025-01-01
+    python -m benchmarks.replay /tmp/conversations.jsonl --speed 60 --max-gap 5
+    python -m benchmarks.replay /tmp/conversations.jsonl --speed 0 --live
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from benchmarks import loadtest
+
+HISTORY_MESSAGES = 6
+
+
+def load_sessions(path: str, limit: int = None) -> list:
+    with open(path, encoding="utf-8") as f:
+        sessions = [json.loads(line) for line in f if line.strip()]
+    return sessions[:limit] if limit else sessions
+
+
+def schedule(offsets: list, speed: float, max_gap: float) -> list:
+    """Scales offsets (seconds) by `speed`, capping each gap at `max_gap` seconds of replay time."""
+    scheduled, previous, elapsed = [], None, 0.0
+    for offset in offsets:
+        if previous is not None:
+            gap = (offset - previous) / speed if speed else 0.0
+            elapsed += min(gap, max_gap) if max_gap else gap
+        scheduled.append(elapsed)
+        previous = offset
+    return scheduled
+
+
+async def sleep_until(deadline: float):
+    delay = deadline - time.perf_counter()
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+
+async def replay(args) -> dict:
+    sessions = load_sessions(args.conversations, args.limit)
+    session_starts = schedule([s["offset_s"] for s in sessions], args.speed, args.max_gap)
+    samples = []
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=60)
+    else:
+        import main
+        if not args.live:
+            loadtest.install_stubs(args)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://agent", timeout=60)
+
+    async def play(session: dict, start_at: float):
+        await sleep_until(start_at)
+        session_start = time.perf_counter()
+        turn_times = schedule([t["offset_s"] for t in session["turns"]], args.speed, args.max_gap)
+        summary, history = None, []
+        for number, (turn, at) in enumerate(zip(session["turns"], turn_times), 1):
+            await sleep_until(session_start + at)
+            message = turn["message"]
+            # Same placeholder ChatView stores for a new session
+            summary = summary or f"New conversation started: {message[:30]}..."
+            started = time.perf_counter()
+            try:
+                response = await client.post(args.path, json={
+                    "message": message, "summary": summary, "recent_turns": history[-HISTORY_MESSAGES:],
+                    "session_id": session["session"], "turn": number,
+                })
+                response.raise_for_status()
+                data = response.json()
+                error = None
+            except Exception as e:
+                data, error = {}, type(e).__name__
+            samples.append({"latency_ms": (time.perf_counter() - started) * 1000, "metrics": data.get("metrics", {}), "error": error})
+            answer = data.get("answer", "")
+            summary = data.get("summary") or summary
+            history += [{"is_user": True, "message": message}, {"is_user": False, "message": answer}]
+
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*[play(session, start + at) for session, at in zip(sessions, session_starts)])
+    finally:
+        await client.aclose()
+    summary = loadtest.summarise(samples, time.perf_counter() - start)
+    summary.update(traffic_mix(samples))
+    summary["sessions"] = len(sessions)
+    return summary
+
+
+def counts(values) -> dict:
+    result = {}
+    for value in values:
+        result[str(value)] = result.get(str(value), 0) + 1
+    return dict(sorted(result.items()))
+
+
+def traffic_mix(samples: list) -> dict:
+    metrics = [s["metrics"] for s in samples if s["error"] is None]
+    lookups = [m for m in metrics if "semantic_cache_hit" in m]
+    paths = counts(m.get("retrieval_path", "cache_hit" if m.get("semantic_cache_hit") else "none") for m in metrics)
+    speculative = paths.get("speculative_reuse", 0) + paths.get("speculative_merge", 0)
+    return {
+        "semantic_cache_hit_rate": round(sum(m["semantic_cache_hit"] for m in lookups) / len(lookups), 4) if lookups else 0.0,
+        "coalesced_rate": round(sum(bool(m.get("coalesced")) for m in metrics) / len(metrics), 4) if metrics else 0.0,
+        # Share of speculative turns that reused the raw-message results and skipped the second search
+        "speculative_reuse_rate": round(paths.get("speculative_reuse", 0) / speculative, 4) if speculative else 0.0,
+        "retrieval_paths": paths,
+        "summary_strategies": counts(m["summary_strategy"] for m in metrics if "summary_strategy" in m),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("conversations", help="JSONL from `manage.py export_conversations`")
+    parser.add_argument("--speed", type=float, default=1.0, help="Time compression; 0 replays without waiting")
+    parser.add_argument("--max-gap", type=float, default=0.0, help="Cap on any idle gap after scaling (seconds, 0 = none)")
+    parser.add_argument("--limit", type=int, help="Replay only the first N sessions")
+    parser.add_argument("--live", action="store_true", help="Use the real providers (keys from the environment)")
+    parser.add_argument("--url", help="Replay against a running agent instead of in-process")
+    parser.add_argument("--path", default="/chat")
+    parser.add_argument("--latency", default="0.05", help='Stub latency: "0.05" or lognormal "median:sigma"')
+    parser.add_argument("--gemini-latency")
+    parser.add_argument("--embedding-latency")
+    parser.add_argument("--rpc-latency")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--output")
+    parser.add_argument("--compare")
+    args = parser.parse_args()
+
+    summary = asyncio.run(replay(args))
+    loadtest.report("replay", args, summary, extra_keys=(
+        "sessions", "semantic_cache_hit_rate", "coalesced_rate", "speculative_reuse_rate", "retrieval_paths", "summary_strategies"
+    ))
+
+
+if __name__ == "__main__":
+    main()
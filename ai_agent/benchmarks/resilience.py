@@ -0,0 +1,111 @@
+"""
+Exercises per-stage deadlines, hedging and circuit breakers with latency-injecting stubs.
+
+Scenarios:
+  deadline  the rewrite hangs for 5 s; the turn must finish within the rewrite
+            deadline plus the rest of the pipeline, falling back to the raw message.
+  hedging   5% of embedding calls take 1 s; compares p50/p99 with and without hedging.
+  circuit   the rewrite always fails; once the breaker opens, later turns must skip
+            the rewrite instead of calling Gemini.
+Exits non-zero if a scenario does not behave as expected.
+
+Usage (from ai_agent/):
+    python -m benchmarks.resilience
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import numpy as np
+
+import resilience
+import services
+from benchmarks import stubs
+
+SUMMARY = "El usuario pregunta por la carretilla Linde E20."
+
+
+async def deadline_scenario(deadline_ms: float) -> dict:
+    fakes = stubs.install(services, latency=0.05)
+    fakes.gemini["rewrite"].latency = 5
+    services.rewrite_stage = resilience.Stage("rewrite", deadline_ms)
+    start = time.monotonic()
+    answer, metrics = await services.get_ai_response("¿Altura de elevación del E20?", SUMMARY, use_cache=False)
+    return {
+        "turn_ms": round((time.monotonic() - start) * 1000, 2),
+        "rewrite_deadline_exceeded": metrics.get("rewrite_deadline_exceeded", False),
+        "retrieval_path": metrics.get("retrieval_path"),
+        "answered": answer == fakes.gemini["answer"].answer,
+    }
+
+
+async def hedging_scenario(calls: int, hedging: bool) -> dict:
+    fakes = stubs.install(services, latency=stubs.spiky(0.02, 1.0, 0.05, seed=1))
+    resilience.HEDGING_ENABLED = hedging
+    services.embedding_stage = resilience.Stage("embedding", resilience.STAGE_DEADLINE_EMBEDDING_MS, hedged=True)
+    latencies = []
+    for i in range(calls):
+        start = time.monotonic()
+        await services.create_embedding(f"consulta de prueba {i} ({hedging})")
+        latencies.append((time.monotonic() - start) * 1000)
+    stats = services.embedding_stage.stats()
+    return {
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 2),
+        "provider_calls": fakes.openai.embeddings.calls,
+        "hedges": stats["embedding_hedges"],
+        "hedge_wins": stats["embedding_hedge_wins"],
+    }
+
+
+async def circuit_scenario(turns: int) -> dict:
+    fakes = stubs.install(services, latency=0.01)
+    fakes.gemini["rewrite"].failure_rate = 1.0
+    services.rewrite_stage = resilience.Stage("rewrite", resilience.STAGE_DEADLINE_REWRITE_MS)
+    skipped = 0
+    for i in range(turns):
+        _, metrics = await services.get_ai_response(f"¿Capacidad de la batería {i}?", SUMMARY, use_cache=False)
+        skipped += bool(metrics.get("rewrite_circuit_open"))
+    return {
+        "turns": turns,
+        "rewrite_calls": fakes.gemini["rewrite"].calls,
+        "turns_skipping_rewrite": skipped,
+        "circuit_state": services.rewrite_stage.breaker.state,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rewrite-deadline-ms", type=float, default=300)
+    parser.add_argument("--hedging-calls", type=int, default=300)
+    parser.add_argument("--circuit-turns", type=int, default=30)
+    args = parser.parse_args()
+
+    # One provider call per request, so each scenario sees every injected delay
+    services.EMBEDDING_BATCH_ENABLED = False
+    services.COALESCING_ENABLED = False
+
+    results = {
+        "deadline": asyncio.run(deadline_scenario(args.rewrite_deadline_ms)),
+        "hedging_off": asyncio.run(hedging_scenario(args.hedging_calls, hedging=False)),
+        "hedging_on": asyncio.run(hedging_scenario(args.hedging_calls, hedging=True)),
+        "circuit": asyncio.run(circuit_scenario(args.circuit_turns)),
+    }
+    print(json.dumps(results, indent=2))
+
+    failures = []
+    if not results["deadline"]["rewrite_deadline_exceeded"] or results["deadline"]["turn_ms"] > args.rewrite_deadline_ms + 1000:
+        failures.append("rewrite deadline did not bound the turn")
+    if results["hedging_on"]["p99_ms"] >= results["hedging_off"]["p99_ms"]:
+        failures.append("hedging did not reduce embedding p99")
+    if results["circuit"]["rewrite_calls"] >= args.circuit_turns or not results["circuit"]["turns_skipping_rewrite"]:
+        failures.append("circuit breaker did not skip the failing rewrite")
+    if failures:
+        print(f"FAIL: {'; '.join(failures)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Compares the local vector index against the match_documents RPC path.
+
+The RPC stand-in scores a synthetic corpus exactly (like pgvector) after a
+simulated network round trip, so it provides both the ground truth for
+recall@k and the baseline latency. The local index is measured in flat and
+IVF modes on the same corpus and queries.
+
+Usage (from ai_agent/):
+    python -m benchmarks.retrieval --documents 5000 --queries 200 --rpc-latency 0.08
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from benchmarks import stubs
+from vector_index import LocalVectorIndex
+
+
+def percentile_ms(samples, q):
+    return round(float(np.percentile(samples, q)) * 1000, 3)
+
+
+def run(documents: int, queries: int, match_count: int, rpc_latency: float, nlist: int, nprobe: int) -> dict:
+    corpus = stubs.synthetic_corpus(documents)
+    rng = np.random.default_rng(1)
+    query_vectors = [
+        (np.asarray(corpus[i]["embedding"]) + 0.5 * rng.standard_normal(stubs.EMBEDDING_DIM)).tolist()
+        for i in rng.integers(0, documents, queries)
+    ]
+
+    rpc = stubs.StubSupabase(latency=rpc_latency, documents=corpus)
+    truth, rpc_times = [], []
+    for query in query_vectors:
+        start = time.perf_counter()
+        docs = rpc.rpc("match_documents", {"query_embedding": query, "match_count": match_count}).execute().data
+        rpc_times.append(time.perf_counter() - start)
+        truth.append({doc["id"] for doc in docs})
+
+    results = {"documents": documents, "queries": queries, "match_count": match_count, "rpc": {
+        "p50_ms": percentile_ms(rpc_times, 50), "p95_ms": percentile_ms(rpc_times, 95), "recall_at_k": 1.0,
+    }}
+
+    for mode in ("flat", "ivf"):
+        index = LocalVectorIndex(mode=mode, nlist=nlist, nprobe=nprobe)
+        start = time.perf_counter()
+        index.apply_rows(corpus)
+        index.rebuild()
+        build_s = time.perf_counter() - start
+
+        times, hits = [], 0
+        for query, expected in zip(query_vectors, truth):
+            start = time.perf_counter()
+            docs = index.search(query, match_count)
+            times.append(time.perf_counter() - start)
+            hits += len(expected & {doc["id"] for doc in docs})
+
+        results[mode] = {
+            "build_s": round(build_s, 3),
+            "p50_ms": percentile_ms(times, 50),
+            "p95_ms": percentile_ms(times, 95),
+            "recall_at_k": round(hits / (match_count * queries), 4),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--documents", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--match-count", type=int, default=5)
+    parser.add_argument("--rpc-latency", type=float, default=0.08, help="Simulated Supabase round trip (s)")
+    parser.add_argument("--nlist", type=int, default=64)
+    parser.add_argument("--nprobe", type=int, default=8)
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.documents, args.queries, args.match_count, args.rpc_latency, args.nlist, args.nprobe), indent=2))
+
+
+if __name__ == "__main__":
+    main()
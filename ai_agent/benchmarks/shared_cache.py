@@ -0,0 +1,86 @@
+"""
+Embedding cache hit rate and lookup latency with 1, 4 and 8 worker processes.
+
+The same request stream (Zipf-distributed questions) is split across N processes, as
+uvicorn --workers N would. With CACHE_BACKEND=local every worker has its own memory LRU
+and its own disk tier, so each question must miss once per worker; with the shared
+backend the disk tier is one SQLite file all workers read directly.
+
+Usage (from ai_agent/):
+    python -m benchmarks.shared_cache --requests 8000 --pool 3000 --workers 1 4 8
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+import numpy as np
+
+EMBEDDING_DIM = 1536
+
+
+def worker(backend: str, directory: str, worker_id: int, requests: int, args) -> dict:
+    from embedding_cache import DiskEmbeddingStore, EmbeddingCache, SharedEmbeddingStore
+    from shared_cache import SharedCache
+
+    if backend == "shared":
+        store = SharedEmbeddingStore(SharedCache(os.path.join(directory, "shared.sqlite3"), 1 << 30), args.disk_entries)
+    else:
+        store = DiskEmbeddingStore(os.path.join(directory, f"worker-{worker_id}"), args.disk_entries)
+    cache = EmbeddingCache(args.memory_entries, store)
+
+    rng = np.random.default_rng(args.seed + worker_id)
+    questions = np.minimum(rng.zipf(args.zipf, requests), args.pool) - 1
+    latencies = []
+    for question in questions:
+        text = f"pregunta técnica número {question}"
+        start = time.perf_counter()
+        embedding, tier = cache.get("model", text)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if embedding is None:
+            cache.put("model", text, rng.standard_normal(EMBEDDING_DIM).astype(np.float32).tolist())
+            # Write through right away (the agent flushes every EMBEDDING_CACHE_FLUSH_SECONDS)
+            cache.flush()
+    return {"memory_hits": cache.memory_hits, "disk_hits": cache.disk_hits, "misses": cache.misses, "latencies": latencies}
+
+
+def run(backend: str, workers: int, args) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        share = args.requests // workers
+        start = time.monotonic()
+        with multiprocessing.get_context("spawn").Pool(workers) as pool:
+            results = pool.starmap(worker, [(backend, directory, i, share, args) for i in range(workers)])
+        wall = time.monotonic() - start
+    latencies = np.concatenate([result["latencies"] for result in results])
+    hits = sum(result["memory_hits"] + result["disk_hits"] for result in results)
+    lookups = hits + sum(result["misses"] for result in results)
+    return {
+        "backend": backend,
+        "workers": workers,
+        "hit_rate": round(hits / lookups, 4),
+        "disk_hits": sum(result["disk_hits"] for result in results),
+        "misses": sum(result["misses"] for result in results),
+        "lookup_ms": {f"p{p}": round(float(np.percentile(latencies, p)), 4) for p in (50, 95, 99)},
+        "wall_s": round(wall, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=8000)
+    parser.add_argument("--pool", type=int, default=3000, help="Distinct questions")
+    parser.add_argument("--zipf", type=float, default=1.3, help="Zipf exponent of question popularity")
+    parser.add_argument("--memory-entries", type=int, default=256)
+    parser.add_argument("--disk-entries", type=int, default=50000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rows = [run(backend, workers, args) for workers in args.workers for backend in ("local", "shared")]
+    print(json.dumps(rows, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+Local stand-ins for the Gemini, OpenAI embeddings and Supabase clients.
+They sleep for a fixed or sampled latency, optionally fail, and return canned
+payloads, so benchmarks can measure the pipeline without spending provider quota.
+"""
+import asyncio
+import hashlib
+import json
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from embedding_cache import EmbeddingCache
+
+EMBEDDING_DIM = 1536
+
+
+class StubFailure(Exception):
+    """Injected provider error."""
+
+
+def seconds(latency) -> float:
+    """`latency` is either fixed seconds or a callable drawing one sample (see `spiky`)."""
+    return latency() if callable(latency) else latency
+
+
+def spiky(base: float, spike: float, spike_rate: float, seed: int = 0):
+    """Latency sampler: `base` seconds, or `spike` seconds for a `spike_rate` fraction of calls."""
+    rng = np.random.default_rng(seed)
+    return lambda: spike if rng.random() < spike_rate else base
+
+
+def lognormal(median: float, sigma: float, seed: int = 0):
+    """Latency sampler with a long right tail, the usual shape of provider response times."""
+    rng = np.random.default_rng(seed)
+    return lambda: float(median * np.exp(sigma * rng.standard_normal()))
+
+
+def parse_latency(spec: str, seed: int = 0):
+    """CLI form: "0.2" (fixed seconds) or "0.2:0.5" (lognormal median:sigma)."""
+    if ":" in spec:
+        median, sigma = spec.split(":", 1)
+        return lognormal(float(median), float(sigma), seed)
+    return float(spec)
+
+
+def maybe_fail(failure_rate: float, rng) -> None:
+    if failure_rate and rng.random() < failure_rate:
+        raise StubFailure("injected provider failure")
+
+
+class StubQuota:
+    """Provider-side rate limit: a token bucket of `burst_seconds` of quota; calls over it fail with a 429."""
+
+    def __init__(self, rpm: float, burst_seconds: float = 10):
+        self.rate = rpm / 60
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self.rejected = 0
+
+    def check(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.level < 1:
+            self.rejected += 1
+            raise StubFailure("429 Resource has been exhausted (e.g. check quota)")
+        self.level -= 1
+
+
+class StubGeminiModel:
+    """`capacity` (a semaphore shared by the models) limits concurrent calls; the rest queue at the provider."""
+
+    def __init__(self, latency=0.2, answer: str = "Respuesta de prueba.", failure_rate: float = 0.0, seed: int = 0,
+                 capacity: asyncio.Semaphore = None, quota: StubQuota = None):
+        self.latency = latency
+        self.capacity = capacity
+        self.quota = quota
+        self.answer = answer
+        self.failure_rate = failure_rate
+        self.rng = np.random.default_rng(seed)
+        self.calls = 0
+
+    async def generate_content_async(self, prompt, generation_config=None, stream=False, **kwargs):
+        self.calls += 1
+        if self.quota is not None:
+            self.quota.check()
+        if self.capacity is not None:
+            async with self.capacity:
+                await asyncio.sleep(seconds(self.latency))
+        else:
+            await asyncio.sleep(seconds(self.latency))
+        maybe_fail(self.failure_rate, self.rng)
+        if stream:
+            return self._stream()
+        return SimpleNamespace(text=json.dumps({"answer": self.answer}, ensure_ascii=False))
+
+    async def _stream(self):
+        for word in self.answer.split(" "):
+            await asyncio.sleep(0)
+            yield SimpleNamespace(text=word + " ")
+
+
+def fake_embedding(text: str) -> list:
+    """Deterministic unit vector per text, so identical texts embed identically."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(EMBEDDING_DIM).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+class StubEmbeddings:
+    def __init__(self, latency=0.2, failure_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rng = np.random.default_rng(seed)
+        self.calls = 0
+
+    async def create(self, model: str, input):
+        self.calls += 1
+        await asyncio.sleep(seconds(self.latency))
+        maybe_fail(self.failure_rate, self.rng)
+        inputs = input if isinstance(input, list) else [input]
+        data = [SimpleNamespace(embedding=fake_embedding(text), index=i) for i, text in enumerate(inputs)]
+        return SimpleNamespace(data=data)
+
+
+class StubModels:
+    def __init__(self, latency=0.2):
+        self.latency = latency
+
+    async def list(self):
+        await asyncio.sleep(seconds(self.latency))
+        return SimpleNamespace(data=[])
+
+
+class StubOpenAI:
+    def __init__(self, latency=0.2, failure_rate: float = 0.0):
+        self.embeddings = StubEmbeddings(latency, failure_rate)
+        self.models = StubModels(latency)
+
+
+class StubRPC:
+    def __init__(self, owner, name: str, params: dict):
+        self.owner = owner
+        self.name = name
+        self.params = params
+
+    def execute(self):
+        # Deliberately blocking, like the real synchronous Supabase client
+        self.owner.calls += 1
+        time.sleep(seconds(self.owner.latency))
+        maybe_fail(self.owner.failure_rate, self.owner.rng)
+        if self.owner.matrix is not None:
+            return SimpleNamespace(data=self.owner.match_documents(self.params))
+        docs = [
+            {"id": i, "content": f"Documento técnico {i}", "metadata": {}, "similarity": 0.9 - i * 0.1}
+            for i in range(self.params.get("match_count", 5))
+        ]
+        return SimpleNamespace(data=docs)
+
+
+class StubQuery:
+    """Table reads (the client registry's connection pre-warm); always returns no rows."""
+
+    def __init__(self, owner):
+        self.owner = owner
+
+    def select(self, *args, **kwargs):
+        return self
+
+    def limit(self, *args):
+        return self
+
+    def execute(self):
+        time.sleep(seconds(self.owner.latency))
+        return SimpleNamespace(data=[])
+
+
+class StubSupabase:
+    """
+    Without `documents` the RPC returns placeholder rows. With a corpus (rows carrying
+    an `embedding`) it answers match_documents exactly, like pgvector's cosine scan.
+    """
+
+    def __init__(self, latency=0.2, documents: list = None, failure_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rng = np.random.default_rng(seed)
+        self.calls = 0
+        self.documents = documents or []
+        self.matrix = None
+        if self.documents:
+            matrix = np.asarray([doc["embedding"] for doc in self.documents], dtype=np.float32)
+            self.matrix = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+    def match_documents(self, params: dict) -> list:
+        query = np.asarray(params["query_embedding"], dtype=np.float32)
+        scores = self.matrix @ (query / np.linalg.norm(query))
+        top = np.argsort(-scores)[:params.get("match_count", 5)]
+        return [
+            {"id": self.documents[i]["id"], "content": self.documents[i]["content"],
+             "metadata": self.documents[i].get("metadata", {}), "similarity": float(scores[i])}
+            for i in top
+        ]
+
+    def rpc(self, name: str, params: dict):
+        return StubRPC(self, name, params)
+
+    def table(self, name: str):
+        return StubQuery(self)
+
+
+def synthetic_corpus(size: int, dim: int = EMBEDDING_DIM, clusters: int = 50, seed: int = 0) -> list:
+    """Clustered random rows shaped like the documents table (datasheets share topics)."""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size)
+    vectors = centres[labels] + 0.6 * rng.standard_normal((size, dim)).astype(np.float32)
+    return [
+        {"id": i, "content": f"Fragmento {i} (tema {labels[i]})", "metadata": {}, "embedding": vectors[i].tolist()}
+        for i in range(size)
+    ]
+
+
+def install(services, latency=0.2, gemini_latency=None, embedding_latency=None, rpc_latency=None,
+            failure_rate: float = 0.0, gemini_capacity: int = None, gemini_quota: StubQuota = None):
+    """
+    Replaces the provider clients in `services` with stubs and returns them.
+    Each registry model gets its own Gemini stub so calls can be counted per stage.
+    Per-provider latencies default to `latency`; `failure_rate` applies to every provider.
+    `gemini_capacity` caps concurrent Gemini calls across all models, like a saturated provider;
+    `gemini_quota` rejects calls over a shared rate limit.
+    The embedding cache is replaced by a fresh memory-only one: every run starts cold and
+    stub vectors never reach the on-disk cache the agent itself reads.
+    """
+    capacity = asyncio.Semaphore(gemini_capacity) if gemini_capacity else None
+    gemini = {
+        name: StubGeminiModel(gemini_latency if gemini_latency is not None else latency, failure_rate=failure_rate, seed=i,
+                              capacity=capacity, quota=gemini_quota)
+        for i, name in enumerate(services.model_registry.specs)
+    }
+    openai = StubOpenAI(embedding_latency if embedding_latency is not None else latency, failure_rate)
+    supabase = StubSupabase(rpc_latency if rpc_latency is not None else latency, failure_rate=failure_rate)
+    services.model_registry.models = dict(gemini)
+    services.client_registry.override(openai=openai, supabase=supabase)
+    if services.embedding_cache is not None:
+        services.embedding_cache = EmbeddingCache(services.embedding_cache.memory_entries, None)
+    return SimpleNamespace(gemini=gemini, openai=openai, supabase=supabase)
@@ -0,0 +1,65 @@
+"""
+Counts Gemini summary calls per session with and without the summarisation cadence.
+
+Simulates sessions of short follow-ups against stubbed providers and runs each
+session twice: once re-summarising every turn (the previous behaviour) and once
+with SUMMARY_EVERY_N_TURNS, reporting calls per session and the reduction.
+
+Usage (from ai_agent/):
+    python -m benchmarks.summary_cadence --sessions 20 --turns 10 --every 4
+"""
+import argparse
+import asyncio
+import json
+
+import conversation_memory
+import services
+from benchmarks import stubs
+
+FOLLOW_UPS = [
+    "capacidad de carga del E20", "y en mm?", "¿y la altura de elevación?", "radio de giro 4.35",
+    "compáralo con el E25", "¿qué batería lleva?", "velocidad de traslación", "¿tiene K-MATIC?",
+]
+
+
+async def run_sessions(sessions: int, turns: int, every: int) -> dict:
+    conversation_memory.SUMMARY_EVERY_N_TURNS = every
+    fakes = stubs.install(services, latency=0)
+    summary_stub = fakes.gemini["summary"]
+
+    strategies = {}
+    for session in range(sessions):
+        summary, history = "", []
+        for turn in range(1, turns + 1):
+            message = f"{FOLLOW_UPS[(session + turn) % len(FOLLOW_UPS)]} ({session})"
+            answer, summary, metrics = await services.get_ai_response_with_summary(
+                message, summary, use_cache=False, recent_turns=history, turn=turn
+            )
+            history = (history + [{"is_user": True, "message": message}, {"is_user": False, "message": answer}])[-6:]
+            strategy = metrics.get("summary_strategy")
+            strategies[strategy] = strategies.get(strategy, 0) + 1
+
+    return {"summary_calls_per_session": summary_stub.calls / sessions, "strategies": strategies}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--every", type=int, default=4, help="SUMMARY_EVERY_N_TURNS for the cadence run")
+    args = parser.parse_args()
+
+    baseline = asyncio.run(run_sessions(args.sessions, args.turns, every=1))
+    cadence = asyncio.run(run_sessions(args.sessions, args.turns, every=args.every))
+    reduction = 1 - cadence["summary_calls_per_session"] / baseline["summary_calls_per_session"]
+    print(json.dumps({
+        "sessions": args.sessions,
+        "turns_per_session": args.turns,
+        "every_turn": baseline,
+        f"every_{args.every}_turns": cadence,
+        "summary_call_reduction": round(reduction, 3),
+    }, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
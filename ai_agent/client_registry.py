@@ -0,0 +1,166 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Dict, Optional
+
+import httpx
+
+from instrumentation import STARTUP_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Shared keep-alive pools: one per provider, reused by every request and worker thread
+PROVIDER_POOL_MAX_CONNECTIONS = int(os.getenv("PROVIDER_POOL_MAX_CONNECTIONS", "100"))
+PROVIDER_POOL_MAX_KEEPALIVE = int(os.getenv("PROVIDER_POOL_MAX_KEEPALIVE", "32"))
+PROVIDER_POOL_KEEPALIVE_SECONDS = float(os.getenv("PROVIDER_POOL_KEEPALIVE_SECONDS", "120"))
+PROVIDER_CONNECT_TIMEOUT_SECONDS = float(os.getenv("PROVIDER_CONNECT_TIMEOUT_SECONDS", "5"))
+# Connections opened per provider at startup so the first requests skip the TCP/TLS handshake
+CLIENT_PREWARM_ENABLED = os.getenv("CLIENT_PREWARM_ENABLED", "True") == "True"
+CLIENT_PREWARM_CONNECTIONS = int(os.getenv("CLIENT_PREWARM_CONNECTIONS", "4"))
+# A failed warm-up keeps the agent not ready and is retried, backing off up to the maximum
+WARM_UP_RETRY_SECONDS = float(os.getenv("WARM_UP_RETRY_SECONDS", "2"))
+WARM_UP_RETRY_MAX_SECONDS = float(os.getenv("WARM_UP_RETRY_MAX_SECONDS", "30"))
+
+
+class ClientRegistry:
+    """
+    Owns the provider clients. Each SDK is imported and its client built on first use
+    (the imports alone take a couple of seconds), on a shared keep-alive pool sized by
+    PROVIDER_POOL_*. `start()` builds everything off the event loop and opens connections
+    to each provider; the app reports ready once it has finished.
+    """
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self._openai = None
+        self._supabase = None
+        self._genai = None
+        self._http: Optional[httpx.AsyncClient] = None
+        self._supabase_built = False
+        self.ready = False
+        self.ready_ms: Optional[float] = None
+        self.first_answer_ms: Optional[float] = None
+        self.prewarm_ms: Dict[str, float] = {}
+
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=PROVIDER_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=PROVIDER_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=PROVIDER_POOL_KEEPALIVE_SECONDS
+        )
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        """Plain HTTP calls (summary callbacks to the backend)."""
+        if self._http is None:
+            self._http = httpx.AsyncClient(limits=self.limits(), timeout=httpx.Timeout(10, connect=PROVIDER_CONNECT_TIMEOUT_SECONDS))
+        return self._http
+
+    @property
+    def openai(self):
+        if self._openai is None:
+            from openai import AsyncOpenAI
+            self._openai = AsyncOpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                http_client=httpx.AsyncClient(limits=self.limits(), timeout=httpx.Timeout(60, connect=PROVIDER_CONNECT_TIMEOUT_SECONDS))
+            )
+        return self._openai
+
+    @property
+    def supabase(self):
+        """Synchronous client (its calls run on the provider executor); None when not configured."""
+        if not self._supabase_built:
+            url, key = os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY")
+            if url and key:
+                from supabase import create_client
+                from supabase.lib.client_options import SyncClientOptions
+                # httpx.Client is thread-safe, so the executor threads share one pool
+                http_client = httpx.Client(limits=self.limits(), timeout=httpx.Timeout(120, connect=PROVIDER_CONNECT_TIMEOUT_SECONDS))
+                self._supabase = create_client(url, key, SyncClientOptions(httpx_client=http_client))
+            self._supabase_built = True
+        return self._supabase
+
+    @property
+    def genai(self):
+        """The configured Gemini SDK module (it keeps one gRPC channel per process)."""
+        if self._genai is None:
+            import google.generativeai as genai
+            google_api_key = os.getenv("GOOGLE_API_KEY")
+            if google_api_key:
+                genai.configure(api_key=google_api_key)
+            else:
+                logger.warning("GOOGLE_API_KEY not found in environment variables.")
+            self._genai = genai
+        return self._genai
+
+    def override(self, openai=None, supabase=None, genai=None):
+        """Replaces clients (benchmarks install their stubs through this)."""
+        if openai is not None:
+            self._openai = openai
+        if supabase is not None:
+            self._supabase, self._supabase_built = supabase, True
+        if genai is not None:
+            self._genai = genai
+
+    def _build(self):
+        """Blocking: imports the SDKs and builds every client."""
+        return self.openai, self.supabase, self.genai, self.http
+
+    async def _prewarm(self, name: str, request):
+        async def attempt():
+            return await request()
+
+        start = time.monotonic()
+        results = await asyncio.gather(*[attempt() for _ in range(CLIENT_PREWARM_CONNECTIONS)], return_exceptions=True)
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            logger.warning(f"Pre-warming {name} connections failed: {errors[0]}")
+        self.prewarm_ms[name] = round((time.monotonic() - start) * 1000, 2)
+
+    async def start(self):
+        """Startup hook: builds the clients in a worker thread, then opens connections to each provider."""
+        await asyncio.to_thread(self._build)
+        if not CLIENT_PREWARM_ENABLED:
+            return
+        # Cheap authenticated requests; concurrent ones each leave an idle TLS connection in the pool
+        warmups = []
+        if os.getenv("OPENAI_API_KEY"):
+            warmups.append(self._prewarm("openai", lambda: self.openai.models.list()))
+        if self.supabase is not None:
+            from vector_index import DOCUMENTS_TABLE
+            query = lambda: self.supabase.table(DOCUMENTS_TABLE).select("id").limit(1).execute()
+            warmups.append(self._prewarm("supabase", lambda: asyncio.to_thread(query)))
+        await asyncio.gather(*warmups)
+        logger.info(f"Provider connections pre-warmed: {self.prewarm_ms}")
+
+    def mark_ready(self):
+        self.ready = True
+        self.ready_ms = round((time.monotonic() - self.started_at) * 1000, 2)
+        STARTUP_SECONDS.labels("ready").set(self.ready_ms / 1000)
+        logger.info(f"Agent ready {self.ready_ms} ms after start")
+
+    def record_answer(self) -> Optional[float]:
+        """Returns the cold-start-to-first-answer time on the first answer, None afterwards."""
+        if self.first_answer_ms is not None:
+            return None
+        self.first_answer_ms = round((time.monotonic() - self.started_at) * 1000, 2)
+        STARTUP_SECONDS.labels("first_answer").set(self.first_answer_ms / 1000)
+        return self.first_answer_ms
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "ready_ms": self.ready_ms,
+            "first_answer_ms": self.first_answer_ms,
+            "prewarm_ms": self.prewarm_ms,
+        }
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.aclose()
+        if self._openai is not None and hasattr(self._openai, "close"):
+            await self._openai.close()
+
+
+client_registry = ClientRegistry()
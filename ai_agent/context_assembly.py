@@ -0,0 +1,110 @@
+import os
+import re
+import hashlib
+import logging
+from typing import List, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Context assembly configuration
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+# Word-shingle Jaccard above which two chunks count as duplicates
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))
+# MMR trade-off: 1.0 is pure relevance, lower values favour diversity
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "cl100k_base")
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+except Exception as e:  # Optional dependency or missing encoding files
+    logger.warning(f"tiktoken unavailable ({e}); token counts are estimated from characters.")
+    _encoding = None
+
+WORD_PATTERN = re.compile(r"\w+(?:[.,]\w+)*")
+
+
+def count_tokens(text: str) -> int:
+    """Counts BPE tokens with tiktoken, or estimates ~4 characters per token without it."""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return max(1, len(text) // 4)
+
+
+def shingles(text: str, size: int = 3) -> Set[Tuple[str, ...]]:
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) < size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def jaccard(a: Set, b: Set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def relevance_scores(docs: List[dict]) -> List[float]:
+    """
+    Relevance in [0, 1] per document. Uses vector similarity when every row has one,
+    otherwise falls back to the rank the retriever returned (rows arrive best first).
+    """
+    if docs and all(isinstance(doc.get("similarity"), (int, float)) for doc in docs):
+        return [max(0.0, float(doc["similarity"])) for doc in docs]
+    return [1 / (rank + 1) for rank in range(len(docs))]
+
+
+def assemble_context(docs: List[dict], token_budget: int = CONTEXT_TOKEN_BUDGET,
+                     dedup_threshold: float = CONTEXT_DEDUP_THRESHOLD,
+                     mmr_lambda: float = CONTEXT_MMR_LAMBDA) -> Tuple[List[dict], dict]:
+    """
+    Picks the chunks sent to Gemini:
+    1. Drops exact and near-duplicate chunks (keeping the more relevant one).
+    2. Selects by maximal marginal relevance, skipping chunks that would exceed the token budget.
+    3. Returns the selection in relevance order, with before/after statistics.
+    """
+    relevance = relevance_scores(docs)
+    candidates = []
+    seen_hashes = set()
+    duplicates = 0
+    for position, doc in enumerate(docs):
+        content = (doc.get("content") or "").strip()
+        digest = hashlib.sha1(content.encode("utf-8")).hexdigest()
+        if not content or digest in seen_hashes:
+            duplicates += 1
+            continue
+        doc_shingles = shingles(content)
+        if any(jaccard(doc_shingles, kept["shingles"]) >= dedup_threshold for kept in candidates):
+            duplicates += 1
+            continue
+        seen_hashes.add(digest)
+        candidates.append({
+            "position": position, "doc": doc, "shingles": doc_shingles,
+            "relevance": relevance[position], "tokens": count_tokens(content),
+        })
+
+    selected, used_tokens = [], 0
+    remaining = list(candidates)
+    while remaining:
+        def marginal(candidate):
+            redundancy = max((jaccard(candidate["shingles"], chosen["shingles"]) for chosen in selected), default=0.0)
+            return mmr_lambda * candidate["relevance"] - (1 - mmr_lambda) * redundancy
+
+        best = max(remaining, key=marginal)
+        remaining.remove(best)
+        if used_tokens + best["tokens"] > token_budget:
+            continue
+        selected.append(best)
+        used_tokens += best["tokens"]
+
+    selected.sort(key=lambda candidate: candidate["position"])
+    stats = {
+        "context_chunks_before": len(docs),
+        "context_chunks_after": len(selected),
+        "context_duplicates_removed": duplicates,
+        "context_tokens_before": sum(count_tokens(doc.get("content") or "") for doc in docs),
+        "context_tokens_after": used_tokens,
+    }
+    return [candidate["doc"] for candidate in selected], stats
@@ -0,0 +1,74 @@
+import os
+import re
+import logging
+from typing import List, Optional, Tuple
+
+from context_assembly import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Conversation memory configuration
+# Re-summarise with Gemini every N turns; in between the summary is updated locally
+SUMMARY_EVERY_N_TURNS = int(os.getenv("SUMMARY_EVERY_N_TURNS", "4"))
+# Number of recent user/AI exchanges kept verbatim next to the summary
+CONVERSATION_WINDOW_TURNS = int(os.getenv("CONVERSATION_WINDOW_TURNS", "3"))
+# Re-summarise early when the verbatim window kept for the next turn grows past this many
+# tokens. Each message is cut to WINDOW_MESSAGE_CHARS, so a full window of long messages is
+# about 600 tokens: long answers alone no longer trigger it, only a window that is long throughout
+SUMMARY_WINDOW_TOKEN_BUDGET = int(os.getenv("SUMMARY_WINDOW_TOKEN_BUDGET", "600"))
+WINDOW_MESSAGE_CHARS = 400
+EXTRACTIVE_QUESTION_CHARS = 120
+
+# Marks the locally appended part of a summary so the next update replaces it
+EXTRACTIVE_MARKER = " | Última consulta:"
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+")
+
+
+def recent_window(recent_turns: Optional[List[dict]]) -> List[dict]:
+    """Last CONVERSATION_WINDOW_TURNS exchanges (user and AI messages), oldest first."""
+    return (recent_turns or [])[-2 * CONVERSATION_WINDOW_TURNS:]
+
+
+def format_window(recent_turns: Optional[List[dict]]) -> str:
+    lines = []
+    for turn in recent_window(recent_turns):
+        speaker = "Usuario" if turn.get("is_user") else "AI"
+        text = " ".join((turn.get("message") or "").split())
+        if len(text) > WINDOW_MESSAGE_CHARS:
+            text = text[:WINDOW_MESSAGE_CHARS] + "…"
+        lines.append(f"{speaker}: {text}")
+    return "\n".join(lines)
+
+
+def build_history(summary: Optional[str], recent_turns: Optional[List[dict]]) -> str:
+    """Rolling summary plus the verbatim recent window, as used in the query rewrite prompt."""
+    window = format_window(recent_turns)
+    summary = summary or ""
+    if not window:
+        return summary
+    return f"{summary}\nÚltimos mensajes:\n{window}" if summary else f"Últimos mensajes:\n{window}"
+
+
+def needs_llm_summary(turn: Optional[int], recent_turns: Optional[List[dict]], message: str, answer: str) -> Tuple[bool, str]:
+    """Decides whether this turn pays for a Gemini re-summarisation. Returns (decision, reason)."""
+    if turn is None or SUMMARY_EVERY_N_TURNS <= 1:
+        return True, "every_turn"
+    if turn == 1 or turn % SUMMARY_EVERY_N_TURNS == 0:
+        return True, "cadence"
+    # The window the next turn sends: this exchange included, long answers already truncated
+    kept = list(recent_turns or []) + [{"is_user": True, "message": message}, {"is_user": False, "message": answer}]
+    if count_tokens(format_window(kept)) > SUMMARY_WINDOW_TOKEN_BUDGET:
+        return True, "window_budget"
+    return False, "extractive"
+
+
+def extractive_summary(current_summary: Optional[str], message: str) -> str:
+    """
+    Cheap local update between LLM summaries: keeps the last LLM summary and records
+    the first sentence of the latest question, replacing the previous local tail.
+    """
+    base = (current_summary or "").split(EXTRACTIVE_MARKER)[0].strip()
+    question = SENTENCE_PATTERN.split(" ".join(message.split()))[0]
+    if len(question) > EXTRACTIVE_QUESTION_CHARS:
+        question = question[:EXTRACTIVE_QUESTION_CHARS] + "…"
+    return f"{base}{EXTRACTIVE_MARKER} {question}" if base else question
@@ -0,0 +1,175 @@
+import os
+import time
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_BATCH_ENABLED = os.getenv("EMBEDDING_BATCH_ENABLED", "True") == "True"
+# How long the first request of a batch waits for others to join it
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "10"))
+EMBEDDING_BATCH_MAX_SIZE = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "64"))
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048)
+QUEUE_WAIT_MS_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250, 500, 1000)
+
+
+class Histogram:
+    """Cumulative bucket counts (Prometheus style: each bucket counts observations <= its bound)."""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def snapshot(self) -> dict:
+        buckets = {str(bound): count for bound, count in zip(self.buckets, self.counts)}
+        buckets["+Inf"] = self.count
+        return {"buckets": buckets, "count": self.count, "sum": round(self.sum, 2)}
+
+
+@dataclass
+class PendingEmbedding:
+    text: str
+    future: asyncio.Future
+    # Resolved with the throttle delay once the batch has its rate budget, before it is sent
+    granted: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class EmbeddingBatcher:
+    """
+    Collects embedding requests that arrive within a short window (or until
+    `max_size` are queued) and sends them as one `embeddings.create` call with a
+    list input, fanning the vectors back to the awaiting callers.
+    `client_factory` is called per batch so a swapped client (tests, registry) is picked up.
+    `throttle`, if given, is awaited with the batch's texts before sending and returns the
+    seconds it waited for rate budget; `reserve` returns once it is granted, so callers can
+    start their deadline on the provider call alone. `on_outcome`, if given, is called once per provider
+    batch with whether it succeeded (the embedding circuit breaker), so one failed batch
+    counts once rather than once per caller; `timeout` bounds the provider call so a hung
+    batch is reported as a failure too.
+    """
+
+    def __init__(self, client_factory: Callable, model: str,
+                 window_ms: float = EMBEDDING_BATCH_WINDOW_MS, max_size: int = EMBEDDING_BATCH_MAX_SIZE,
+                 throttle: Optional[Callable[[List[str]], Awaitable[float]]] = None,
+                 on_outcome: Optional[Callable[[bool], None]] = None, timeout: Optional[float] = None):
+        self.client_factory = client_factory
+        self.throttle = throttle
+        self.on_outcome = on_outcome
+        self.timeout = timeout
+        self.model = model
+        self.window = window_ms / 1000
+        self.max_size = max(1, max_size)
+        self.pending: List[PendingEmbedding] = []
+        self.timer: asyncio.TimerHandle = None
+        # Batches in flight; the event loop only keeps weak references to tasks
+        self.in_flight = set()
+        self.requests = 0
+        self.batches = 0
+        self.batch_size = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_wait_ms = Histogram(QUEUE_WAIT_MS_BUCKETS)
+
+    async def embed(self, text: str) -> Tuple[List[float], Dict[str, float]]:
+        """Returns (embedding, info) where info carries this request's batch size and queue wait."""
+        item = await self.reserve(text)
+        return await item.future
+
+    async def reserve(self, text: str) -> PendingEmbedding:
+        """
+        Queues `text` and returns once its batch has been granted rate budget; the batch's
+        provider call is then under way and `item.future` resolves like `embed`.
+        """
+        loop = asyncio.get_running_loop()
+        item = PendingEmbedding(text, loop.create_future(), loop.create_future())
+        self.pending.append(item)
+        self.requests += 1
+
+        if len(self.pending) >= self.max_size:
+            self.flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.window, self.flush)
+        await item.granted
+        return item
+
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending = self.pending, []
+        if batch:
+            task = asyncio.ensure_future(self._send(batch))
+            self.in_flight.add(task)
+            task.add_done_callback(self.in_flight.discard)
+
+    async def _send(self, batch: List[PendingEmbedding]):
+        sent_at = time.monotonic()
+        self.batches += 1
+        self.batch_size.observe(len(batch))
+        for item in batch:
+            self.queue_wait_ms.observe((sent_at - item.enqueued_at) * 1000)
+
+        try:
+            throttle_delay = await self.throttle([item.text for item in batch]) if self.throttle else 0.0
+        except Exception as e:
+            self._fail(batch, e)
+            return
+        for item in batch:
+            if item.granted.done():
+                # The caller gave up while the batch waited for budget
+                item.future.cancel()
+            else:
+                item.granted.set_result(throttle_delay)
+        try:
+            response = await asyncio.wait_for(
+                self.client_factory().embeddings.create(model=self.model, input=[item.text for item in batch]),
+                self.timeout
+            )
+            # The API returns one row per input, tagged with its position in the list
+            vectors = {row.index: row.embedding for row in response.data}
+        except Exception as e:
+            if self.on_outcome:
+                self.on_outcome(False)
+            self._fail(batch, e)
+            return
+        if self.on_outcome:
+            self.on_outcome(True)
+
+        for i, item in enumerate(batch):
+            if item.future.done():
+                continue
+            info = {
+                "batch_size": len(batch),
+                "queue_wait_ms": round((sent_at - item.enqueued_at) * 1000, 2),
+                "throttle_ms": round(throttle_delay * 1000, 2),
+            }
+            item.future.set_result((vectors[i], info))
+
+    @staticmethod
+    def _fail(batch: List[PendingEmbedding], error: Exception):
+        logger.error(f"Embedding batch of {len(batch)} failed: {error!r}")
+        for item in batch:
+            if not item.granted.done():
+                item.granted.set_exception(error)
+                item.future.cancel()
+            elif not item.future.done():
+                item.future.set_exception(error)
+
+    def stats(self) -> dict:
+        return {
+            "embedding_batch_requests": self.requests,
+            "embedding_batches": self.batches,
+            "embedding_batch_size_histogram": self.batch_size.snapshot(),
+            "embedding_queue_wait_ms_histogram": self.queue_wait_ms.snapshot(),
+        }
@@ -0,0 +1,313 @@
+import os
+import json
+import asyncio
+import sqlite3
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks
+    fcntl = None
+
+from shared_cache import SharedCache, shared_cache
+
+logger = logging.getLogger(__name__)
+
+# Embedding cache configuration
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "True") == "True"
+EMBEDDING_CACHE_MEMORY_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MEMORY_ENTRIES", "2048"))
+EMBEDDING_CACHE_DISK_ENTRIES = int(os.getenv("EMBEDDING_CACHE_DISK_ENTRIES", "50000"))
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", ".cache/embeddings")
+# New embeddings are written to the disk tier in batches, off the event loop, this often
+EMBEDDING_CACHE_FLUSH_SECONDS = float(os.getenv("EMBEDDING_CACHE_FLUSH_SECONDS", "2"))
+
+
+def normalise_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text).lower().split())
+
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\x00{normalise_text(text)}".encode("utf-8")).hexdigest()
+
+
+class DiskEmbeddingStore:
+    """
+    Persistent tier: a memory-mapped float32 matrix with one embedding per slot,
+    plus an append-only key log ("slot key" lines) that is replayed on startup.
+    Slots are reused in ring order once `capacity` is reached, evicting the oldest entry.
+    `put_many` writes a batch with one msync, one log append and one meta rewrite; the log
+    lines are written after the vectors are synced, so a crash never indexes a half-written
+    slot. Reads and batch writes (both on worker threads) share a lock that is only held
+    for in-memory work. The slot map lives in this process, so the directory is locked for
+    it: a second worker opening the same directory fails instead of overwriting its slots.
+    """
+
+    def __init__(self, directory: str, capacity: int):
+        self.directory = directory
+        self.capacity = capacity
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.log_path = os.path.join(directory, "keys.log")
+        self.meta_path = os.path.join(directory, "meta.json")
+        self.dim: Optional[int] = None
+        self.vectors: Optional[np.memmap] = None
+        self.slots = {}        # key -> slot
+        self.slot_keys = {}    # slot -> key
+        self.next_slot = 0
+        self.log_lines = 0
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._lock_directory()
+        self._load()
+
+    def _lock_directory(self):
+        # Held until the process exits; the file object is kept so the lock is not released
+        self._lock_file = open(os.path.join(self.directory, "lock"), "w")
+        if fcntl is None:
+            return
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock_file.close()
+            raise BlockingIOError(
+                f"{self.directory} is in use by another process; run several workers with CACHE_BACKEND=shared"
+            ) from None
+
+    def _load(self):
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path) as f:
+            meta = json.load(f)
+        if meta.get("capacity") != self.capacity:
+            logger.warning("Embedding cache capacity changed; discarding the on-disk tier.")
+            self._reset()
+            return
+        self._open(meta["dim"])
+        if os.path.exists(self.log_path):
+            with open(self.log_path) as f:
+                for line in f:
+                    slot, _, key = line.strip().partition(" ")
+                    if key:
+                        self._assign(int(slot), key)
+                        self.log_lines += 1
+        self.next_slot = meta.get("next_slot", 0)
+        if self.log_lines > 2 * self.capacity:
+            self._compact()
+
+    def _reset(self):
+        for path in (self.vectors_path, self.log_path, self.meta_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _open(self, dim: int):
+        self.dim = dim
+        mode = "r+" if os.path.exists(self.vectors_path) else "w+"
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode=mode, shape=(self.capacity, dim))
+
+    def _write_meta(self):
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"dim": self.dim, "capacity": self.capacity, "next_slot": self.next_slot}, f)
+        os.replace(tmp_path, self.meta_path)
+
+    def _assign(self, slot: int, key: str):
+        previous = self.slot_keys.get(slot)
+        if previous is not None:
+            self.slots.pop(previous, None)
+        self.slots[key] = slot
+        self.slot_keys[slot] = key
+
+    def _compact(self):
+        with self.lock:
+            lines = [f"{slot} {key}\n" for slot, key in self.slot_keys.items()]
+        tmp_path = self.log_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.writelines(lines)
+        os.replace(tmp_path, self.log_path)
+        self.log_lines = len(lines)
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self.lock:
+            slot = self.slots.get(key)
+            if slot is None:
+                return None
+            return np.array(self.vectors[slot])
+
+    def put_many(self, items: List[Tuple[str, np.ndarray]]):
+        """Blocking: stores a batch of (key, embedding) and makes it durable."""
+        lines = []
+        with self.lock:
+            for key, embedding in items:
+                if key in self.slots:
+                    continue
+                if self.vectors is None:
+                    self._open(len(embedding))
+                if len(embedding) != self.dim:
+                    logger.warning(f"Embedding dimension {len(embedding)} does not match cache dimension {self.dim}; not cached.")
+                    continue
+                slot = self.next_slot
+                self.vectors[slot] = embedding
+                self._assign(slot, key)
+                self.next_slot = (slot + 1) % self.capacity
+                lines.append(f"{slot} {key}\n")
+        if not lines:
+            return
+        self.vectors.flush()
+        with open(self.log_path, "a") as f:
+            f.writelines(lines)
+        self.log_lines += len(lines)
+        self._write_meta()
+        if self.log_lines > 2 * self.capacity:
+            self._compact()
+
+    def __len__(self):
+        return len(self.slots)
+
+
+class SharedEmbeddingStore:
+    """Persistent tier shared by every worker on the node: float32 rows in the shared cache."""
+
+    NAMESPACE = "embedding"
+
+    def __init__(self, cache: SharedCache, capacity: int):
+        self.cache = cache
+        self.capacity = capacity
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        try:
+            value = self.cache.get(self.NAMESPACE, key)
+        except sqlite3.Error as e:
+            logger.error(f"Error reading the shared embedding cache: {e}")
+            return None
+        if value is None:
+            return None
+        return np.frombuffer(value, dtype=np.float32)
+
+    def put_many(self, items: List[Tuple[str, np.ndarray]]):
+        """Blocking: one upsert per embedding (each its own atomic statement)."""
+        for key, embedding in items:
+            self.cache.put(self.NAMESPACE, key, embedding.tobytes(), max_entries=self.capacity)
+        self.cache.recount(self.NAMESPACE)
+
+    def __len__(self):
+        return self.cache.count(self.NAMESPACE)
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache: in-process LRU in front of the disk store (per process or shared by the node's workers).
+    Embeddings are kept as float32 arrays (6 KB each at 1536 dimensions, against ~50 KB as a
+    list of Python floats) and handed out as lists. New entries go to the memory tier at once
+    and to the disk tier on the next `flush`, which the agent runs off the event loop; the
+    agent reads the disk tier with `aget`, on a worker thread.
+    """
+
+    def __init__(self, memory_entries: int, disk_store: Optional[DiskEmbeddingStore]):
+        self.memory_entries = memory_entries
+        self.memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.disk = disk_store
+        # Entries waiting for the next flush to the disk tier
+        self.unwritten: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.unwritten_lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _remember(self, key: str, embedding: np.ndarray):
+        self.memory[key] = embedding
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+            self.evictions += 1
+
+    def _from_memory(self, key: str) -> Optional[List[float]]:
+        embedding = self.memory.get(key)
+        if embedding is None:
+            embedding = self.unwritten.get(key)
+        if embedding is None:
+            return None
+        self._remember(key, embedding)
+        self.memory_hits += 1
+        return embedding.tolist()
+
+    def _from_disk(self, key: str, embedding: Optional[np.ndarray]) -> Tuple[Optional[List[float]], str]:
+        if embedding is None:
+            self.misses += 1
+            return None, "miss"
+        self._remember(key, embedding)
+        self.disk_hits += 1
+        return embedding.tolist(), "disk"
+
+    def get(self, model: str, text: str) -> Tuple[Optional[List[float]], str]:
+        """Blocking: returns the cached embedding (or None) and the tier that served it: memory, disk or miss."""
+        key = cache_key(model, text)
+        embedding = self._from_memory(key)
+        if embedding is not None:
+            return embedding, "memory"
+        return self._from_disk(key, self.disk.get(key) if self.disk is not None else None)
+
+    async def aget(self, model: str, text: str) -> Tuple[Optional[List[float]], str]:
+        """`get` for the event loop: a memory miss reads the disk tier on a worker thread."""
+        key = cache_key(model, text)
+        embedding = self._from_memory(key)
+        if embedding is not None:
+            return embedding, "memory"
+        return self._from_disk(key, await asyncio.to_thread(self.disk.get, key) if self.disk is not None else None)
+
+    def put(self, model: str, text: str, embedding: List[float]):
+        key = cache_key(model, text)
+        embedding = np.asarray(embedding, dtype=np.float32)
+        self._remember(key, embedding)
+        if self.disk is not None:
+            with self.unwritten_lock:
+                self.unwritten[key] = embedding
+                # Bounded if the disk tier stalls: the oldest pending writes are dropped
+                while len(self.unwritten) > self.memory_entries:
+                    self.unwritten.popitem(last=False)
+
+    def flush(self):
+        """Blocking: writes the entries added since the last flush to the disk tier."""
+        if self.disk is None or not self.unwritten:
+            return
+        with self.unwritten_lock:
+            batch, self.unwritten = self.unwritten, OrderedDict()
+        try:
+            self.disk.put_many(list(batch.items()))
+        except (OSError, sqlite3.Error) as e:
+            logger.error(f"Error writing embedding cache to disk: {e}")
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "embedding_cache_memory_hits": self.memory_hits,
+            "embedding_cache_disk_hits": self.disk_hits,
+            "embedding_cache_misses": self.misses,
+            "embedding_cache_hit_ratio": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            "embedding_cache_memory_entries": len(self.memory),
+            "embedding_cache_disk_entries": len(self.disk) if self.disk is not None else 0,
+            "embedding_cache_evictions": self.evictions,
+        }
+
+
+def build_embedding_cache() -> Optional[EmbeddingCache]:
+    if not EMBEDDING_CACHE_ENABLED:
+        return None
+    disk_store = None
+    if shared_cache is not None:
+        disk_store = SharedEmbeddingStore(shared_cache, EMBEDDING_CACHE_DISK_ENTRIES)
+    elif EMBEDDING_CACHE_DISK_ENTRIES > 0:
+        try:
+            disk_store = DiskEmbeddingStore(EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_DISK_ENTRIES)
+        except (OSError, ValueError) as e:
+            logger.error(f"Embedding disk cache unavailable, using memory only: {e}")
+    return EmbeddingCache(EMBEDDING_CACHE_MEMORY_ENTRIES, disk_store)
+
+
+embedding_cache = build_embedding_cache()
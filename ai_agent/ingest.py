@@ -0,0 +1,406 @@
+"""
+Bulk ingestion of the technical document corpus into the documents table.
+
+Chunks documents (mast / VDI tables are kept whole), skips chunks whose content hash is
+already stored, embeds the rest in large batches on a bounded worker pool with retries,
+and inserts them in bulk into Supabase or the local index snapshot. Chunks of a changed
+file that are no longer produced are deleted. Progress is recorded per file, so an
+interrupted run resumes where it stopped.
+
+Usage (from ai_agent/):
+    python ingest.py docs/ --target supabase
+    python ingest.py docs/ --target local --snapshot .cache/documents.npz
+    python ingest.py docs/ --dry-run
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from openai import AsyncOpenAI
+
+from context_assembly import count_tokens
+from embedding_cache import normalise_text
+from vector_index import LOCAL_INDEX_SNAPSHOT_PATH, DOCUMENTS_TABLE, LocalVectorIndex, fetch_document_rows
+
+logger = logging.getLogger("ingest")
+
+EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+INGEST_CHUNK_TOKENS = int(os.getenv("INGEST_CHUNK_TOKENS", "400"))
+# Tables up to this size stay in one chunk; larger ones are split by rows, repeating the header
+INGEST_MAX_TABLE_TOKENS = int(os.getenv("INGEST_MAX_TABLE_TOKENS", "1500"))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))
+INGEST_BATCH_TOKENS = int(os.getenv("INGEST_BATCH_TOKENS", "100000"))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "4"))
+INGEST_MAX_RETRIES = int(os.getenv("INGEST_MAX_RETRIES", "5"))
+INGEST_INSERT_PAGE_SIZE = 500
+INGEST_PROGRESS_PATH = os.getenv("INGEST_PROGRESS_PATH", ".cache/ingest-progress.json")
+
+SUPPORTED_EXTENSIONS = (".md", ".txt", ".pdf")
+HEADING = re.compile(r"^#{1,6}\s+(.*)")
+# VDI 2198 datasheet rows start with their item code ("1.2 Typzeichen ...")
+VDI_ROW = re.compile(r"^\s*\d{1,2}\.\d{1,2}\s+\S")
+MARKDOWN_SEPARATOR = re.compile(r"^\s*\|?\s*:?-{3,}")
+
+
+def is_table_row(line: str) -> bool:
+    return line.count("|") >= 2 or line.count("\t") >= 2 or bool(VDI_ROW.match(line))
+
+
+def split_blocks(text: str) -> List[Tuple[str, str]]:
+    """Splits text into ("table" | "text", block) pieces; consecutive table rows form one block."""
+    blocks, current, kind = [], [], None
+
+    def flush():
+        if current:
+            blocks.append((kind, "\n".join(current)))
+            current.clear()
+
+    for line in text.splitlines():
+        if not line.strip():
+            # Blank lines end paragraphs but not tables (PDF extraction often spaces rows out)
+            if kind != "table":
+                flush()
+            continue
+        line_kind = "table" if is_table_row(line) else "text"
+        if line_kind != kind:
+            flush()
+            kind = line_kind
+        current.append(line)
+    flush()
+    return blocks
+
+
+def split_table(table: str, max_tokens: int) -> List[str]:
+    """Keeps a table whole, or splits an oversized one by rows with the header repeated."""
+    if count_tokens(table) <= max_tokens:
+        return [table]
+    lines = table.splitlines()
+    header_size = 2 if len(lines) > 1 and MARKDOWN_SEPARATOR.match(lines[1]) else 1
+    header, rows = lines[:header_size], lines[header_size:]
+    pieces, current = [], []
+    for row in rows:
+        if current and count_tokens("\n".join(header + current + [row])) > max_tokens:
+            pieces.append("\n".join(header + current))
+            current = []
+        current.append(row)
+    if current:
+        pieces.append("\n".join(header + current))
+    return pieces
+
+
+def split_text(text: str, max_tokens: int) -> List[str]:
+    if count_tokens(text) <= max_tokens:
+        return [text]
+    pieces, current = [], ""
+    for sentence in re.split(r"(?<=[.!?])\s+", text):
+        candidate = f"{current} {sentence}".strip()
+        if current and count_tokens(candidate) > max_tokens:
+            pieces.append(current)
+            candidate = sentence
+        current = candidate
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def chunk_document(text: str, chunk_tokens: int = INGEST_CHUNK_TOKENS,
+                   max_table_tokens: int = INGEST_MAX_TABLE_TOKENS) -> List[dict]:
+    """Packs blocks into chunks of about `chunk_tokens`; a table is never split across chunks."""
+    chunks, current, size, heading = [], [], 0, ""
+
+    def flush():
+        nonlocal size
+        if current:
+            chunks.append({"content": "\n\n".join(current), "heading": heading})
+            current.clear()
+            size = 0
+
+    for kind, block in split_blocks(text):
+        match = HEADING.match(block) if kind == "text" else None
+        if match:
+            flush()
+            heading = match.group(1).strip()
+        pieces = split_table(block, max_table_tokens) if kind == "table" else split_text(block, chunk_tokens)
+        for piece in pieces:
+            tokens = count_tokens(piece)
+            if current and size + tokens > chunk_tokens:
+                flush()
+            current.append(piece)
+            size += tokens
+    flush()
+    return chunks
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(normalise_text(content).encode("utf-8")).hexdigest()
+
+
+def read_document(path: str) -> str:
+    if path.lower().endswith(".pdf"):
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            raise RuntimeError("pypdf is required to ingest PDF files (pip install pypdf)")
+        return "\n\n".join(page.extract_text() or "" for page in PdfReader(path).pages)
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def discover(paths: List[str]) -> List[str]:
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, name) for name in sorted(names) if name.lower().endswith(SUPPORTED_EXTENSIONS))
+        elif path.lower().endswith(SUPPORTED_EXTENSIONS):
+            files.append(path)
+    return sorted(files)
+
+
+class SupabaseStore:
+    """The documents table; blocking calls, run in worker threads."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def existing(self) -> Dict[str, Dict[str, object]]:
+        """source -> {content hash: row id} for rows written by this pipeline."""
+        stored = {}
+        for row in fetch_document_rows(self.client, "id, metadata"):
+            metadata = row.get("metadata") or {}
+            if metadata.get("content_hash"):
+                stored.setdefault(metadata.get("source"), {})[metadata["content_hash"]] = row["id"]
+        return stored
+
+    def insert(self, rows: List[dict]):
+        for start in range(0, len(rows), INGEST_INSERT_PAGE_SIZE):
+            self.client.table(DOCUMENTS_TABLE).insert(rows[start:start + INGEST_INSERT_PAGE_SIZE]).execute()
+
+    def delete(self, ids: List):
+        for start in range(0, len(ids), INGEST_INSERT_PAGE_SIZE):
+            self.client.table(DOCUMENTS_TABLE).delete().in_("id", ids[start:start + INGEST_INSERT_PAGE_SIZE]).execute()
+
+    def close(self):
+        pass
+
+
+class LocalStore:
+    """Stand-in for the table: the snapshot the local retrieval backend loads at startup."""
+
+    def __init__(self, snapshot_path: str):
+        self.snapshot_path = snapshot_path
+        self.index = LocalVectorIndex()
+        self.index.load(snapshot_path)
+
+    def existing(self) -> Dict[str, Dict[str, object]]:
+        stored = {}
+        for doc_id, row in self.index.rows.items():
+            metadata = row.get("metadata") or {}
+            if metadata.get("content_hash"):
+                stored.setdefault(metadata.get("source"), {})[metadata["content_hash"]] = doc_id
+        return stored
+
+    def insert(self, rows: List[dict]):
+        # The content hash doubles as the id, so re-inserting a chunk is idempotent
+        self.index.apply_rows([{**row, "id": row["metadata"]["content_hash"]} for row in rows])
+
+    def delete(self, ids: List):
+        for doc_id in ids:
+            self.index.rows.pop(doc_id, None)
+            self.index.vectors.pop(doc_id, None)
+
+    def close(self):
+        self.index.save(self.snapshot_path)
+
+
+def load_progress(path: str) -> dict:
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    return {"files": {}}
+
+
+def save_progress(path: str, progress: dict):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(progress, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def make_batches(chunks: List[dict], max_size: int, max_tokens: int) -> List[List[dict]]:
+    batches, current, tokens = [], [], 0
+    for chunk in chunks:
+        chunk_tokens = count_tokens(chunk["content"])
+        if current and (len(current) >= max_size or tokens + chunk_tokens > max_tokens):
+            batches.append(current)
+            current, tokens = [], 0
+        current.append(chunk)
+        tokens += chunk_tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+async def embed_batch(client, texts: List[str], retries: int = INGEST_MAX_RETRIES) -> List[List[float]]:
+    for attempt in range(1, retries + 1):
+        try:
+            response = await client.embeddings.create(model=EMBEDDING_MODEL, input=texts)
+            return [row.embedding for row in sorted(response.data, key=lambda row: row.index)]
+        except Exception as e:
+            if attempt == retries:
+                raise
+            # Exponential backoff with jitter (rate limits and transient 5xx)
+            delay = min(30, 2 ** attempt) * random.uniform(0.5, 1.0)
+            logger.warning(f"Embedding batch of {len(texts)} failed (attempt {attempt}): {e}; retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+async def ingest(args, store, client) -> dict:
+    start = time.monotonic()
+    progress = load_progress(args.progress)
+    stored = await asyncio.to_thread(store.existing)
+
+    pending_chunks, stale, files_skipped, unchanged = [], {}, 0, 0
+    remaining: Dict[str, int] = {}  # chunks of each file still to embed
+    digests = {}
+    for path in discover(args.paths):
+        source = os.path.relpath(path, args.root)
+        digests[source] = file_digest(path)
+        if not args.force and progress["files"].get(source, {}).get("sha256") == digests[source]:
+            files_skipped += 1
+            continue
+        try:
+            chunks = chunk_document(read_document(path), args.chunk_tokens)
+        except Exception as e:
+            logger.error(f"Skipping {source}: {e}")
+            continue
+
+        known = stored.get(source, {})
+        hashes = set()
+        remaining[source] = 0
+        for position, chunk in enumerate(chunks):
+            digest = content_hash(chunk["content"])
+            if digest in hashes:
+                continue
+            hashes.add(digest)
+            if digest in known:
+                unchanged += 1
+                continue
+            pending_chunks.append({
+                "content": chunk["content"],
+                "metadata": {"source": source, "chunk": position, "heading": chunk["heading"], "content_hash": digest},
+            })
+            remaining[source] += 1
+        stale[source] = [doc_id for digest, doc_id in known.items() if digest not in hashes]
+
+    batches = make_batches(pending_chunks, args.batch_size, INGEST_BATCH_TOKENS)
+    logger.info(f"{len(pending_chunks)} chunks to embed in {len(batches)} batches ({unchanged} unchanged, {files_skipped} files skipped)")
+
+    done = {"chunks": 0, "batches": 0, "deleted": 0}
+    workers = asyncio.Semaphore(args.workers)
+    # One progress write at a time: they share the temporary file
+    saving = asyncio.Lock()
+
+    async def finish_file(source: str):
+        if stale[source]:
+            await asyncio.to_thread(store.delete, stale[source])
+            done["deleted"] += len(stale[source])
+        progress["files"][source] = {"sha256": digests[source], "completed_at": time.time()}
+        async with saving:
+            # A snapshot, as other files may complete while it is written on the worker thread
+            await asyncio.to_thread(save_progress, args.progress, {**progress, "files": dict(progress["files"])})
+
+    async def process(batch: List[dict]):
+        async with workers:
+            embeddings = await embed_batch(client, [chunk["content"] for chunk in batch])
+            rows = [{**chunk, "embedding": embedding} for chunk, embedding in zip(batch, embeddings)]
+            await asyncio.to_thread(store.insert, rows)
+        done["chunks"] += len(batch)
+        done["batches"] += 1
+        elapsed = time.monotonic() - start
+        logger.info(f"[{done['batches']}/{len(batches)} batches] {done['chunks']} chunks, {done['chunks'] / elapsed:.1f} chunks/s")
+        for chunk in batch:
+            source = chunk["metadata"]["source"]
+            remaining[source] -= 1
+            if remaining[source] == 0:
+                await finish_file(source)
+
+    if not args.dry_run:
+        # Files with nothing new to embed may still have stale chunks to drop
+        for source, count in remaining.items():
+            if count == 0:
+                await finish_file(source)
+        await asyncio.gather(*[process(batch) for batch in batches])
+        await asyncio.to_thread(store.close)
+
+    elapsed = time.monotonic() - start
+    return {
+        "files_skipped": files_skipped,
+        "chunks_embedded": done["chunks"],
+        "chunks_pending": len(pending_chunks),
+        "chunks_unchanged": unchanged,
+        "chunks_deleted": done["deleted"],
+        "elapsed_s": round(elapsed, 2),
+        "chunks_per_second": round(done["chunks"] / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("paths", nargs="+", help="Files or directories (.md, .txt, .pdf)")
+    parser.add_argument("--target", choices=["supabase", "local"], default="supabase")
+    parser.add_argument("--snapshot", default=LOCAL_INDEX_SNAPSHOT_PATH, help="Local target: index snapshot to update")
+    parser.add_argument("--root", default=".", help="Sources are stored relative to this directory")
+    parser.add_argument("--chunk-tokens", type=int, default=INGEST_CHUNK_TOKENS)
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    parser.add_argument("--progress", default=INGEST_PROGRESS_PATH)
+    parser.add_argument("--force", action="store_true", help="Re-chunk files even if unchanged since the last run")
+    parser.add_argument("--dry-run", action="store_true", help="Chunk and diff only; embed and write nothing")
+    parser.add_argument("--stub-embeddings", type=float, metavar="LATENCY",
+                        help="Use the benchmark embedding stub with this latency instead of OpenAI")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    if args.target == "local":
+        store = LocalStore(args.snapshot)
+    else:
+        from supabase import create_client
+        url, key = os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY")
+        if not url or not key:
+            sys.exit("SUPABASE_URL and SUPABASE_KEY are required for --target supabase")
+        store = SupabaseStore(create_client(url, key))
+
+    if args.stub_embeddings is not None:
+        from benchmarks.stubs import StubOpenAI
+        client = StubOpenAI(args.stub_embeddings)
+    else:
+        client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+    print(json.dumps(asyncio.run(ingest(args, store, client)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
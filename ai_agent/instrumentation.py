@@ -0,0 +1,81 @@
+import os
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from embedding_cache import embedding_cache
+from semantic_cache import semantic_cache
+
+# Seconds; spans cache hits (ms) up to answer generation near its deadline
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30)
+
+STAGE_LATENCY = Histogram(
+    "agent_stage_duration_seconds", "Duration of each pipeline stage", ["stage"], buckets=STAGE_BUCKETS
+)
+REQUEST_LATENCY = Histogram(
+    "agent_request_duration_seconds", "Wall time per endpoint request", ["endpoint"], buckets=STAGE_BUCKETS
+)
+REQUESTS_IN_FLIGHT = Gauge("agent_requests_in_flight", "Requests currently being served", ["endpoint"])
+PROVIDER_CALLS_IN_FLIGHT = Gauge("agent_provider_calls_in_flight", "Provider calls currently awaiting a response", ["stage"])
+PROVIDER_ERRORS = Counter("agent_provider_errors_total", "Failed provider calls by stage and kind", ["stage", "kind"])
+CIRCUIT_OPEN = Gauge("agent_circuit_open", "1 while the stage's circuit breaker is not closed", ["stage"])
+STARTUP_SECONDS = Gauge("agent_startup_seconds", "Seconds from process start until ready / first answer", ["phase"])
+ADMISSION_QUEUE_DEPTH = Gauge("agent_admission_queue_depth", "Requests waiting for a slot", ["lane"])
+ADMISSION_ACTIVE = Gauge("agent_admission_active", "Requests holding a slot", ["lane"])
+ADMISSION_WAIT = Histogram(
+    "agent_admission_wait_seconds", "Time spent queued before admission", ["lane"], buckets=STAGE_BUCKETS
+)
+ADMISSION_REJECTED = Counter("agent_admission_rejected_total", "Requests shed by admission control", ["lane", "reason"])
+RATE_BUDGET_REMAINING = Gauge(
+    "agent_rate_budget_remaining", "Requests/tokens left in the provider's per-minute budget", ["provider", "kind"]
+)
+THROTTLE_DELAY = Histogram(
+    "agent_throttle_delay_seconds", "Time calls waited for provider rate budget", ["provider"], buckets=STAGE_BUCKETS
+)
+
+
+def record_stage(metrics: dict, key: str, stage: str, start: float):
+    """Stores the ms elapsed since `start` (a time.monotonic() reading) under `key` and observes it for `stage`."""
+    elapsed = time.monotonic() - start
+    metrics[key] = round(elapsed * 1000, 2)
+    STAGE_LATENCY.labels(stage).observe(elapsed)
+
+
+class CacheCollector:
+    """Exposes the in-process cache counters at scrape time instead of mirroring every lookup."""
+
+    def collect(self):
+        lookups = CounterMetricFamily("agent_cache_lookups", "Cache lookups by result", labels=["cache", "result"])
+        ratio = GaugeMetricFamily("agent_cache_hit_ratio", "Hits over lookups since start", labels=["cache"])
+
+        stats = semantic_cache.stats()
+        lookups.add_metric(["semantic", "hit"], stats["semantic_cache_hits"])
+        lookups.add_metric(["semantic", "miss"], stats["semantic_cache_misses"])
+        ratio.add_metric(["semantic"], stats["semantic_cache_hit_ratio"])
+
+        if embedding_cache is not None:
+            stats = embedding_cache.stats()
+            lookups.add_metric(["embedding", "memory_hit"], stats["embedding_cache_memory_hits"])
+            lookups.add_metric(["embedding", "disk_hit"], stats["embedding_cache_disk_hits"])
+            lookups.add_metric(["embedding", "miss"], stats["embedding_cache_misses"])
+            ratio.add_metric(["embedding"], stats["embedding_cache_hit_ratio"])
+
+        yield lookups
+        yield ratio
+
+
+REGISTRY.register(CacheCollector())
+
+
+def render_metrics() -> bytes:
+    """Prometheus text format; aggregates across workers when PROMETHEUS_MULTIPROC_DIR is set."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+METRICS_CONTENT_TYPE = CONTENT_TYPE_LATEST
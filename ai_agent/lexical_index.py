@@ -0,0 +1,161 @@
+import os
+import re
+import math
+import time
+import logging
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from vector_index import LOCAL_INDEX_FULL_RELOAD_EVERY, Watermark, fetch_document_rows
+
+logger = logging.getLogger(__name__)
+
+# Lexical (BM25) retrieval configuration
+LEXICAL_SEARCH_ENABLED = os.getenv("LEXICAL_SEARCH_ENABLED", "False") == "True"
+# Fuse BM25 and vector results with reciprocal-rank fusion
+LEXICAL_HYBRID = os.getenv("LEXICAL_HYBRID", "True") == "True"
+# Skip the embedding entirely when the query is mostly model names / VDI codes
+LEXICAL_FAST_PATH = os.getenv("LEXICAL_FAST_PATH", "True") == "True"
+LEXICAL_FAST_PATH_RATIO = float(os.getenv("LEXICAL_FAST_PATH_RATIO", "0.5"))
+# Extra model names to recognise, comma separated (e.g. "K-MATIC,BlueSpot")
+LEXICAL_MODEL_TERMS = os.getenv("LEXICAL_MODEL_TERMS", "K-MATIC,BlueSpot")
+RRF_K = int(os.getenv("RRF_K", "60"))
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.\-][a-z0-9]+)*")
+VDI_CODE_PATTERN = re.compile(r"^\d{1,2}\.\d{1,2}$")
+MODEL_CODE_PATTERN = re.compile(r"^(?=.*[a-z])(?=.*\d)[a-z0-9\-]{2,}$")
+
+
+def strip_accents(text: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFD", text) if unicodedata.category(c) != "Mn")
+
+
+# Compared against tokens, which are accent-free
+STOPWORDS = {strip_accents(word) for word in {
+    "el", "la", "los", "las", "un", "una", "unos", "unas", "de", "del", "al", "a", "en", "y", "o",
+    "que", "cual", "cuál", "es", "son", "por", "para", "con", "sin", "se", "su", "sus", "lo", "le",
+    "me", "mi", "como", "cómo", "qué", "cuanto", "cuánto", "cuanta", "cuánta", "hay", "tiene",
+    "dame", "dime", "quiero", "saber", "sobre", "the", "of", "and",
+}}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase, accent-free tokens that keep model codes (e20, k-matic) and VDI codes (4.35) whole."""
+    return [token for token in TOKEN_PATTERN.findall(strip_accents(text.lower())) if token not in STOPWORDS]
+
+
+class LexicalSnapshot:
+    """
+    Immutable BM25 postings, document lengths and recognised vocabulary, built off the
+    event loop and swapped in atomically like `vector_index.IndexSnapshot`.
+    """
+
+    def __init__(self, rows: Dict, configured_terms: set):
+        self.rows = list(rows.values())
+        postings = defaultdict(list)
+        self.doc_lengths: List[int] = []
+        self.recognised_terms = set(configured_terms)
+        for position, row in enumerate(self.rows):
+            tokens = tokenize(row["content"])
+            self.doc_lengths.append(len(tokens))
+            for token, frequency in Counter(tokens).items():
+                postings[token].append((position, frequency))
+                if VDI_CODE_PATTERN.match(token) or MODEL_CODE_PATTERN.match(token):
+                    self.recognised_terms.add(token)
+        self.postings: Dict[str, List[Tuple[int, int]]] = dict(postings)
+        self.avg_length = (sum(self.doc_lengths) / len(self.doc_lengths)) if self.doc_lengths else 0.0
+
+    def search(self, query: str, match_count: int) -> List[dict]:
+        total = len(self.rows)
+        scores = defaultdict(float)
+        for token in set(tokenize(query)):
+            matches = self.postings.get(token)
+            if not matches:
+                continue
+            idf = math.log(1 + (total - len(matches) + 0.5) / (len(matches) + 0.5))
+            for position, frequency in matches:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[position] / (self.avg_length or 1))
+                scores[position] += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:match_count]
+        return [{**self.rows[position], "bm25_score": round(score, 4)} for position, score in best]
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index over the same chunks `match_documents` searches.
+    Also keeps the vocabulary of recognised model names and VDI codes used to
+    decide whether a query can skip the embedding call.
+    """
+
+    def __init__(self, model_terms: str = LEXICAL_MODEL_TERMS):
+        self.rows: Dict = {}
+        self.watermark = Watermark()
+        self.configured_terms = {token for term in model_terms.split(",") for token in tokenize(term)}
+        self.snapshot = LexicalSnapshot({}, self.configured_terms)
+        self.last_refresh: Optional[float] = None
+        self.polls = 0
+
+    @property
+    def ready(self) -> bool:
+        return bool(self.snapshot.rows)
+
+    def apply_rows(self, rows: List[dict], replace: bool = False) -> int:
+        if replace:
+            self.rows, self.watermark = {}, Watermark()
+        applied = 0
+        for row in rows:
+            if not self.watermark.is_new(row):
+                continue
+            self.watermark.advance(row)
+            applied += 1
+            self.rows[row["id"]] = {"id": row["id"], "content": row.get("content", ""), "metadata": row.get("metadata") or {}}
+        return applied
+
+    def rebuild(self):
+        """Builds a new snapshot from the rows; searches keep using the previous one until it is swapped in."""
+        self.snapshot = LexicalSnapshot(self.rows, self.configured_terms)
+
+    def refresh(self, client) -> int:
+        """Blocking: pulls rows changed since the last refresh, with a periodic full reload to drop deleted rows."""
+        full_reload = self.watermark.value is None or self.polls % LOCAL_INDEX_FULL_RELOAD_EVERY == 0
+        rows = fetch_document_rows(client, "id, content, metadata", None if full_reload else self.watermark.value)
+        self.polls += 1
+        changed = self.apply_rows(rows, replace=full_reload)
+        if changed or full_reload:
+            self.rebuild()
+        self.last_refresh = time.time()
+        return changed
+
+    def recognised_ratio(self, query: str) -> float:
+        """Share of meaningful query tokens that are known model names or VDI codes."""
+        tokens = tokenize(query)
+        if not tokens:
+            return 0.0
+        recognised_terms = self.snapshot.recognised_terms
+        return sum(1 for token in tokens if token in recognised_terms) / len(tokens)
+
+    def search(self, query: str, match_count: int) -> List[dict]:
+        return self.snapshot.search(query, match_count)
+
+    def stats(self) -> dict:
+        snapshot = self.snapshot
+        return {"lexical_index_documents": len(snapshot.rows), "lexical_index_terms": len(snapshot.postings)}
+
+
+def reciprocal_rank_fusion(*ranked_lists: List[dict], limit: int, k: int = RRF_K) -> List[dict]:
+    """Fuses ranked result lists by summing 1 / (k + rank); keeps each document's fields from its first list."""
+    fused, scores = {}, defaultdict(float)
+    for docs in ranked_lists:
+        for rank, doc in enumerate(docs, start=1):
+            key = doc.get("id", doc.get("content"))
+            scores[key] += 1 / (k + rank)
+            fused.setdefault(key, doc)
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+    return [{**fused[key], "rrf_score": round(score, 6)} for key, score in ranked]
+
+
+lexical_index = LexicalIndex() if LEXICAL_SEARCH_ENABLED else None
@@ -1,45 +1,140 @@
+import json
+import time
+import asyncio
 import logging
-from typing import Optional
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
-# Import services
-from services import get_ai_response_with_summary
-
-# Load environment variables
+# Load environment variables before the modules below read their configuration
 load_dotenv()
 
+# Import services
+from services import (
+    get_ai_response_with_summary, stream_ai_response_with_summary, refresh_document_indexes, model_registry,
+    flush_caches, embedding_cache, shared_cache,
+    can_defer_summary, schedule_summary
+)
+from admission import Overloaded, admission
+from client_registry import WARM_UP_RETRY_MAX_SECONDS, WARM_UP_RETRY_SECONDS, client_registry
+from instrumentation import METRICS_CONTENT_TYPE, REQUEST_LATENCY, REQUESTS_IN_FLIGHT, render_metrics
+from tracing import TraceIdFilter, parse_traceparent, start_trace
+from vector_index import local_index
+from lexical_index import lexical_index
+
 # Logging configuration
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=logging.INFO, format="%(levelname)s:%(name)s:[%(trace_id)s] %(message)s")
+for handler in logging.getLogger().handlers:
+    handler.addFilter(TraceIdFilter())
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Neon Linde AI Agent")
+async def warm_up():
+    """
+    Builds the provider clients, opens their connections and warms the models; then reports
+    ready. Until that succeeds the agent stays not ready and the warm-up is retried.
+    """
+    delay = WARM_UP_RETRY_SECONDS
+    while True:
+        try:
+            await client_registry.start()
+            await model_registry.start()
+        except Exception as e:
+            logger.error(f"Error warming up providers, retrying in {delay:g} s: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, WARM_UP_RETRY_MAX_SECONDS)
+            continue
+        client_registry.mark_ready()
+        return
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm-up runs in the background: /health answers immediately, /ready once it finishes
+    background_tasks = [asyncio.create_task(warm_up())]
+    if local_index is not None or lexical_index is not None:
+        background_tasks.append(asyncio.create_task(refresh_document_indexes()))
+    if embedding_cache is not None or shared_cache is not None:
+        background_tasks.append(asyncio.create_task(flush_caches()))
+    yield
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await client_registry.close()
+
+app = FastAPI(title="Neon Linde AI Agent", lifespan=lifespan)
+
+class ConversationTurn(BaseModel):
+    is_user: bool
+    message: str
 
 class ChatRequest(BaseModel):
     message: str
     session_id: Optional[str] = None
     summary: Optional[str] = ""
+    # Skip the semantic answer cache (e.g. evaluation runs or a user asking to regenerate)
+    bypass_cache: bool = False
+    # Turn number of this message; with `defer_summary` the new summary is computed after
+    # the answer is returned and posted to the backend callback tagged with this turn
+    turn: Optional[int] = None
+    defer_summary: bool = False
+    # Most recent messages of the session (oldest first), kept verbatim next to the summary
+    recent_turns: List[ConversationTurn] = []
+    # Trace id generated by the backend; the traceparent header also carries the parent span
+    trace_id: Optional[str] = None
+    # Admission lane: "interactive" (users) is always served ahead of "batch" (evaluations, replays)
+    priority: str = "interactive"
 
 class ChatResponse(BaseModel):
     answer: str
     summary: str
     metrics: dict
+    summary_pending: bool = False
+
+def trace_context(request: ChatRequest, traceparent: Optional[str]):
+    trace_id, parent_id = parse_traceparent(traceparent)
+    return trace_id or request.trace_id, parent_id
+
+def overloaded(e: Overloaded) -> HTTPException:
+    logger.warning(f"Shedding request: {e}")
+    return HTTPException(
+        status_code=e.status_code, detail="AI Agent overloaded, retry later", headers={"Retry-After": str(e.retry_after)}
+    )
 
 @app.post("/chat", response_model=ChatResponse)
-async def chat_endpoint(request: ChatRequest):
+async def chat_endpoint(request: ChatRequest, traceparent: Optional[str] = Header(None)):
     if not request.message:
         raise HTTPException(status_code=400, detail="Message is required")
 
+    # Without a callback target the summary is awaited inline so the backend gets it in the response
+    defer = request.defer_summary and can_defer_summary(request.session_id, request.turn)
+
+    recent_turns = [turn.model_dump() for turn in request.recent_turns]
+
+    trace_id, parent_id = trace_context(request, traceparent)
     try:
-        # Call the updated service directly
-        # Note: We are waiting for the summary here to ensure data consistency with the backend.
-        # Call the updated service directly
-        # Note: We are waiting for the summary here to ensure data consistency with the backend.
-        # Thanks to Gemini Flash, this is still very fast.
-        answer, new_summary, metrics = await get_ai_response_with_summary(request.message, request.summary)
-        return ChatResponse(answer=answer, summary=new_summary, metrics=metrics)
+        with start_trace("agent.chat", trace_id, parent_id, session_id=request.session_id, turn=request.turn) as root, \
+                REQUESTS_IN_FLIGHT.labels("chat").track_inprogress(), REQUEST_LATENCY.labels("chat").time():
+            async with admission.slot(request.priority, request.session_id) as admission_wait_ms:
+                answer, new_summary, metrics = await get_ai_response_with_summary(
+                    request.message, request.summary, use_cache=not request.bypass_cache, defer_summary=defer,
+                    recent_turns=recent_turns, turn=request.turn, session_id=request.session_id or "N/A"
+                )
+            metrics["admission_wait_ms"] = admission_wait_ms
+            pending = metrics.get("summary_deferred", False)
+            if pending:
+                schedule_summary(request.session_id, request.turn, request.message, answer, request.summary, recent_turns)
+        if root is not None:
+            metrics["trace_id"] = root.trace_id
+        first_answer_ms = client_registry.record_answer()
+        if first_answer_ms is not None:
+            metrics["cold_start_to_first_answer_ms"] = first_answer_ms
+        return ChatResponse(answer=answer, summary=new_summary, metrics=metrics, summary_pending=pending)
 
+    except Overloaded as e:
+        raise overloaded(e)
     except Exception as e:
         logger.error(f"Error in chat endpoint: {e}")
         raise HTTPException(status_code=500, detail="Internal AI Agent Error")
@@ -47,3 +142,81 @@ async def chat_endpoint(request: ChatRequest):
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness probe: 503 until the provider connections and models are warm."""
+    stats = {**client_registry.stats(), "model_warmup_ms": model_registry.warmup_ms}
+    if not client_registry.ready:
+        return JSONResponse({"status": "warming_up", **stats}, status_code=503)
+    return {"status": "ready", **stats}
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus scrape target: stage histograms, provider errors, in-flight gauges, cache ratios."""
+    return Response(render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest, traceparent: Optional[str] = Header(None)):
+    """
+    Server-Sent Events variant of /chat.
+    Events: "retrieval" (context ready), "token" (answer chunk), "done" (answer, summary, metrics), "error".
+    """
+    if not request.message:
+        raise HTTPException(status_code=400, detail="Message is required")
+
+    defer = request.defer_summary and can_defer_summary(request.session_id, request.turn)
+    recent_turns = [turn.model_dump() for turn in request.recent_turns]
+    trace_id, parent_id = trace_context(request, traceparent)
+
+    # Admitted before the response starts so a shed request still gets its 429/503 status
+    try:
+        admission_wait_ms = await admission.acquire(request.priority, request.session_id)
+    except Overloaded as e:
+        raise overloaded(e)
+    admitted_at = time.monotonic()
+    released = False
+
+    def release_slot():
+        # Called from the stream's finally and again as the response's background task,
+        # which also runs when the client disconnects before the stream started
+        nonlocal released
+        if not released:
+            released = True
+            admission.release(request.priority, admitted_at)
+
+    async def event_stream():
+        try:
+            with start_trace("agent.chat_stream", trace_id, parent_id, session_id=request.session_id, turn=request.turn) as root, \
+                    REQUESTS_IN_FLIGHT.labels("chat_stream").track_inprogress(), REQUEST_LATENCY.labels("chat_stream").time():
+                async for event, data in stream_ai_response_with_summary(
+                    request.message, request.summary, use_cache=not request.bypass_cache, defer_summary=defer,
+                    recent_turns=recent_turns, turn=request.turn, session_id=request.session_id or "N/A"
+                ):
+                    if event == "done":
+                        data["metrics"]["admission_wait_ms"] = admission_wait_ms
+                        if root is not None:
+                            data["metrics"]["trace_id"] = root.trace_id
+                        first_answer_ms = client_registry.record_answer()
+                        if first_answer_ms is not None:
+                            data["metrics"]["cold_start_to_first_answer_ms"] = first_answer_ms
+                        if data.get("summary_pending"):
+                            schedule_summary(
+                                request.session_id, request.turn, request.message, data["answer"], request.summary, recent_turns
+                            )
+                    yield format_sse(event, data)
+        except Exception as e:
+            logger.error(f"Error in chat stream endpoint: {e}")
+            yield format_sse("error", {"detail": "Internal AI Agent Error"})
+        finally:
+            release_slot()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(release_slot)
+    )
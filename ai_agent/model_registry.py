@@ -0,0 +1,155 @@
+import os
+import time
+import asyncio
+import datetime
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from client_registry import client_registry
+
+logger = logging.getLogger(__name__)
+
+# Provider-side caching of fixed system instructions (Gemini explicit context caching)
+CONTEXT_CACHE_ENABLED = os.getenv("CONTEXT_CACHE_ENABLED", "True") == "True"
+CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("CONTEXT_CACHE_TTL_SECONDS", "3600"))
+# Recreate the cached content this long before it expires
+CONTEXT_CACHE_REFRESH_MARGIN_SECONDS = 300
+MODEL_WARMUP_ENABLED = os.getenv("MODEL_WARMUP_ENABLED", "True") == "True"
+
+
+class ModelSpec:
+    def __init__(self, system_instruction: Optional[str] = None, generation_config: Optional[dict] = None,
+                 cache_system_instruction: bool = False):
+        self.system_instruction = system_instruction
+        self.generation_config = generation_config
+        self.cache_system_instruction = cache_system_instruction
+
+
+class ModelRegistry:
+    """
+    Builds each Gemini model/config combination once and hands out the shared instance.
+    Specs flagged with `cache_system_instruction` are rebuilt on top of a provider-side
+    cached content holding the system instruction when the API accepts it (it rejects
+    instructions below the model's minimum cacheable size); otherwise the plain model is used.
+    Specs with the same instruction share one cached content, keyed by (model, instruction).
+    """
+
+    def __init__(self, model_name: str, specs: Dict[str, ModelSpec]):
+        self.model_name = model_name
+        self.specs = specs
+        # Built on first use so importing the registry does not import the Gemini SDK
+        self.models = {}
+        self.warm = {name: False for name in specs}
+        self.warmup_ms: Dict[str, float] = {}
+        # Spec name -> cached content its model is bound to
+        self.cached_contents = {}
+        # (model, instruction) -> expiry of the shared cached content
+        self.cache_expires_at: Dict[Tuple[str, str], float] = {}
+        self._refreshing = set()
+
+    def _build(self, spec: ModelSpec):
+        return client_registry.genai.GenerativeModel(
+            self.model_name,
+            system_instruction=spec.system_instruction,
+            generation_config=spec.generation_config
+        )
+
+    def model(self, name: str):
+        if name not in self.models:
+            self.models[name] = self._build(self.specs[name])
+        return self.models[name]
+
+    def cache_key(self, name: str) -> Tuple[str, str]:
+        return self.model_name, self.specs[name].system_instruction
+
+    def cached_specs(self, key: Tuple[str, str]) -> List[str]:
+        """Names of the specs served from the cached content `key`."""
+        return [
+            name for name, spec in self.specs.items()
+            if spec.cache_system_instruction and spec.system_instruction and self.cache_key(name) == key
+        ]
+
+    def acquire(self, name: str):
+        """Returns the shared model for `name` and whether it had already served a request."""
+        was_warm = self.warm[name]
+        key = self.cache_key(name)
+        if key in self.cache_expires_at and key not in self._refreshing:
+            if time.monotonic() > self.cache_expires_at[key] - CONTEXT_CACHE_REFRESH_MARGIN_SECONDS:
+                self._refreshing.add(key)
+                asyncio.get_running_loop().create_task(self._refresh_cache(key))
+        self.warm[name] = True
+        return self.model(name), was_warm
+
+    def _create_cached_models(self, key: Tuple[str, str]):
+        """Blocking: creates the cached content for `key` and a model bound to it per spec sharing it."""
+        model_name, system_instruction = key
+        genai = client_registry.genai
+        names = self.cached_specs(key)
+        cached_content = genai.caching.CachedContent.create(
+            model=model_name,
+            display_name=f"neon-linde-{'-'.join(names)}",
+            system_instruction=system_instruction,
+            ttl=datetime.timedelta(seconds=CONTEXT_CACHE_TTL_SECONDS)
+        )
+        return cached_content, {
+            name: genai.GenerativeModel.from_cached_content(
+                cached_content, generation_config=self.specs[name].generation_config
+            )
+            for name in names
+        }
+
+    async def _refresh_cache(self, key: Tuple[str, str]):
+        names = self.cached_specs(key)
+        try:
+            cached_content, models = await asyncio.to_thread(self._create_cached_models, key)
+            for name, model in models.items():
+                self.cached_contents[name] = cached_content
+                self.models[name] = model
+            self.cache_expires_at[key] = time.monotonic() + CONTEXT_CACHE_TTL_SECONDS
+            logger.info(f"Context cache ready for models {names}")
+        except Exception as e:
+            # Unsupported model, instruction below the minimum size, or no permission: use the plain
+            # model, also in place of one bound to a cached content that is about to expire
+            logger.warning(f"Context caching unavailable for models {names}, using the plain models: {e}")
+            self.cache_expires_at.pop(key, None)
+            for name in names:
+                self.cached_contents.pop(name, None)
+                self.models[name] = self._build(self.specs[name])
+        finally:
+            self._refreshing.discard(key)
+
+    async def _warm_up(self, name: str):
+        start = time.monotonic()
+        try:
+            await self.model(name).generate_content_async(
+                "ping",
+                generation_config={"max_output_tokens": 1}
+            )
+            self.warm[name] = True
+        except Exception as e:
+            logger.warning(f"Warm-up request failed for model '{name}': {e}")
+        self.warmup_ms[name] = round((time.monotonic() - start) * 1000, 2)
+
+    async def start(self):
+        """Startup hook: creates provider-side caches, then sends one tiny request per model."""
+        if CONTEXT_CACHE_ENABLED:
+            keys = {
+                self.cache_key(name) for name, spec in self.specs.items()
+                if spec.cache_system_instruction and spec.system_instruction
+            }
+            await asyncio.gather(*[self._refresh_cache(key) for key in keys])
+        if MODEL_WARMUP_ENABLED:
+            await asyncio.gather(*[self._warm_up(name) for name in self.specs])
+            logger.info(f"Models warmed up: {self.warmup_ms}")
+
+    def describe(self, name: str, response=None, was_warm: bool = True) -> dict:
+        """Metrics for one call: warm/cold state, context cache in use and provider-reported cached tokens."""
+        metrics = {
+            f"{name}_model_state": "warm" if was_warm else "cold",
+            f"{name}_context_cache": "explicit" if name in self.cached_contents else "none",
+        }
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            metrics[f"{name}_prompt_tokens"] = getattr(usage, "prompt_token_count", 0)
+            metrics[f"{name}_cached_tokens"] = getattr(usage, "cached_content_token_count", 0)
+        return metrics
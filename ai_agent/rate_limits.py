@@ -0,0 +1,191 @@
+import os
+import time
+import heapq
+import asyncio
+import itertools
+import logging
+from typing import Optional
+
+from instrumentation import RATE_BUDGET_REMAINING, THROTTLE_DELAY
+
+logger = logging.getLogger(__name__)
+
+# Provider quotas per model (requests and tokens per minute); calls wait for budget instead of
+# being rejected by the provider. Defaults are the paid tier-1 limits of the configured models.
+RATE_LIMITS_ENABLED = os.getenv("RATE_LIMITS_ENABLED", "True") == "True"
+RATE_LIMIT_GEMINI_RPM = int(os.getenv("RATE_LIMIT_GEMINI_RPM", "2000"))
+RATE_LIMIT_GEMINI_TPM = int(os.getenv("RATE_LIMIT_GEMINI_TPM", "4000000"))
+RATE_LIMIT_OPENAI_EMBEDDING_RPM = int(os.getenv("RATE_LIMIT_OPENAI_EMBEDDING_RPM", "3000"))
+RATE_LIMIT_OPENAI_EMBEDDING_TPM = int(os.getenv("RATE_LIMIT_OPENAI_EMBEDDING_TPM", "1000000"))
+# Share of the published quota actually used: other clients on the same key and the
+# provider's own window boundaries would otherwise still trip the limit
+RATE_LIMIT_HEADROOM = float(os.getenv("RATE_LIMIT_HEADROOM", "0.9"))
+# Providers enforce per-minute quotas over shorter windows too (60k RPM may mean 1k per second),
+# so the buckets hold this many seconds of quota instead of a whole minute
+RATE_LIMIT_BURST_SECONDS = float(os.getenv("RATE_LIMIT_BURST_SECONDS", "10"))
+# Longest a call waits for budget; past this it is sent anyway and the provider decides
+RATE_LIMIT_MAX_DELAY_MS = float(os.getenv("RATE_LIMIT_MAX_DELAY_MS", "10000"))
+# Output tokens assumed for calls without max_output_tokens
+RATE_LIMIT_DEFAULT_OUTPUT_TOKENS = int(os.getenv("RATE_LIMIT_DEFAULT_OUTPUT_TOKENS", "512"))
+
+# When budget is short, waiting calls are served lowest priority value first, then in arrival order
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+
+class TokenBucket:
+    """Holds up to `burst_seconds` of quota and refills continuously at quota/60 per second."""
+
+    def __init__(self, per_minute: float, burst_seconds: float = RATE_LIMIT_BURST_SECONDS):
+        self.rate = per_minute / 60
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self) -> float:
+        self._refill()
+        return self.level
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` is available (0 if it already is)."""
+        return max(0.0, (amount - self.available()) / self.rate)
+
+    def take(self, amount: float):
+        # May go negative when a call is sent without budget or used more than estimated
+        self._refill()
+        self.level -= amount
+
+    def give(self, amount: float):
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+
+class RateBudget:
+    """
+    Requests-per-minute and tokens-per-minute budget of one provider/model. A call that
+    does not fit waits until both buckets have refilled enough; while calls are waiting,
+    newcomers queue behind them, ordered by priority so interactive turns overtake
+    background summaries. Estimates are corrected with the provider-reported usage.
+    """
+
+    def __init__(self, name: str, rpm: float, tpm: float, enabled: bool = RATE_LIMITS_ENABLED,
+                 burst_seconds: float = RATE_LIMIT_BURST_SECONDS):
+        self.name = name
+        self.enabled = enabled
+        self.requests = TokenBucket(rpm * RATE_LIMIT_HEADROOM, burst_seconds)
+        self.tokens = TokenBucket(tpm * RATE_LIMIT_HEADROOM, burst_seconds)
+        self.waiters = []
+        self._sequence = itertools.count()
+        self._pump: Optional[asyncio.Task] = None
+        self.throttled = 0
+        self.overruns = 0
+
+    def _fits(self, tokens: float) -> bool:
+        return self.requests.available() >= 1 and self.tokens.available() >= tokens
+
+    def _take(self, tokens: float):
+        self.requests.take(1)
+        self.tokens.take(tokens)
+
+    async def _serve(self):
+        """Grants queued calls as budget refills, always looking at the current head of the queue."""
+        while self.waiters:
+            _, _, tokens, waiter = self.waiters[0]
+            if waiter.done():
+                heapq.heappop(self.waiters)
+                continue
+            delay = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            heapq.heappop(self.waiters)
+            self._take(tokens)
+            waiter.set_result(None)
+        self._pump = None
+
+    async def acquire(self, tokens: float, priority: int = PRIORITY_INTERACTIVE) -> float:
+        """Waits until the call fits in the budget and charges it; returns the delay in seconds."""
+        if not self.enabled:
+            return 0.0
+        tokens = min(tokens, self.tokens.capacity)
+        if not self.waiters and self._fits(tokens):
+            self._take(tokens)
+            return 0.0
+
+        start = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self._sequence), tokens, waiter))
+        if self._pump is None:
+            self._pump = asyncio.ensure_future(self._serve())
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), RATE_LIMIT_MAX_DELAY_MS / 1000)
+        except asyncio.TimeoutError:
+            if not waiter.done():
+                waiter.cancel()
+                self._take(tokens)
+                self.overruns += 1
+                logger.warning(f"No {self.name} budget after {RATE_LIMIT_MAX_DELAY_MS:.0f} ms; sending anyway")
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Granted, but the caller gave up before making the call
+                self.settle(tokens, 0, requests=0)
+            waiter.cancel()
+            raise
+        delay = time.monotonic() - start
+        self.throttled += 1
+        THROTTLE_DELAY.labels(self.name).observe(delay)
+        return delay
+
+    def settle(self, estimated: float, actual: Optional[float], requests: int = 1):
+        """Corrects the charge of a call once its real token usage is known."""
+        if not self.enabled or actual is None:
+            return
+        if requests == 0:
+            self.requests.give(1)
+        difference = actual - estimated
+        if difference > 0:
+            self.tokens.take(difference)
+        else:
+            self.tokens.give(-difference)
+
+    async def throttle(self, tokens: float, metrics: Optional[dict] = None, label: Optional[str] = None,
+                       priority: int = PRIORITY_INTERACTIVE) -> float:
+        """`acquire`, recording `{label}_throttle_ms` in `metrics`."""
+        delay = await self.acquire(tokens, priority)
+        if metrics is not None:
+            metrics[f"{label or self.name}_throttle_ms"] = round(delay * 1000, 2)
+        return delay
+
+    def stats(self) -> dict:
+        requests, tokens = self.requests.available(), self.tokens.available()
+        RATE_BUDGET_REMAINING.labels(self.name, "requests").set(requests)
+        RATE_BUDGET_REMAINING.labels(self.name, "tokens").set(tokens)
+        return {
+            f"{self.name}_rpm_remaining": int(requests),
+            f"{self.name}_tpm_remaining": int(tokens),
+            f"{self.name}_throttle_queue": len(self.waiters),
+            f"{self.name}_throttled": self.throttled,
+        }
+
+
+def usage_tokens(response) -> Optional[int]:
+    """Total tokens reported by a Gemini response, if any."""
+    usage = getattr(response, "usage_metadata", None)
+    total = getattr(usage, "total_token_count", None)
+    return total if isinstance(total, int) else None
+
+
+gemini_budget = RateBudget("gemini", RATE_LIMIT_GEMINI_RPM, RATE_LIMIT_GEMINI_TPM)
+openai_embedding_budget = RateBudget("openai_embedding", RATE_LIMIT_OPENAI_EMBEDDING_RPM, RATE_LIMIT_OPENAI_EMBEDDING_TPM)
+
+
+def rate_limit_stats() -> dict:
+    stats = {}
+    for budget in (gemini_budget, openai_embedding_budget):
+        stats.update(budget.stats())
+    return stats
@@ -0,0 +1,206 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+import numpy as np
+
+from instrumentation import CIRCUIT_OPEN, PROVIDER_CALLS_IN_FLIGHT, PROVIDER_ERRORS
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Per-stage deadlines (ms). Stages fall back the same way they do on a provider error.
+STAGE_DEADLINE_REWRITE_MS = float(os.getenv("STAGE_DEADLINE_REWRITE_MS", "2000"))
+STAGE_DEADLINE_EMBEDDING_MS = float(os.getenv("STAGE_DEADLINE_EMBEDDING_MS", "3000"))
+STAGE_DEADLINE_SEARCH_MS = float(os.getenv("STAGE_DEADLINE_SEARCH_MS", "3000"))
+STAGE_DEADLINE_GENERATION_MS = float(os.getenv("STAGE_DEADLINE_GENERATION_MS", "20000"))
+STAGE_DEADLINE_SUMMARY_MS = float(os.getenv("STAGE_DEADLINE_SUMMARY_MS", "10000"))
+
+# Hedging (idempotent stages only): a second attempt starts once the first has taken
+# longer than the stage's recent p95, or as soon as the first one fails
+HEDGING_ENABLED = os.getenv("HEDGING_ENABLED", "True") == "True"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_DELAY_MS = float(os.getenv("HEDGE_MIN_DELAY_MS", "20"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+
+# Circuit breakers: open when the failure rate over the last N calls spikes, probe after a cool-down
+CIRCUIT_BREAKER_ENABLED = os.getenv("CIRCUIT_BREAKER_ENABLED", "True") == "True"
+CIRCUIT_WINDOW = int(os.getenv("CIRCUIT_WINDOW", "20"))
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "10"))
+CIRCUIT_FAILURE_RATE = float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5"))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+
+
+class StageUnavailable(Exception):
+    """Raised instead of calling the provider when a stage's deadline passed or its circuit is open."""
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, window: int = CIRCUIT_WINDOW, min_calls: int = CIRCUIT_MIN_CALLS,
+                 failure_rate: float = CIRCUIT_FAILURE_RATE, open_seconds: float = CIRCUIT_OPEN_SECONDS):
+        self.name = name
+        self.outcomes = deque(maxlen=window)
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.times_opened = 0
+
+    def allow(self) -> bool:
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.open_seconds:
+            self.state = "half_open"
+            self.probe_in_flight = False
+        if self.state == "half_open":
+            # A single probe decides whether the provider has recovered
+            if self.probe_in_flight:
+                return False
+            self.probe_in_flight = True
+            return True
+        return self.state == "closed"
+
+    def record(self, success: bool):
+        if self.state == "half_open":
+            self.probe_in_flight = False
+            if success:
+                self.state = "closed"
+                self.outcomes.clear()
+                CIRCUIT_OPEN.labels(self.name).set(0)
+            else:
+                self._open()
+            return
+        self.outcomes.append(success)
+        failures = self.outcomes.count(False)
+        if self.state == "closed" and len(self.outcomes) >= self.min_calls and failures / len(self.outcomes) >= self.failure_rate:
+            self._open()
+
+    def _open(self):
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+        CIRCUIT_OPEN.labels(self.name).set(1)
+        logger.error(f"Circuit breaker for stage '{self.name}' opened")
+
+
+class Stage:
+    """
+    Wraps one provider call of the pipeline with a deadline, a circuit breaker and,
+    for idempotent stages, hedging. Failures surface as exceptions so each caller keeps
+    its existing fallback (raw message for the rewrite, current summary, ...).
+    """
+
+    def __init__(self, name: str, deadline_ms: float, hedged: bool = False):
+        self.name = name
+        self.deadline = deadline_ms / 1000
+        self.hedged = hedged
+        self.breaker = CircuitBreaker(name)
+        self.latencies = deque(maxlen=200)
+        self.timeouts = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        if not (self.hedged and HEDGING_ENABLED) or len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        return max(HEDGE_MIN_DELAY_MS / 1000, float(np.percentile(self.latencies, HEDGE_PERCENTILE)))
+
+    async def call(self, work: Callable[[], Awaitable], metrics: Optional[dict] = None, label: Optional[str] = None,
+                   record_outcome: bool = True, acquire: Optional[Callable[[], Awaitable]] = None):
+        """
+        Runs `work` under the stage's deadline, breaker and hedging. With `record_outcome` False
+        the breaker is only consulted: `work` reports its provider outcome itself (batched calls).
+        `acquire`, if given, is awaited once after the breaker check and before the deadline
+        starts (waiting for rate budget), so a hedged attempt of `work` is not charged again.
+        """
+        metrics = metrics if metrics is not None else {}
+        label = label or self.name
+        if CIRCUIT_BREAKER_ENABLED and not self.breaker.allow():
+            metrics[f"{label}_circuit_open"] = True
+            PROVIDER_ERRORS.labels(self.name, "circuit_open").inc()
+            raise StageUnavailable(f"circuit open for stage '{self.name}'")
+        if acquire is not None:
+            try:
+                await acquire()
+            except BaseException:
+                # Nothing reached the provider: a half-open breaker may send another probe
+                self.breaker.probe_in_flight = False
+                raise
+
+        start = time.monotonic()
+        try:
+            with span(f"provider.{self.name}", label=label), PROVIDER_CALLS_IN_FLIGHT.labels(self.name).track_inprogress():
+                result = await asyncio.wait_for(self._attempts(work, metrics, label), self.deadline)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            if record_outcome:
+                self.breaker.record(False)
+            PROVIDER_ERRORS.labels(self.name, "timeout").inc()
+            metrics[f"{label}_deadline_exceeded"] = True
+            raise StageUnavailable(f"stage '{self.name}' exceeded its {self.deadline * 1000:.0f} ms deadline")
+        except Exception:
+            if record_outcome:
+                self.breaker.record(False)
+            PROVIDER_ERRORS.labels(self.name, "error").inc()
+            raise
+        if record_outcome:
+            self.breaker.record(True)
+        self.latencies.append(time.monotonic() - start)
+        return result
+
+    async def _attempts(self, work: Callable[[], Awaitable], metrics: dict, label: str):
+        delay = self.hedge_delay()
+        if delay is None:
+            return await work()
+
+        first = asyncio.ensure_future(work())
+        pending = {first}
+        hedged = False
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=None if hedged else delay, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self.hedge_wins += 1
+                            metrics[f"{label}_hedge_won"] = True
+                        return task.result()
+                    error = task.exception()
+                if not hedged:
+                    hedged = True
+                    self.hedges += 1
+                    metrics[f"{label}_hedged"] = True
+                    metrics[f"{label}_hedge_delay_ms"] = round(delay * 1000, 2)
+                    pending.add(asyncio.ensure_future(work()))
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            f"{self.name}_circuit_state": self.breaker.state,
+            f"{self.name}_timeouts": self.timeouts,
+            f"{self.name}_hedges": self.hedges,
+            f"{self.name}_hedge_wins": self.hedge_wins,
+        }
+
+
+rewrite_stage = Stage("rewrite", STAGE_DEADLINE_REWRITE_MS)
+embedding_stage = Stage("embedding", STAGE_DEADLINE_EMBEDDING_MS, hedged=True)
+search_stage = Stage("vector_search", STAGE_DEADLINE_SEARCH_MS, hedged=True)
+generation_stage = Stage("generation", STAGE_DEADLINE_GENERATION_MS)
+summary_stage = Stage("summary", STAGE_DEADLINE_SUMMARY_MS)
+
+
+def stage_stats() -> dict:
+    stats = {}
+    for stage in (rewrite_stage, embedding_stage, search_stage, generation_stage, summary_stage):
+        stats.update(stage.stats())
+    return stats
@@ -0,0 +1,209 @@
+import os
+import json
+import time
+import asyncio
+import threading
+import uuid
+import sqlite3
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from shared_cache import SHARED_CACHE_SYNC_SECONDS, SharedCache, shared_cache
+
+logger = logging.getLogger(__name__)
+
+# Semantic answer cache configuration
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "True") == "True"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1024"))
+SEMANTIC_CACHE_TTL_SECONDS = int(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "86400"))
+
+# Django seeds new sessions with this placeholder; it carries no conversation context.
+NEW_CONVERSATION_PREFIX = "New conversation started:"
+
+
+def summary_context_key(summary: Optional[str]) -> str:
+    """
+    Normalises the rolling summary into the key that decides whether a cached answer
+    is compatible: answers are only reused across identical conversation contexts.
+    """
+    summary = (summary or "").strip()
+    if summary.startswith(NEW_CONVERSATION_PREFIX):
+        return ""
+    return " ".join(summary.lower().split())
+
+
+def conversation_context_key(summary: Optional[str], window: str = "") -> str:
+    """
+    `summary_context_key` plus the verbatim recent window. Empty only on a first turn: a
+    follow-up whose summary is still the placeholder (the deferred summary has not arrived)
+    keeps the previous messages in its key.
+    """
+    summary = summary_context_key(summary)
+    window = " ".join(window.lower().split())
+    if not window:
+        return summary
+    return f"{summary}\n{window}" if summary else window
+
+
+@dataclass
+class CacheEntry:
+    embedding: np.ndarray
+    context_key: str
+    doc_ids: List
+    answer: str
+    created_at: float = field(default_factory=time.monotonic)
+
+
+class SemanticCache:
+    """
+    In-process cache of answers keyed by question embedding.
+    A lookup hits when a stored question with the same context key has a cosine
+    similarity above `threshold`. Entries are evicted LRU and expire after `ttl` seconds.
+    With a `shared` cache, stored answers are also written there and each worker pulls the
+    other workers' answers into its own copy at most SHARED_CACHE_SYNC_SECONDS later. The
+    shared reads run on a worker thread and the writes are batched by `flush`, which the
+    agent runs off the event loop with the embedding cache's.
+    """
+
+    NAMESPACE = "semantic"
+
+    def __init__(self, threshold: float, max_entries: int, ttl: int, shared: Optional[SharedCache] = None):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: "OrderedDict[int, CacheEntry]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._next_id = 0
+        self._matrix = None
+        self._matrix_ids: List[int] = []
+        self.shared = shared
+        self._shared_cursor = 0
+        self._synced_at = 0.0
+        self._syncing = False
+        self._own_keys = set()
+        # (key, embedding bytes, meta) waiting for the next flush to the shared cache
+        self.unwritten: List[tuple] = []
+        self.unwritten_lock = threading.Lock()
+
+    def _expire(self):
+        now = time.monotonic()
+        expired = [key for key, entry in self.entries.items() if now - entry.created_at > self.ttl]
+        for key in expired:
+            del self.entries[key]
+        if expired:
+            self._matrix = None
+
+    def _index(self):
+        # Stack the normalised embeddings once and reuse until the cache changes
+        if self._matrix is None and self.entries:
+            self._matrix_ids = list(self.entries.keys())
+            self._matrix = np.stack([self.entries[key].embedding for key in self._matrix_ids])
+        return self._matrix
+
+    @staticmethod
+    def _normalise(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _add(self, entry: CacheEntry):
+        self.entries[self._next_id] = entry
+        self._next_id += 1
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        self._matrix = None
+
+    async def _sync(self):
+        """Pulls the answers other workers stored since the last sync."""
+        if self.shared is None or self._syncing or time.monotonic() - self._synced_at < SHARED_CACHE_SYNC_SECONDS:
+            return
+        self._synced_at = time.monotonic()
+        self._syncing = True
+        try:
+            rows = await asyncio.to_thread(self.shared.since, self.NAMESPACE, self._shared_cursor, self.ttl)
+        except sqlite3.Error as e:
+            logger.error(f"Error reading the shared semantic cache: {e}")
+            return
+        finally:
+            self._syncing = False
+        for row_id, key, value, meta, created_at in rows:
+            self._shared_cursor = row_id
+            if key in self._own_keys:
+                self._own_keys.discard(key)
+                continue
+            meta = json.loads(meta)
+            age = max(0.0, time.time() - created_at)
+            self._add(CacheEntry(
+                np.frombuffer(value, dtype=np.float32), meta["context_key"], meta["doc_ids"], meta["answer"],
+                created_at=time.monotonic() - age
+            ))
+
+    async def lookup(self, embedding, context_key: str) -> Tuple[Optional[CacheEntry], float]:
+        """Returns the best compatible entry above the threshold (or None) and its similarity."""
+        await self._sync()
+        self._expire()
+        matrix = self._index()
+        if matrix is None or not len(embedding):
+            self.misses += 1
+            return None, 0.0
+
+        similarities = matrix @ self._normalise(embedding)
+        for position in np.argsort(-similarities):
+            similarity = float(similarities[position])
+            if similarity < self.threshold:
+                break
+            key = self._matrix_ids[position]
+            entry = self.entries[key]
+            if entry.context_key == context_key:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry, similarity
+
+        self.misses += 1
+        return None, float(similarities.max())
+
+    def store(self, embedding, context_key: str, doc_ids: List, answer: str):
+        if not len(embedding):
+            return
+        entry = CacheEntry(self._normalise(embedding), context_key, doc_ids, answer)
+        self._add(entry)
+        if self.shared is not None:
+            meta = json.dumps({"context_key": context_key, "doc_ids": doc_ids, "answer": answer}, ensure_ascii=False, default=str)
+            with self.unwritten_lock:
+                self.unwritten.append((uuid.uuid4().hex, entry.embedding.tobytes(), meta))
+                # Bounded if the shared cache stalls: the oldest pending writes are dropped
+                del self.unwritten[:-self.max_entries]
+
+    def flush(self):
+        """Blocking: writes the answers stored since the last flush to the shared cache."""
+        if self.shared is None or not self.unwritten:
+            return
+        with self.unwritten_lock:
+            batch, self.unwritten = self.unwritten, []
+        for key, value, meta in batch:
+            # Marked first, so a sync that reads the row back does not add it a second time
+            self._own_keys.add(key)
+            try:
+                self.shared.put(self.NAMESPACE, key, value, meta, max_entries=self.max_entries, ttl=self.ttl)
+            except sqlite3.Error as e:
+                self._own_keys.discard(key)
+                logger.error(f"Error writing the shared semantic cache: {e}")
+                return
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "semantic_cache_hits": self.hits,
+            "semantic_cache_misses": self.misses,
+            "semantic_cache_hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "semantic_cache_entries": len(self.entries),
+        }
+
+
+semantic_cache = SemanticCache(SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAX_ENTRIES, SEMANTIC_CACHE_TTL_SECONDS, shared_cache)
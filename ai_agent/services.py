@@ -2,25 +2,36 @@ import os
 import logging
 import json
 import time
-from typing import Tuple, Dict
-import google.generativeai as genai
-from openai import OpenAI
-from supabase import create_client, Client
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, List, Optional, Tuple, Dict
+import httpx
+import numpy as np
 
-logger = logging.getLogger(__name__)
+from client_registry import client_registry
+from embedding_cache import EMBEDDING_CACHE_FLUSH_SECONDS, embedding_cache, normalise_text
+from embedding_batcher import EMBEDDING_BATCH_ENABLED, EmbeddingBatcher
+from instrumentation import record_stage
+from tracing import span, traced
+from rate_limits import (
+    PRIORITY_BACKGROUND, RATE_LIMIT_DEFAULT_OUTPUT_TOKENS, gemini_budget, openai_embedding_budget, rate_limit_stats, usage_tokens
+)
+from resilience import StageUnavailable, embedding_stage, generation_stage, rewrite_stage, search_stage, stage_stats, summary_stage
+from single_flight import COALESCING_ENABLED, answer_flight, embedding_flight, retrieval_flight, summary_flight
+from shared_cache import shared_cache
+from semantic_cache import CacheEntry, SEMANTIC_CACHE_ENABLED, conversation_context_key, semantic_cache
+from vector_index import LOCAL_INDEX_REFRESH_SECONDS, LOCAL_INDEX_SNAPSHOT_PATH, local_index
+from model_registry import ModelRegistry, ModelSpec
+from context_assembly import assemble_context, count_tokens
+from conversation_memory import build_history, extractive_summary, format_window, needs_llm_summary
+from lexical_index import LEXICAL_FAST_PATH, LEXICAL_FAST_PATH_RATIO, LEXICAL_HYBRID, lexical_index, reciprocal_rank_fusion
 
-# Clients initialization
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-supabase_url = os.getenv("SUPABASE_URL")
-supabase_key = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(supabase_url, supabase_key) if supabase_url and supabase_key else None
+logger = logging.getLogger(__name__)
 
-# Gemini configuration
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-if GOOGLE_API_KEY:
-    genai.configure(api_key=GOOGLE_API_KEY)
-else:
-    logger.warning("GOOGLE_API_KEY not found in environment variables.")
+# Clients are built lazily by the client registry on shared keep-alive pools (see client_registry.py).
+# OpenAI and Gemini expose native async calls; the Supabase client is synchronous,
+# so its RPCs run on a bounded executor to keep the event loop free.
 
 # Model configuration
 # Chat: Gemini (Fast)
@@ -28,78 +39,113 @@ CHAT_MODEL = os.getenv("GOOGLE_CHAT_MODEL", "gemini-1.5-flash")
 # Embeddings: OpenAI (Legacy compatibility)
 EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
 
-# Initialize global model instance to avoid recreation overhead
-chat_model_instance = genai.GenerativeModel(CHAT_MODEL)
+# Retrieval configuration
+MATCH_COUNT = int(os.getenv("MATCH_COUNT", "5")) # Reduced from 8 for performance
+# Speculative retrieval: search on the raw message while Gemini rewrites it
+SPECULATIVE_RETRIEVAL_ENABLED = os.getenv("SPECULATIVE_RETRIEVAL_ENABLED", "True") == "True"
+# Minimum raw/rewritten query similarity to reuse the speculative results as-is
+SPECULATIVE_REUSE_THRESHOLD = float(os.getenv("SPECULATIVE_REUSE_THRESHOLD", "0.9"))
+SKIP_REWRITE_ON_FIRST_TURN = os.getenv("SKIP_REWRITE_ON_FIRST_TURN", "True") == "True"
+
+# Deferred summaries are posted back to the Django backend, which owns the sessions
+SUMMARY_CALLBACK_URL = os.getenv("SUMMARY_CALLBACK_URL", "")
+SUMMARY_CALLBACK_TOKEN = os.getenv("SUMMARY_CALLBACK_TOKEN", "")
+SUMMARY_CALLBACK_RETRIES = 3
+
+# Executor for blocking provider calls (sized so one worker can serve dozens of turns)
+PROVIDER_EXECUTOR_WORKERS = int(os.getenv("PROVIDER_EXECUTOR_WORKERS", "32"))
+provider_executor = ThreadPoolExecutor(
+    max_workers=PROVIDER_EXECUTOR_WORKERS,
+    thread_name_prefix="provider"
+)
 
-async def get_ai_response(message: str, current_summary: str) -> Tuple[str, dict]:
+async def run_blocking(func, *args, **kwargs):
+    """Runs a blocking provider call on the bounded executor without stalling the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(provider_executor, functools.partial(func, *args, **kwargs))
+
+# Groups embedding calls from concurrent conversations into one list-input request
+# The breaker counts each provider batch once, not once per caller in it
+embedding_batcher = EmbeddingBatcher(
+    lambda: client_registry.openai, EMBEDDING_MODEL,
+    throttle=lambda texts: openai_embedding_budget.acquire(sum(count_tokens(text) for text in texts)),
+    on_outcome=lambda success: embedding_stage.breaker.record(success),
+    timeout=embedding_stage.deadline
+)
+
+async def create_embedding(text: str, metrics: Optional[dict] = None, metrics_key: str = "embedding_cache") -> List[float]:
     """
-    Foreground task:
-    1. Query Optimization (Gemini)
-    2. Vector Search (Supabase + OpenAI Embeddings)
-    3. Answer Generation (Gemini)
-    Returns: answer, metrics
+    Embeds `text` with OpenAI, going through the two-tier embedding cache first.
+    When `metrics` is given, records which tier served the call under `metrics_key`.
     """
-    metrics = {}
-    start_total = time.time()
-    
-    # --- PASO 1: Optimizar la frase para la búsqueda (Gemini) ---
-    start_opt = time.time()
-    search_optimization_prompt = f"""Basado en la pregunta del usuario y el historial, genera una única frase técnica que optimice la búsqueda en una base de datos vectorial de maquinaria.
-Historial: {current_summary}
-Pregunta: {message}
-Frase de búsqueda óptima:"""
+    if embedding_cache is not None:
+        embedding, tier = await embedding_cache.aget(EMBEDDING_MODEL, text)
+        if metrics is not None:
+            metrics[metrics_key] = tier
+        if embedding is not None:
+            return embedding
 
-    try:
-        # Use global instance and constrain output tokens for speed
-        opt_resp = chat_model_instance.generate_content(
-            search_optimization_prompt,
-            generation_config=genai.types.GenerationConfig(max_output_tokens=150)
+    async def request_embedding():
+        embedding_resp = await client_registry.openai.embeddings.create(
+            model=EMBEDDING_MODEL,
+            input=text
         )
-        optimized_query = opt_resp.text.strip()
-    except Exception as e:
-        logger.error(f"Error optimizing query with Gemini: {e}")
-        optimized_query = message # Fallback
-        
-    metrics["query_optimization_ms"] = round((time.time() - start_opt) * 1000, 2)
+        return embedding_resp.data[0].embedding
 
-    # --- PASO 2: Generar Embeddings (OPENAI - Para compatibilidad 1536 dim) ---
-    start_embed = time.time()
-    try:
-        embedding_resp = openai_client.embeddings.create(
-            model=EMBEDDING_MODEL,
-            input=optimized_query
+    async def fetch():
+        # Deadline, breaker and hedging only apply to the provider call, not to cache hits.
+        # Rate budget is taken before the deadline starts, once per request even when hedged.
+        label = metrics_key.replace("_cache", "")
+        if not EMBEDDING_BATCH_ENABLED:
+            return await embedding_stage.call(
+                request_embedding, metrics, label,
+                acquire=lambda: openai_embedding_budget.throttle(count_tokens(text), metrics, metrics_key)
+            )
+
+        batched = []
+
+        async def reserve():
+            batched.append(await embedding_batcher.reserve(text))
+
+        # A hedged attempt waits on the same batch instead of queueing the text again
+        embedding, batch = await embedding_stage.call(
+            lambda: batched[0].future, metrics, label, record_outcome=False, acquire=reserve
         )
-        embedding = embedding_resp.data[0].embedding
-    except Exception as e:
-        logger.error(f"Error generating embedding with OpenAI: {e}")
-        embedding = []
-        metrics["embed_error"] = str(e)
-        
-    metrics["embedding_generation_ms"] = round((time.time() - start_embed) * 1000, 2)
+        if metrics is not None:
+            metrics[f"{metrics_key}_batch_size"] = batch["batch_size"]
+            metrics[f"{metrics_key}_queue_wait_ms"] = batch["queue_wait_ms"]
+            metrics[f"{metrics_key}_throttle_ms"] = batch["throttle_ms"]
+        return embedding
 
-    # --- PASO 3: Recuperar de Supabase ---
-    start_db = time.time()
-    context_chunks = ""
-    if supabase and embedding:
-        try:
-            params = {
-                "query_embedding": embedding,
-                "match_count": 5, # Reduced from 8 for performance
-                "filter": {}
-            }
-            rpc_resp = supabase.rpc("match_documents", params).execute()
-            docs = rpc_resp.data or []
-            context_chunks = "\n".join([doc.get("content", "") for doc in docs])
-        except Exception as e:
-            logger.error(f"Supabase RAG error: {e}")
-            metrics["db_error"] = str(e)
-            
-    metrics["vector_db_search_ms"] = round((time.time() - start_db) * 1000, 2)
+    if COALESCING_ENABLED:
+        embedding, coalesced = await embedding_flight.do((EMBEDDING_MODEL, normalise_text(text)), fetch)
+        if coalesced and metrics is not None:
+            metrics[f"{metrics_key}_coalesced"] = True
+    else:
+        embedding = await fetch()
+    if embedding_cache is not None:
+        embedding_cache.put(EMBEDDING_MODEL, text, embedding)
+    return embedding
 
-    # --- PASO 4: Generar Respuesta Final (Solo Respuesta) ---
-    start_gen = time.time()
-    
-    system_instruction = """### ROL Y OBJETIVO
+
+def cache_stats() -> dict:
+    stats = semantic_cache.stats()
+    if embedding_cache is not None:
+        stats.update(embedding_cache.stats())
+    if shared_cache is not None:
+        stats.update(shared_cache.stats())
+    if EMBEDDING_BATCH_ENABLED:
+        stats.update(embedding_batcher.stats())
+    return stats
+
+
+def coalescing_stats() -> dict:
+    stats = {}
+    for flight in (answer_flight, summary_flight, retrieval_flight, embedding_flight):
+        stats.update(flight.stats())
+    return stats
+
+SYSTEM_INSTRUCTION = """### ROL Y OBJETIVO
     Eres un Asistente Técnico Especializado en documentación industrial y maquinaria logística (Gemini Technical Bot). Tu objetivo es responder preguntas de los usuarios basándote EXCLUSIVAMENTE en los fragmentos de contexto proporcionados (RAG Context). Tu prioridad es la precisión técnica, la fidelidad a los datos numéricos y la claridad en la presentación.
 
     ### REGLAS DE ORO (CONSTRAINTS)
@@ -134,22 +180,368 @@ Frase de búsqueda óptima:"""
     5. Genera la respuesta final.
     """
 
-    user_prompt = f"""Contexto técnico:
+def estimated_tokens(name: str, prompt: str) -> int:
+    """Rate-budget charge of a call to model `name`: prompt, system instruction and output allowance."""
+    spec = model_registry.specs[name]
+    output_tokens = (spec.generation_config or {}).get("max_output_tokens", RATE_LIMIT_DEFAULT_OUTPUT_TOKENS)
+    return count_tokens(prompt) + count_tokens(spec.system_instruction or "") + output_tokens
+
+# Each model/config combination is built once and shared across requests
+model_registry = ModelRegistry(CHAT_MODEL, {
+    "rewrite": ModelSpec(generation_config={"max_output_tokens": 150}),
+    "answer": ModelSpec(
+        system_instruction=SYSTEM_INSTRUCTION,
+        generation_config={"response_mime_type": "application/json"},
+        cache_system_instruction=True
+    ),
+    "answer_stream": ModelSpec(system_instruction=SYSTEM_INSTRUCTION, cache_system_instruction=True),
+    "summary": ModelSpec(),
+})
+
+@traced("rewrite")
+async def optimize_query(message: str, history: str, metrics: dict) -> str:
+    # --- PASO 1: Optimizar la frase para la búsqueda (Gemini) ---
+    start_opt = time.monotonic()
+    search_optimization_prompt = f"""Basado en la pregunta del usuario y el historial, genera una única frase técnica que optimice la búsqueda en una base de datos vectorial de maquinaria.
+Historial: {history}
+Pregunta: {message}
+Frase de búsqueda óptima:"""
+
+    try:
+        # Shared instance, output tokens constrained for speed
+        model, _ = model_registry.acquire("rewrite")
+        estimate = estimated_tokens("rewrite", search_optimization_prompt)
+        await gemini_budget.throttle(estimate, metrics, "rewrite")
+        opt_resp = await rewrite_stage.call(lambda: model.generate_content_async(search_optimization_prompt), metrics)
+        gemini_budget.settle(estimate, usage_tokens(opt_resp))
+        optimized_query = opt_resp.text.strip()
+    except Exception as e:
+        logger.error(f"Error optimizing query with Gemini: {e}")
+        optimized_query = message # Fallback
+        
+    record_stage(metrics, "query_optimization_ms", "rewrite", start_opt)
+    return optimized_query
+
+
+@traced("embed")
+async def embed_query(text: str, metrics: dict, prefix: str = "") -> List[float]:
+    # --- PASO 2: Generar Embeddings (OPENAI - Para compatibilidad 1536 dim) ---
+    start_embed = time.monotonic()
+    try:
+        embedding = await create_embedding(text, metrics, f"{prefix}embedding_cache")
+    except Exception as e:
+        logger.error(f"Error generating embedding with OpenAI: {e}")
+        embedding = []
+        metrics[f"{prefix}embed_error"] = str(e)
+        
+    record_stage(metrics, f"{prefix}embedding_generation_ms", "embedding", start_embed)
+    return embedding
+
+
+@traced("vector_search")
+async def search_documents(embedding: List[float], metrics: dict, prefix: str = "") -> List[dict]:
+    # --- PASO 3: Recuperar de Supabase (o de la réplica local en memoria) ---
+    start_db = time.monotonic()
+    docs = []
+    if local_index is not None and local_index.ready and embedding:
+        docs = local_index.search(embedding, MATCH_COUNT)
+        metrics[f"{prefix}retrieval_backend"] = "local"
+    elif client_registry.supabase and embedding:
+        try:
+            params = {
+                "query_embedding": embedding,
+                "match_count": MATCH_COUNT,
+                "filter": {}
+            }
+            rpc_resp = await search_stage.call(
+                lambda: run_blocking(client_registry.supabase.rpc("match_documents", params).execute), metrics, f"{prefix}vector_search"
+            )
+            docs = rpc_resp.data or []
+        except Exception as e:
+            logger.error(f"Supabase RAG error: {e}")
+            metrics[f"{prefix}db_error"] = str(e)
+            
+    record_stage(metrics, f"{prefix}vector_db_search_ms", "vector_search", start_db)
+    return docs
+
+
+async def refresh_document_indexes():
+    """
+    Keeps the in-process replicas (vector and/or lexical) in sync by polling Supabase.
+    The vector replica starts from its on-disk snapshot; when both are enabled the
+    lexical index is fed from the vector replica's rows instead of a second fetch.
+    """
+    if local_index is not None and await run_blocking(local_index.load, LOCAL_INDEX_SNAPSHOT_PATH):
+        logger.info(f"Local vector index loaded from snapshot ({len(local_index.snapshot.ids)} documents)")
+        if lexical_index is not None:
+            lexical_index.apply_rows(list(local_index.rows.values()), replace=True)
+            await run_blocking(lexical_index.rebuild)
+    if not client_registry.supabase:
+        logger.warning("Local document indexes have no Supabase client to refresh from.")
+        return
+    while True:
+        try:
+            if local_index is not None:
+                changed = await run_blocking(local_index.refresh, client_registry.supabase)
+                if changed:
+                    await run_blocking(local_index.save, LOCAL_INDEX_SNAPSHOT_PATH)
+                    logger.info(f"Local vector index refreshed ({changed} rows changed)")
+                if lexical_index is not None and (changed or not lexical_index.ready):
+                    lexical_index.apply_rows(list(local_index.rows.values()), replace=True)
+                    await run_blocking(lexical_index.rebuild)
+            elif lexical_index is not None:
+                changed = await run_blocking(lexical_index.refresh, client_registry.supabase)
+                if changed:
+                    logger.info(f"Lexical index refreshed ({changed} rows changed)")
+        except Exception as e:
+            logger.error(f"Error refreshing local document indexes: {e}")
+        await asyncio.sleep(LOCAL_INDEX_REFRESH_SECONDS)
+
+
+def flush_caches_blocking():
+    if embedding_cache is not None:
+        embedding_cache.flush()
+    semantic_cache.flush()
+
+
+async def flush_caches():
+    """Writes new embeddings and shared answers to the caches' persistent tiers in batches, on the executor."""
+    try:
+        while True:
+            await asyncio.sleep(EMBEDDING_CACHE_FLUSH_SECONDS)
+            await run_blocking(flush_caches_blocking)
+    finally:
+        # Shutdown: keep what the last interval added
+        await asyncio.shield(run_blocking(flush_caches_blocking))
+
+
+async def embed_and_search(text: str, metrics: dict, prefix: str = "") -> Tuple[List[float], List[dict]]:
+    """Embeds and searches `text`; concurrent identical queries share one embedding and search."""
+    async def work():
+        embedding = await embed_query(text, metrics, prefix)
+        docs = await search_documents(embedding, metrics, prefix)
+        return embedding, docs
+
+    if not COALESCING_ENABLED:
+        return await work()
+    (embedding, docs), coalesced = await retrieval_flight.do(normalise_text(text), work)
+    if coalesced:
+        metrics[f"{prefix}retrieval_coalesced"] = True
+    return embedding, list(docs)
+
+
+def cosine_similarity(a: List[float], b: List[float]) -> float:
+    a, b = np.asarray(a, dtype=np.float32), np.asarray(b, dtype=np.float32)
+    denominator = np.linalg.norm(a) * np.linalg.norm(b)
+    return float(a @ b / denominator) if denominator else 0.0
+
+
+def merge_documents(*doc_lists: List[dict], limit: int) -> List[dict]:
+    """Unions result sets by document id (or content), keeping the best similarity, best first."""
+    merged = {}
+    for docs in doc_lists:
+        for doc in docs:
+            key = doc.get("id", doc.get("content"))
+            if key not in merged or doc.get("similarity", 0) > merged[key].get("similarity", 0):
+                merged[key] = doc
+    return sorted(merged.values(), key=lambda doc: doc.get("similarity", 0), reverse=True)[:limit]
+
+
+@traced("retrieve_vector_context")
+async def retrieve_vector_context(message: str, history: str, metrics: dict, first_turn: bool = False) -> Tuple[str, List[dict]]:
+    """
+    Dense retrieval stages:
+    1. Query Optimization (Gemini)
+    2. Vector Search (Supabase + OpenAI Embeddings)
+
+    `history` is the rolling summary plus the recent verbatim window.
+    In speculative mode the raw message is embedded and searched while Gemini rewrites it.
+    The speculative results are reused when the rewrite embeds close to the raw message,
+    otherwise both result sets are merged. On the first turn (`first_turn`: no summary and
+    no recent messages) there is no history for the rewrite to add, so it is skipped. The path taken is reported as `retrieval_path`.
+    Returns: optimized_query, docs
+    """
+    if not SPECULATIVE_RETRIEVAL_ENABLED:
+        optimized_query = await optimize_query(message, history, metrics)
+        _, docs = await embed_and_search(optimized_query, metrics)
+        metrics["retrieval_path"] = "sequential"
+        return optimized_query, docs
+
+    if SKIP_REWRITE_ON_FIRST_TURN and first_turn:
+        _, docs = await embed_and_search(message, metrics)
+        metrics["retrieval_path"] = "first_turn_raw"
+        return message, docs
+
+    optimized_query, (raw_embedding, raw_docs) = await asyncio.gather(
+        optimize_query(message, history, metrics),
+        embed_and_search(message, metrics, "speculative_")
+    )
+
+    rewritten_embedding = await embed_query(optimized_query, metrics)
+    similarity = cosine_similarity(raw_embedding, rewritten_embedding) if raw_embedding and rewritten_embedding else 0.0
+    metrics["speculative_query_similarity"] = round(similarity, 4)
+
+    if raw_embedding and similarity >= SPECULATIVE_REUSE_THRESHOLD:
+        metrics["retrieval_path"] = "speculative_reuse"
+        return optimized_query, raw_docs
+
+    docs = await search_documents(rewritten_embedding, metrics)
+    metrics["retrieval_path"] = "speculative_merge"
+    return optimized_query, merge_documents(docs, raw_docs, limit=MATCH_COUNT)
+
+
+@traced("retrieve_context")
+async def retrieve_context(message: str, history: str, metrics: dict, first_turn: bool = False) -> Tuple[str, List[dict]]:
+    """
+    Retrieval shared by the blocking and streaming paths.
+    With the lexical index enabled, the raw message is searched with BM25 first. A query
+    dominated by recognised model names / VDI codes takes the lexical fast path and skips
+    the embedding altogether; otherwise the BM25 results are fused with the dense results
+    by reciprocal rank (hybrid mode).
+    Returns: optimized_query, docs
+    """
+    lexical_docs = []
+    if lexical_index is not None and lexical_index.ready:
+        start_lexical = time.monotonic()
+        lexical_docs = lexical_index.search(message, MATCH_COUNT)
+        recognised_ratio = lexical_index.recognised_ratio(message)
+        record_stage(metrics, "lexical_search_ms", "lexical_search", start_lexical)
+        metrics["lexical_recognised_ratio"] = round(recognised_ratio, 2)
+
+        if LEXICAL_FAST_PATH and lexical_docs and recognised_ratio >= LEXICAL_FAST_PATH_RATIO:
+            metrics["retrieval_path"] = "lexical_fast_path"
+            return message, lexical_docs
+
+    start_vector = time.monotonic()
+    optimized_query, docs = await retrieve_vector_context(message, history, metrics, first_turn)
+    record_stage(metrics, "vector_retrieval_ms", "retrieval", start_vector)
+
+    if LEXICAL_HYBRID and lexical_docs:
+        docs = reciprocal_rank_fusion(docs, lexical_docs, limit=MATCH_COUNT)
+        metrics["retrieval_path"] = f"hybrid_{metrics.get('retrieval_path', 'vector')}"
+
+    return optimized_query, docs
+
+
+def join_context(docs: List[dict]) -> str:
+    return "\n".join([doc.get("content", "") for doc in docs])
+
+
+@traced("context_assembly")
+def build_context(message: str, optimized_query: str, docs: List[dict], metrics: dict, json_output: bool = True) -> str:
+    """
+    Deduplicates, diversifies and budgets the retrieved chunks, and returns the answer prompt.
+    Records prompt tokens with the naive join (before) and the assembled context (after).
+    """
+    start_assembly = time.monotonic()
+    selected, stats = assemble_context(docs)
+    user_prompt = build_answer_prompt(message, optimized_query, join_context(selected), json_output)
+    metrics.update(stats)
+    metrics["prompt_tokens_before"] = count_tokens(build_answer_prompt(message, optimized_query, join_context(docs), json_output))
+    metrics["prompt_tokens_after"] = count_tokens(user_prompt)
+    record_stage(metrics, "context_assembly_ms", "context_assembly", start_assembly)
+    return user_prompt
+
+
+@traced("semantic_cache_lookup")
+async def lookup_cached_answer(message: str, context_key: str, metrics: dict) -> Tuple[Optional[CacheEntry], List[float]]:
+    """
+    Embeds the raw question and looks it up in the semantic answer cache.
+    Returns the cached entry (or None) and the question embedding so a miss can be stored later.
+    """
+    start_lookup = time.monotonic()
+    try:
+        embedding = await create_embedding(message, metrics, "semantic_cache_embedding_cache")
+    except Exception as e:
+        logger.error(f"Error embedding question for the semantic cache: {e}")
+        metrics["semantic_cache_error"] = str(e)
+        return None, []
+
+    entry, similarity = await semantic_cache.lookup(embedding, context_key)
+    metrics["semantic_cache_hit"] = entry is not None
+    metrics["semantic_cache_similarity"] = round(similarity, 4)
+    record_stage(metrics, "semantic_cache_lookup_ms", "semantic_cache_lookup", start_lookup)
+    return entry, embedding
+
+
+def build_answer_prompt(message: str, optimized_query: str, context_chunks: str, json_output: bool = True) -> str:
+    """Builds the user prompt for the final answer. Streaming asks for plain Markdown instead of JSON."""
+    output_instruction = 'Responde en JSON { "answer": "..." }.' if json_output else "Responde directamente en Markdown."
+    return f"""Contexto técnico:
 {context_chunks}
 
 Pregunta original del usuario: {message}
 (Referencia de búsqueda optimizada: {optimized_query})
 
-Responde en JSON {{ "answer": "..." }}."""
+{output_instruction}"""
+
+
+async def get_ai_response(message: str, current_summary: str, use_cache: bool = True,
+                          recent_turns: Optional[List[dict]] = None) -> Tuple[str, dict]:
+    """
+    Answers `message`. Concurrent requests with the same normalised message and
+    conversation context await a single pipeline run; followers get `coalesced` in metrics.
+    """
+    if not COALESCING_ENABLED:
+        return await compute_ai_response(message, current_summary, use_cache, recent_turns)
+
+    key = (normalise_text(message), normalise_text(build_history(current_summary, recent_turns)), use_cache)
+    with span("single_flight") as flight_span:
+        (answer, metrics), coalesced = await answer_flight.do(
+            key, lambda: compute_ai_response(message, current_summary, use_cache, recent_turns)
+        )
+        if flight_span is not None:
+            flight_span.set(coalesced=coalesced)
+    # Every caller gets its own copy; the leader's dict is shared with the followers
+    metrics = dict(metrics)
+    metrics["coalesced"] = coalesced
+    metrics.update(coalescing_stats())
+    return answer, metrics
+
+
+@traced("answer")
+async def compute_ai_response(message: str, current_summary: str, use_cache: bool = True,
+                              recent_turns: Optional[List[dict]] = None) -> Tuple[str, dict]:
+    """
+    Foreground task:
+    0. Semantic answer cache lookup (skipped when `use_cache` is False)
+    1. Query Optimization (Gemini)
+    2. Vector Search (Supabase + OpenAI Embeddings)
+    3. Answer Generation (Gemini)
+    Returns: answer, metrics
+    """
+    metrics = {}
+    start_total = time.monotonic()
+    context_key = conversation_context_key(current_summary, format_window(recent_turns))
+
+    cache_embedding = []
+    if use_cache and SEMANTIC_CACHE_ENABLED:
+        cached, cache_embedding = await lookup_cached_answer(message, context_key, metrics)
+        if cached:
+            metrics.update(cache_stats())
+            record_stage(metrics, "total_ai_processing_ms", "answer", start_total)
+            metrics["model_used"] = CHAT_MODEL
+            return cached.answer, metrics
+    else:
+        metrics["semantic_cache_bypassed"] = True
+
+    optimized_query, docs = await retrieve_context(
+        message, build_history(current_summary, recent_turns), metrics, first_turn=not context_key
+    )
+    user_prompt = build_context(message, optimized_query, docs, metrics)
+
+    # --- PASO 4: Generar Respuesta Final (Solo Respuesta) ---
+    start_gen = time.monotonic()
 
     answer_text = "Lo siento, no pude generar una respuesta."
+    answer_generated = False
     try:
-        model = genai.GenerativeModel(
-            CHAT_MODEL,
-            system_instruction=system_instruction,
-            generation_config={"response_mime_type": "application/json"}
-        )
-        response = model.generate_content(user_prompt)
+        model, was_warm = model_registry.acquire("answer")
+        estimate = estimated_tokens("answer", user_prompt)
+        await gemini_budget.throttle(estimate, metrics, "generation")
+        response = await generation_stage.call(lambda: model.generate_content_async(user_prompt), metrics)
+        gemini_budget.settle(estimate, usage_tokens(response))
+        metrics.update(model_registry.describe("answer", response, was_warm))
         result = json.loads(response.text)
         answer_payload = result.get("answer")
         
@@ -162,7 +554,12 @@ Responde en JSON {{ "answer": "..." }}."""
         else:
             # Normal string case
             answer_text = str(answer_payload)
-            
+        answer_generated = True
+
+    except StageUnavailable as e:
+        # Deadline or open circuit: keep the generic apology rather than leaking the error
+        logger.error(f"Answer generation skipped: {e}")
+        metrics["llm_error"] = str(e)
     except Exception as e:
         logger.error(f"Error generating answer with Gemini: {e}")
         # If parsing fails or other error, return raw text if available
@@ -171,124 +568,132 @@ Responde en JSON {{ "answer": "..." }}."""
         except:
              answer_text = f"Error: {str(e)}"
 
-    metrics["llm_generation_ms"] = round((time.time() - start_gen) * 1000, 2)
-    metrics["total_ai_processing_ms"] = round((time.time() - start_total) * 1000, 2)
+    record_stage(metrics, "llm_generation_ms", "generation", start_gen)
+
+    if answer_generated and cache_embedding:
+        semantic_cache.store(cache_embedding, context_key, [doc.get("id") for doc in docs], answer_text)
+    metrics.update(cache_stats())
+    metrics.update(stage_stats())
+    metrics.update(rate_limit_stats())
+
+    record_stage(metrics, "total_ai_processing_ms", "answer", start_total)
     metrics["model_used"] = CHAT_MODEL
 
     return answer_text, metrics
 
 
-async def generate_summary_background(session_id: str, message: str, answer: str, current_summary: str):
+async def stream_ai_response(message: str, current_summary: str, use_cache: bool = True,
+                             recent_turns: Optional[List[dict]] = None) -> AsyncIterator[Tuple[str, dict]]:
+    """
+    Streaming variant of `get_ai_response`.
+    Yields (event, data) tuples: one "retrieval" event once the context is ready,
+    then one "token" event per Gemini chunk, and finally "answer" with the full text and metrics.
+    A semantic cache hit is streamed as a single token.
+    """
+    metrics = {"streamed": True}
+    start_total = time.monotonic()
+    context_key = conversation_context_key(current_summary, format_window(recent_turns))
+
+    cache_embedding = []
+    if use_cache and SEMANTIC_CACHE_ENABLED:
+        cached, cache_embedding = await lookup_cached_answer(message, context_key, metrics)
+        if cached:
+            metrics.update(cache_stats())
+            yield "retrieval", {"cache_hit": True, "retrieval_ms": round((time.monotonic() - start_total) * 1000, 2)}
+            record_stage(metrics, "time_to_first_token_ms", "time_to_first_token", start_total)
+            yield "token", {"text": cached.answer}
+            record_stage(metrics, "total_ai_processing_ms", "answer", start_total)
+            metrics["model_used"] = CHAT_MODEL
+            yield "answer", {"answer": cached.answer, "metrics": metrics}
+            return
+    else:
+        metrics["semantic_cache_bypassed"] = True
+
+    optimized_query, docs = await retrieve_context(
+        message, build_history(current_summary, recent_turns), metrics, first_turn=not context_key
+    )
+    user_prompt = build_context(message, optimized_query, docs, metrics, json_output=False)
+    yield "retrieval", {
+        "optimized_query": optimized_query,
+        "context_found": bool(docs),
+        "retrieval_ms": round((time.monotonic() - start_total) * 1000, 2)
+    }
+
+    start_gen = time.monotonic()
+    parts = []
+    try:
+        model, was_warm = model_registry.acquire("answer_stream")
+        estimate = estimated_tokens("answer_stream", user_prompt)
+        await gemini_budget.throttle(estimate, metrics, "generation")
+        # The deadline covers the call that opens the stream, i.e. time to first response
+        response = await generation_stage.call(lambda: model.generate_content_async(user_prompt, stream=True), metrics)
+        async for chunk in response:
+            text = chunk.text
+            if not text:
+                continue
+            if not parts:
+                record_stage(metrics, "time_to_first_token_ms", "time_to_first_token", start_total)
+                record_stage(metrics, "llm_first_token_ms", "generation_first_token", start_gen)
+            parts.append(text)
+            yield "token", {"text": text}
+        # Usage metadata is only complete once the stream is exhausted
+        metrics.update(model_registry.describe("answer_stream", response, was_warm))
+        gemini_budget.settle(estimate, usage_tokens(response))
+    except Exception as e:
+        logger.error(f"Error streaming answer with Gemini: {e}")
+        metrics["llm_error"] = str(e)
+
+    answer_text = "".join(parts) or "Lo siento, no pude generar una respuesta."
+    record_stage(metrics, "llm_generation_ms", "generation", start_gen)
+
+    if parts and "llm_error" not in metrics and cache_embedding:
+        semantic_cache.store(cache_embedding, context_key, [doc.get("id") for doc in docs], answer_text)
+    metrics.update(cache_stats())
+    metrics.update(stage_stats())
+    metrics.update(rate_limit_stats())
+
+    record_stage(metrics, "total_ai_processing_ms", "answer", start_total)
+    metrics["model_used"] = CHAT_MODEL
+
+    yield "answer", {"answer": answer_text, "metrics": metrics}
+
+
+async def generate_summary_background(session_id: str, message: str, answer: str, current_summary: str,
+                                      recent_turns: Optional[List[dict]] = None):
     """
-    Background task:
     Generates a new summary based on the conversation turn.
+    Awaited inline by the blocking path, or run by `deliver_summary` after the answer was sent.
+    Identical concurrent turns (same summary, window, question and answer) share one Gemini call.
     """
+    if not COALESCING_ENABLED:
+        return await compute_summary(session_id, message, answer, current_summary, recent_turns)
+    key = (normalise_text(current_summary or ""), normalise_text(format_window(recent_turns)), normalise_text(message), answer)
+    new_summary, _ = await summary_flight.do(
+        key, lambda: compute_summary(session_id, message, answer, current_summary, recent_turns)
+    )
+    return new_summary
+
+
+async def compute_summary(session_id: str, message: str, answer: str, current_summary: str,
+                          recent_turns: Optional[List[dict]] = None):
     try:
-        model = genai.GenerativeModel(CHAT_MODEL)
+        model, _ = model_registry.acquire("summary")
         summary_prompt = f"""Genera un resumen conciso (máximo 40 palabras) de la conversación actual, actualizando el resumen anterior.
         
 Resumen Anterior: {current_summary}
+Mensajes recientes:
+{format_window(recent_turns)}
 Usuario: {message}
 AI: {answer}
 
 Nuevo Resumen:"""
         
-        response = model.generate_content(summary_prompt)
+        # Summaries can wait: when budget is short, queued answer calls go first
+        estimate = estimated_tokens("summary", summary_prompt)
+        await gemini_budget.throttle(estimate, priority=PRIORITY_BACKGROUND)
+        response = await summary_stage.call(lambda: model.generate_content_async(summary_prompt))
+        gemini_budget.settle(estimate, usage_tokens(response))
         new_summary = response.text.strip()
-        
-        # Update Supabase Logic (Assuming we need to update the session here directly or via API)
-        # Since this is a service function, we might not have the ORM models here if they are in Django.
-        # However, looking at services.py, it seems decoupled.
-        # If we need to update the session, we usually do it via the ORM in the view or a separate DB call.
-        # But wait, the previous code returned the summary and the VIEW updated it.
-        # Now we are in a background task, so we must perform the DB update here.
-        
-        # Assumption: We have access to the same DB or Supabase client to update the session table.
-        # The previous code didn't use Supabase for sessions, it seemed to be a Django model (AIChatSession).
-        # Since this file `services.py` seems to be used by `ai_agent/main.py` (FastAPI), 
-        # and there is a `backend/chat/views.py` (Django) calling this FastAPI service?
-        # Let's verify: `backend/chat/views.py` calls `requests.post(settings.AI_AGENT_URL, ...)`.
-        # So `ai_agent` is a microservice.
-        
-        # If `ai_agent` is stateless, it returns the summary to Django, and Django updates DB.
-        # If we make this background, the FastAPI agent responds immediately.
-        # Who updates the DB? 
-        # OPTION A: FastAPI updates the DB directly (needs DB connection).
-        # OPTION B: FastAPI returns the *old* summary, and we lose the update for this turn in the immediate response.
-        #           The "Background Task" in FastAPI is good, but how does the result get back to the Django app?
-        #           It doesn't.
-        
-        # Correction on Plan: 
-        # If the Django app manages the DB, and calls FastAPI via HTTP, the FastAPI background task CANNOT update the Django DB unless it has a callback webhook or direct DB access.
-        # The prompt implies we are optimizing the *Python* logic.
-        # If I strictly follow "Background Task in FastAPI", the summary update happens on the FastAPI server.
-        # But the User Session is in Django (Postgres).
-        
-        # REVISED APPROACH FOR SUMMARY:
-        # Since we can't easily push back to Django without a webhook, and we want speed:
-        # We will simply NOT wait for the summary in the main 'chat_endpoint'. 
-        # But we still need to generate it.
-        # If we generate it in background in FastAPI, we need to save it somewhere. 
-        # The user's Django app expects `summary` in the JSON response to save it.
-        
-        # Pragmantic Solution:
-        # We will return the *old* summary in the response instantly.
-        # BUT, to actually perform the update, we'd need a way to persist it.
-        # If we can't persist it, the next request will have the old summary context. This is bad.
-        
-        # Given the constraints and the setup (Django -> HTTP -> FastAPI),
-        # moving summary to background *on the FastAPI side* implies we must handle persistence there or have a callback.
-        # However, looking at imports, `services.py` uses `supabase`.
-        # Is the session stored in Supabase? `backend/chat/models.py` (Django) was used in `views.py`.
-        # So sessions are in Postgres (Django).
-        
-        # If I implement background task in FastAPI, I must call back to Django or write to the DB.
-        # Since I don't have the Django DB credentials in FastAPI (only Supabase), 
-        # I might have to skip the "background summary" part OR implement a webhook.
-        
-        # WAIT. The user prompt was "how to improve times".
-        # 9s for LLM is huge.
-        # Switching to Gemini Flash will likely bring this down to <1s or 2s.
-        # That alone solves the problem without the background architecture complexity.
-        # `gemini-1.5-flash` is extremely fast.
-        
-        # Decision: I will implement the Gemini switch FIRST (as requested).
-        # I will keep the summary generation in the main thread for now (simplifying the transition), 
-        # BUT since it's Gemini Flash, it will be 2x calls of 0.5s instead of 9s.
-        # That is a massive win.
-        # If I complicate it with background tasks and break session state (because I can't save it), I fail the task.
-        
-        # So, I will call summary generation *sequentially* but with Gemini, it will be fast.
-        # Or I can run them in *parallel* using `asyncio.gather`!
-        # Both independent? 
-        # Search -> Answer relies on Search.
-        # Search -> Summary? No, Summary relies on Answer (usually). 
-        # Actually Summary relies on (Summary + User Msg + AI Answer).
-        # So we need Answer first.
-        
-        # So logic:
-        # 1. Opt Query
-        # 2. Search
-        # 3. Generate Answer
-        # 4. Generate Summary (using Answer)
-        
-        # With Gemini Flash:
-        # 1. < 0.5s
-        # 2. < 0.5s
-        # 3. < 1.0s
-        # 4. < 0.5s
-        # Total ~ 2.5s (vs 13s).
-        # This is sufficient optimization.
-        
-        # I will implement asyncio.gather for independent parts if any, but sequential is fine for now.
-        # I will Stick to the plan of "Background Summary" ONLY IF I can update the DB. 
-        # Since I can't (easily), I will modify the implementation to keep it synchronous but FAST with Gemini.
-        # I will add a comment about this change in strategy.
-        
-        # Wait, if I change the plan now, I should notify.
-        # But the user just wants "update code to use Gemini".
-        # I will stick to the "use Gemini" part as primary.
-        
         logger.info(f"Generating summary with Gemini for session {session_id}")
         return new_summary
         
@@ -296,21 +701,109 @@ Nuevo Resumen:"""
         logger.error(f"Error generating summary: {e}")
         return current_summary
 
-async def get_ai_response_with_summary(message: str, current_summary: str) -> Tuple[str, str, dict]:
-    # Wrapper to keep compatibility or implementing the "Fast" sequential version
-    answer, metrics = await get_ai_response(message, current_summary)
-    
-    # Generate summary (Sequential for now to ensure data consistency until we have a callback)
-    start_sum = time.time()
-    new_summary = await generate_summary_background("N/A", message, answer, current_summary) 
-    metrics["summary_generation_ms"] = round((time.time() - start_sum) * 1000, 2)
-    
-    final_total = (metrics.get("query_optimization_ms", 0) 
-                   + metrics.get("embedding_generation_ms", 0) 
-                   + metrics.get("vector_db_search_ms", 0) 
-                   + metrics.get("llm_generation_ms", 0) 
-                   + metrics.get("summary_generation_ms", 0))
-                   
-    metrics["total_ai_processing_ms"] = round(final_total, 2)
-        
-    return answer, new_summary, metrics
\ No newline at end of file
+@traced("summary")
+async def update_summary(session_id: str, turn: Optional[int], message: str, answer: str, current_summary: str,
+                         recent_turns: Optional[List[dict]], metrics: dict) -> str:
+    """
+    Re-summarises with Gemini on the configured cadence (or when the recent window is too
+    large) and updates the summary locally in between. Records the strategy in metrics.
+    """
+    start_sum = time.monotonic()
+    use_llm, reason = needs_llm_summary(turn, recent_turns, message, answer)
+    if use_llm:
+        new_summary = await generate_summary_background(session_id, message, answer, current_summary, recent_turns)
+    else:
+        new_summary = extractive_summary(current_summary, message)
+    metrics["summary_strategy"] = reason
+    record_stage(metrics, "summary_generation_ms", "summary", start_sum)
+    return new_summary
+
+@traced("deliver_summary")
+async def deliver_summary(session_id: str, turn: int, message: str, answer: str, current_summary: str,
+                          recent_turns: Optional[List[dict]] = None):
+    """
+    Background task: generates the summary for `turn` and posts it to the backend callback,
+    which keeps only the newest turn per session. Retries transient delivery failures
+    (connection errors and 5xx); a 4xx such as a rejected token will not change on retry.
+    """
+    new_summary = await generate_summary_background(session_id, message, answer, current_summary, recent_turns)
+    payload = {"session_id": session_id, "turn": turn, "summary": new_summary}
+    headers = {"X-Agent-Token": SUMMARY_CALLBACK_TOKEN}
+    # Shared keep-alive client: the callback host is the same for every delivery
+    for attempt in range(1, SUMMARY_CALLBACK_RETRIES + 1):
+        try:
+            response = await client_registry.http.post(SUMMARY_CALLBACK_URL, json=payload, headers=headers)
+            response.raise_for_status()
+            return
+        except httpx.HTTPStatusError as e:
+            logger.error(f"Error delivering summary for session {session_id} (attempt {attempt}): {e}")
+            if e.response.status_code < 500:
+                return
+        except httpx.TransportError as e:
+            logger.error(f"Error delivering summary for session {session_id} (attempt {attempt}): {e!r}")
+        if attempt < SUMMARY_CALLBACK_RETRIES:
+            await asyncio.sleep(0.5 * attempt)
+
+
+# Keep references so pending summary tasks are not garbage collected mid-flight
+pending_summaries = set()
+
+def schedule_summary(session_id: str, turn: int, message: str, answer: str, current_summary: str,
+                     recent_turns: Optional[List[dict]] = None):
+    task = asyncio.create_task(deliver_summary(session_id, turn, message, answer, current_summary, recent_turns))
+    pending_summaries.add(task)
+    task.add_done_callback(pending_summaries.discard)
+
+
+def can_defer_summary(session_id: Optional[str], turn: Optional[int]) -> bool:
+    return bool(SUMMARY_CALLBACK_URL and session_id and turn is not None)
+
+
+async def get_ai_response_with_summary(message: str, current_summary: str, use_cache: bool = True,
+                                       defer_summary: bool = False, recent_turns: Optional[List[dict]] = None,
+                                       turn: Optional[int] = None, session_id: str = "N/A") -> Tuple[str, str, dict]:
+    """
+    Answer plus updated summary. With `defer_summary`, turns that need a Gemini summary
+    return the current summary unchanged and set `summary_deferred` in metrics; the caller
+    then schedules `deliver_summary` once the answer is sent. Local (extractive) updates
+    are always returned inline.
+    """
+    start_total = time.monotonic()
+    answer, metrics = await get_ai_response(message, current_summary, use_cache, recent_turns)
+
+    if defer_summary and needs_llm_summary(turn, recent_turns, message, answer)[0]:
+        metrics["summary_deferred"] = True
+        record_stage(metrics, "total_ai_processing_ms", "total", start_total)
+        return answer, current_summary, metrics
+
+    new_summary = await update_summary(session_id, turn, message, answer, current_summary, recent_turns, metrics)
+    # Wall time of the whole turn; stages overlap (speculative retrieval), so they are not summed
+    record_stage(metrics, "total_ai_processing_ms", "total", start_total)
+
+    return answer, new_summary, metrics
+
+
+async def stream_ai_response_with_summary(message: str, current_summary: str, use_cache: bool = True,
+                                          defer_summary: bool = False, recent_turns: Optional[List[dict]] = None,
+                                          turn: Optional[int] = None, session_id: str = "N/A") -> AsyncIterator[Tuple[str, dict]]:
+    """
+    Streams the answer events and finishes with a "done" event carrying the answer,
+    the updated summary (or the current one with `summary_pending` when deferred) and the metrics.
+    """
+    start_total = time.monotonic()
+    async for event, data in stream_ai_response(message, current_summary, use_cache, recent_turns):
+        if event != "answer":
+            yield event, data
+            continue
+        answer, metrics = data["answer"], data["metrics"]
+
+    if defer_summary and needs_llm_summary(turn, recent_turns, message, answer)[0]:
+        metrics["summary_deferred"] = True
+        record_stage(metrics, "total_ai_processing_ms", "total", start_total)
+        yield "done", {"answer": answer, "summary": current_summary, "summary_pending": True, "metrics": metrics}
+        return
+
+    new_summary = await update_summary(session_id, turn, message, answer, current_summary, recent_turns, metrics)
+    record_stage(metrics, "total_ai_processing_ms", "total", start_total)
+
+    yield "done", {"answer": answer, "summary": new_summary, "summary_pending": False, "metrics": metrics}
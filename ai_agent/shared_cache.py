@@ -0,0 +1,162 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Cache backend: "local" keeps each worker's caches in its own process, "shared" puts the
+# persistent embedding tier and the semantic answer cache in one SQLite file per node
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "local")
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", ".cache/shared-cache.sqlite3")
+SHARED_CACHE_MAX_MB = int(os.getenv("SHARED_CACHE_MAX_MB", "512"))
+# How stale a worker's copy of entries written by other workers may get
+SHARED_CACHE_SYNC_SECONDS = float(os.getenv("SHARED_CACHE_SYNC_SECONDS", "1"))
+SHARED_CACHE_MMAP_MB = 256
+# Size bounds are enforced every this many writes; reads refresh recency at most once per minute
+SHARED_CACHE_TRIM_EVERY = 256
+SHARED_CACHE_TOUCH_SECONDS = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    meta TEXT,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    UNIQUE (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS cache_recency ON cache (namespace, accessed_at);
+"""
+
+
+class SharedCache:
+    """
+    Node-wide cache in a SQLite database in WAL mode. Every worker opens the file directly
+    (memory-mapped reads, no cache server in between); readers never block the single
+    writer and each write is one atomic statement. Rows are namespaced ("embedding",
+    "semantic"); each namespace is bounded by entry count and the whole file by
+    SHARED_CACHE_MAX_MB, evicting the least recently used rows first.
+    Every method is blocking (a writer holding the WAL lock stalls others for up to 5 s):
+    the agent calls them on worker threads, never on the event loop.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.writes = 0
+        self.evictions = 0
+        self._counts: Dict[str, int] = {}
+        self._checked_at: Dict[str, float] = {}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections are per thread; the provider executor threads get their own
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(f"PRAGMA mmap_size={SHARED_CACHE_MMAP_MB * 1024 * 1024}")
+            self._local.connection = connection
+        return connection
+
+    def get(self, namespace: str, key: str) -> Optional[bytes]:
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT value, accessed_at FROM cache WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if now - row[1] > SHARED_CACHE_TOUCH_SECONDS:
+            connection.execute("UPDATE cache SET accessed_at = ? WHERE namespace = ? AND key = ?", (now, namespace, key))
+        return row[0]
+
+    def put(self, namespace: str, key: str, value: bytes, meta: Optional[str] = None,
+            max_entries: Optional[int] = None, ttl: Optional[float] = None):
+        now = time.time()
+        self._connection().execute(
+            "INSERT INTO cache (namespace, key, value, meta, created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, meta = excluded.meta, accessed_at = excluded.accessed_at",
+            (namespace, key, value, meta, now, now)
+        )
+        with self._lock:
+            self.writes += 1
+            trim = self.writes % SHARED_CACHE_TRIM_EVERY == 0
+        if trim:
+            self.trim(namespace, max_entries, ttl)
+
+    def since(self, namespace: str, after_id: int, max_age: Optional[float] = None) -> List[tuple]:
+        """Rows (id, key, value, meta, created_at) added after `after_id`, oldest first."""
+        oldest = time.time() - max_age if max_age else 0
+        return self._connection().execute(
+            "SELECT id, key, value, meta, created_at FROM cache WHERE namespace = ? AND id > ? AND created_at >= ? ORDER BY id",
+            (namespace, after_id, oldest)
+        ).fetchall()
+
+    def count(self, namespace: str) -> int:
+        """Entries in `namespace` as of the last `recount`; stats read it on every response, so it never queries."""
+        return self._counts.get(namespace, 0)
+
+    def recount(self, namespace: str):
+        """Blocking: refreshes `count`, at most once per SHARED_CACHE_SYNC_SECONDS (writers call it)."""
+        checked_at = self._checked_at.get(namespace, 0.0)
+        if time.monotonic() - checked_at > SHARED_CACHE_SYNC_SECONDS:
+            self._checked_at[namespace] = time.monotonic()
+            self._counts[namespace] = self._connection().execute(
+                "SELECT COUNT(*) FROM cache WHERE namespace = ?", (namespace,)
+            ).fetchone()[0]
+
+    def trim(self, namespace: str, max_entries: Optional[int] = None, ttl: Optional[float] = None):
+        connection = self._connection()
+        deleted = 0
+        if ttl:
+            deleted += connection.execute(
+                "DELETE FROM cache WHERE namespace = ? AND created_at < ?", (namespace, time.time() - ttl)
+            ).rowcount
+        if max_entries:
+            deleted += connection.execute(
+                "DELETE FROM cache WHERE id IN (SELECT id FROM cache WHERE namespace = ? ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (namespace, max_entries)
+            ).rowcount
+        # Live pages only: freed pages are reused by later writes, so the file stops growing
+        page_size, pages, free_pages = (
+            connection.execute(f"PRAGMA {pragma}").fetchone()[0] for pragma in ("page_size", "page_count", "freelist_count")
+        )
+        used_bytes = (pages - free_pages) * page_size
+        if used_bytes > self.max_bytes:
+            total = connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            excess = max(1, int(total * (1 - self.max_bytes / used_bytes)))
+            deleted += connection.execute(
+                "DELETE FROM cache WHERE id IN (SELECT id FROM cache ORDER BY accessed_at LIMIT ?)", (excess,)
+            ).rowcount
+        self.evictions += deleted
+
+    def stats(self) -> dict:
+        return {
+            "shared_cache_writes": self.writes,
+            "shared_cache_evictions": self.evictions,
+        }
+
+
+def build_shared_cache() -> Optional[SharedCache]:
+    if CACHE_BACKEND != "shared":
+        return None
+    try:
+        return SharedCache(SHARED_CACHE_PATH, SHARED_CACHE_MAX_MB * 1024 * 1024)
+    except (OSError, sqlite3.Error) as e:
+        logger.error(f"Shared cache unavailable, using per-process caches: {e}")
+        return None
+
+
+shared_cache = build_shared_cache()
@@ -0,0 +1,49 @@
+import os
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+logger = logging.getLogger(__name__)
+
+COALESCING_ENABLED = os.getenv("COALESCING_ENABLED", "True") == "True"
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key onto one in-flight task.
+    The first caller (leader) starts the work; callers arriving while it runs
+    await the same task. The task is shielded, so a caller that disconnects
+    does not cancel the work the others are waiting for.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.inflight: Dict[Hashable, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, work: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Returns (result, coalesced) where `coalesced` is True for followers."""
+        task = self.inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return await asyncio.shield(task), True
+
+        task = asyncio.ensure_future(work())
+        self.inflight[key] = task
+        task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        self.leaders += 1
+        return await asyncio.shield(task), False
+
+    def stats(self) -> dict:
+        return {
+            f"{self.name}_flights": self.leaders,
+            f"{self.name}_coalesced": self.coalesced,
+            f"{self.name}_inflight": len(self.inflight),
+        }
+
+
+answer_flight = SingleFlight("answer")
+summary_flight = SingleFlight("summary")
+retrieval_flight = SingleFlight("retrieval")
+embedding_flight = SingleFlight("embedding")
@@ -0,0 +1,205 @@
+import os
+import json
+import time
+import uuid
+import queue
+import atexit
+import threading
+import asyncio
+import logging
+import logging.handlers
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "True") == "True"
+# JSONL span log (one span per line); empty disables the export
+TRACE_SPAN_LOG = os.getenv("TRACE_SPAN_LOG", ".cache/spans.jsonl")
+# Requests slower than this get their whole span tree written to the log
+SLOW_REQUEST_THRESHOLD_MS = float(os.getenv("SLOW_REQUEST_THRESHOLD_MS", "5000"))
+
+
+@dataclass
+class Span:
+    trace_id: str
+    name: str
+    parent_id: Optional[str] = None
+    span_id: str = field(default_factory=lambda: uuid.uuid4().hex[:16])
+    start_time: float = field(default_factory=time.time)
+    start: float = field(default_factory=time.monotonic)
+    duration_ms: Optional[float] = None
+    attributes: dict = field(default_factory=dict)
+    error: Optional[str] = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_time": round(self.start_time, 6),
+            "duration_ms": self.duration_ms,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+# Spans of requests whose root span is still open, for the slow-request dump
+active_traces: Dict[str, List[Span]] = {}
+
+
+def current_trace_id() -> Optional[str]:
+    span = current_span.get()
+    return span.trace_id if span else None
+
+
+def parse_traceparent(header: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """W3C traceparent "00-<trace id>-<parent span id>-<flags>" -> (trace id, parent span id)."""
+    if not isinstance(header, str):
+        return None, None
+    parts = header.split("-")
+    if len(parts) != 4:
+        return None, None
+    return parts[1], parts[2]
+
+
+# Spans are handed to a queue and appended to the log by a listener thread, off the event loop
+span_log = logging.getLogger("tracing.spans")
+span_log.propagate = False
+_span_listener: Optional[logging.handlers.QueueListener] = None
+_span_log_lock = threading.Lock()
+
+
+def _start_span_log():
+    global _span_listener
+    with _span_log_lock:
+        if _span_listener is not None:
+            return
+        try:
+            os.makedirs(os.path.dirname(TRACE_SPAN_LOG) or ".", exist_ok=True)
+        except OSError as e:
+            logger.error(f"Error creating span log directory: {e}")
+        file_handler = logging.FileHandler(TRACE_SPAN_LOG, encoding="utf-8", delay=True)
+        file_handler.terminator = ""
+        records = queue.SimpleQueue()
+        span_log.addHandler(logging.handlers.QueueHandler(records))
+        span_log.setLevel(logging.INFO)
+        _span_listener = logging.handlers.QueueListener(records, file_handler)
+        _span_listener.start()
+        # Drains what is still queued at exit
+        atexit.register(_span_listener.stop)
+
+
+def export(spans: List[Span]):
+    if not TRACE_SPAN_LOG or not spans:
+        return
+    if _span_listener is None:
+        _start_span_log()
+    span_log.info("".join(json.dumps(span.to_dict(), ensure_ascii=False) + "\n" for span in spans))
+
+
+def format_tree(spans: List[Span]) -> str:
+    children: Dict[Optional[str], List[Span]] = {}
+    ids = {span.span_id for span in spans}
+    for span in sorted(spans, key=lambda s: s.start):
+        children.setdefault(span.parent_id if span.parent_id in ids else None, []).append(span)
+    origin = min(span.start for span in spans)
+
+    lines = []
+
+    def walk(parent_id, depth):
+        for span in children.get(parent_id, []):
+            offset = (span.start - origin) * 1000
+            duration = f"{span.duration_ms:.1f} ms" if span.duration_ms is not None else "open"
+            error = f" ERROR {span.error}" if span.error else ""
+            attributes = f" {span.attributes}" if span.attributes else ""
+            lines.append(f"{'  ' * depth}+{offset:.1f} ms {span.name} ({duration}){error}{attributes}")
+            walk(span.span_id, depth + 1)
+
+    walk(None, 0)
+    return "\n".join(lines)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Child span of the current one; a no-op outside a trace."""
+    parent = current_span.get()
+    if not TRACING_ENABLED or parent is None:
+        yield None
+        return
+    child = Span(parent.trace_id, name, parent.span_id, attributes=attributes)
+    token = current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = repr(e)
+        raise
+    finally:
+        child.duration_ms = round((time.monotonic() - child.start) * 1000, 2)
+        current_span.reset(token)
+        trace = active_traces.get(child.trace_id)
+        if trace is not None:
+            trace.append(child)
+        else:
+            # Background work (deferred summary) outliving its request
+            export([child])
+
+
+@contextmanager
+def start_trace(name: str, trace_id: Optional[str] = None, parent_id: Optional[str] = None, **attributes):
+    """
+    Root span of a request. Continues the caller's trace when `trace_id` is given.
+    On exit the trace's spans are exported, and dumped as a tree when slower than the threshold.
+    """
+    if not TRACING_ENABLED:
+        yield None
+        return
+    root = Span(trace_id or uuid.uuid4().hex, name, parent_id, attributes=attributes)
+    active_traces.setdefault(root.trace_id, [])
+    token = current_span.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.error = repr(e)
+        raise
+    finally:
+        root.duration_ms = round((time.monotonic() - root.start) * 1000, 2)
+        current_span.reset(token)
+        spans = active_traces.pop(root.trace_id, []) + [root]
+        export(spans)
+        if root.duration_ms >= SLOW_REQUEST_THRESHOLD_MS:
+            logger.warning(f"Slow request {root.trace_id} ({root.duration_ms:.0f} ms):\n{format_tree(spans)}")
+
+
+def traced(name: str):
+    """Decorator: runs the (sync or async) function inside a span called `name`."""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TraceIdFilter(logging.Filter):
+    """Adds `trace_id` to log records so log lines can be joined with spans."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = current_trace_id() or "-"
+        return True
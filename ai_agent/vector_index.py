@@ -0,0 +1,232 @@
+import os
+import json
+import time
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Local retrieval backend configuration
+# "supabase" calls the match_documents RPC; "local" searches an in-process replica
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "supabase")
+DOCUMENTS_TABLE = os.getenv("DOCUMENTS_TABLE", "documents")
+# Column used to poll for changed rows; deletions are picked up by the periodic full reload
+DOCUMENTS_UPDATED_COLUMN = os.getenv("DOCUMENTS_UPDATED_COLUMN", "updated_at")
+LOCAL_INDEX_MODE = os.getenv("LOCAL_INDEX_MODE", "flat")  # flat | ivf
+LOCAL_INDEX_NLIST = int(os.getenv("LOCAL_INDEX_NLIST", "64"))
+LOCAL_INDEX_NPROBE = int(os.getenv("LOCAL_INDEX_NPROBE", "8"))
+LOCAL_INDEX_REFRESH_SECONDS = int(os.getenv("LOCAL_INDEX_REFRESH_SECONDS", "60"))
+LOCAL_INDEX_FULL_RELOAD_EVERY = int(os.getenv("LOCAL_INDEX_FULL_RELOAD_EVERY", "60"))
+LOCAL_INDEX_SNAPSHOT_PATH = os.getenv("LOCAL_INDEX_SNAPSHOT_PATH", ".cache/documents.npz")
+LOCAL_INDEX_PAGE_SIZE = 1000
+
+
+def parse_embedding(value) -> np.ndarray:
+    # PostgREST returns pgvector columns as a "[0.1,0.2,...]" string
+    if isinstance(value, str):
+        value = json.loads(value)
+    return np.asarray(value, dtype=np.float32)
+
+
+def fetch_document_rows(client, columns: str, since: Optional[str] = None) -> List[dict]:
+    """
+    Pages through the documents table in (updated, id) order, only rows changed at or after
+    `since` when given. Each page starts after the last (updated, id) of the previous one, so
+    rows sharing a timestamp (a bulk ingest) are neither skipped nor repeated across pages.
+    The poll includes `since` itself because a row committed later can carry the watermark's
+    timestamp; callers drop the rows they already applied (`Watermark.is_new`).
+    """
+    rows, after = [], None
+    while True:
+        query = client.table(DOCUMENTS_TABLE).select(f"{columns}, {DOCUMENTS_UPDATED_COLUMN}")
+        if after:
+            updated, doc_id = after
+            query = query.or_(
+                f'{DOCUMENTS_UPDATED_COLUMN}.gt."{updated}",'
+                f'and({DOCUMENTS_UPDATED_COLUMN}.eq."{updated}",id.gt."{doc_id}")'
+            )
+        elif since:
+            query = query.gte(DOCUMENTS_UPDATED_COLUMN, since)
+        resp = query.order(DOCUMENTS_UPDATED_COLUMN).order("id").limit(LOCAL_INDEX_PAGE_SIZE).execute()
+        batch = resp.data or []
+        rows.extend(batch)
+        if len(batch) < LOCAL_INDEX_PAGE_SIZE:
+            return rows
+        after = (batch[-1][DOCUMENTS_UPDATED_COLUMN], batch[-1]["id"])
+
+
+class Watermark:
+    """Latest `updated` value applied from the table and the ids applied at exactly that value."""
+
+    def __init__(self, value: Optional[str] = None):
+        self.value = value
+        self.ids = set()
+
+    def is_new(self, row: dict) -> bool:
+        updated = row.get(DOCUMENTS_UPDATED_COLUMN)
+        return updated is None or str(updated) != self.value or row["id"] not in self.ids
+
+    def advance(self, row: dict):
+        updated = row.get(DOCUMENTS_UPDATED_COLUMN)
+        if not updated:
+            return
+        updated = str(updated)
+        if self.value is None or updated > self.value:
+            self.value, self.ids = updated, {row["id"]}
+        elif updated == self.value:
+            self.ids.add(row["id"])
+
+
+class IndexSnapshot:
+    """
+    Immutable search structure built off the event loop and swapped in atomically.
+    Flat mode scores every row; IVF mode clusters rows with spherical k-means and only
+    scores the `nprobe` clusters closest to the query.
+    """
+
+    def __init__(self, rows: Dict, vectors: Dict, mode: str, nlist: int, nprobe: int):
+        self.ids = list(vectors.keys())
+        self.rows = [rows[doc_id] for doc_id in self.ids]
+        self.mode = mode
+        self.nprobe = nprobe
+        self.matrix = None
+        self.centroids = None
+        self.lists: List[np.ndarray] = []
+        if self.ids:
+            matrix = np.stack([vectors[doc_id] for doc_id in self.ids])
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            self.matrix = matrix / np.where(norms == 0, 1, norms)
+            if mode == "ivf":
+                self._train_ivf(min(nlist, max(1, int(np.sqrt(len(self.ids))))))
+
+    def _train_ivf(self, nlist: int, iterations: int = 10):
+        rng = np.random.default_rng(0)
+        centroids = self.matrix[rng.choice(len(self.ids), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(self.matrix @ centroids.T, axis=1)
+            for cluster in range(nlist):
+                members = self.matrix[assignment == cluster]
+                if len(members):
+                    centroid = members.mean(axis=0)
+                    centroids[cluster] = centroid / (np.linalg.norm(centroid) or 1)
+        assignment = np.argmax(self.matrix @ centroids.T, axis=1)
+        self.centroids = centroids
+        self.lists = [np.where(assignment == cluster)[0] for cluster in range(nlist)]
+
+    def search(self, query: np.ndarray, match_count: int) -> List[dict]:
+        if self.matrix is None:
+            return []
+        norm = np.linalg.norm(query)
+        query = query / norm if norm else query
+
+        if self.centroids is not None:
+            probes = np.argsort(-(self.centroids @ query))[:self.nprobe]
+            candidates = np.concatenate([self.lists[cluster] for cluster in probes])
+        else:
+            candidates = np.arange(len(self.ids))
+
+        scores = self.matrix[candidates] @ query
+        count = min(match_count, len(candidates))
+        top = np.argpartition(-scores, count - 1)[:count] if count else []
+        top = sorted(top, key=lambda position: -scores[position])
+        return [
+            {**self.rows[candidates[position]], "similarity": float(scores[position])}
+            for position in top
+        ]
+
+
+class LocalVectorIndex:
+    """
+    In-process replica of the documents table answering like the match_documents RPC
+    (rows with id, content, metadata and similarity, best first).
+    """
+
+    def __init__(self, mode: str = LOCAL_INDEX_MODE, nlist: int = LOCAL_INDEX_NLIST, nprobe: int = LOCAL_INDEX_NPROBE):
+        self.mode = mode
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.rows: Dict = {}
+        self.vectors: Dict = {}
+        self.watermark = Watermark()
+        self.snapshot = IndexSnapshot({}, {}, mode, nlist, nprobe)
+        self.last_refresh: Optional[float] = None
+        self.polls = 0
+
+    @property
+    def ready(self) -> bool:
+        return self.snapshot.matrix is not None
+
+    def apply_rows(self, rows: List[dict], replace: bool = False) -> int:
+        """Upserts table rows (replacing everything when `replace`). Returns the number applied."""
+        if replace:
+            self.rows, self.vectors, self.watermark = {}, {}, Watermark()
+        applied = 0
+        for row in rows:
+            if not self.watermark.is_new(row):
+                continue
+            self.watermark.advance(row)
+            applied += 1
+            embedding = row.get("embedding")
+            if embedding is None:
+                continue
+            doc_id = row["id"]
+            self.rows[doc_id] = {"id": doc_id, "content": row.get("content", ""), "metadata": row.get("metadata") or {}}
+            self.vectors[doc_id] = parse_embedding(embedding)
+        return applied
+
+    def rebuild(self):
+        self.snapshot = IndexSnapshot(self.rows, self.vectors, self.mode, self.nlist, self.nprobe)
+
+    def search(self, embedding: List[float], match_count: int) -> List[dict]:
+        return self.snapshot.search(np.asarray(embedding, dtype=np.float32), match_count)
+
+    def refresh(self, client) -> int:
+        """
+        Blocking: polls the table for changed rows and rebuilds the search structure if any
+        changed. Every LOCAL_INDEX_FULL_RELOAD_EVERY polls it reloads everything to drop deleted rows.
+        """
+        full_reload = self.watermark.value is None or self.polls % LOCAL_INDEX_FULL_RELOAD_EVERY == 0
+        rows = fetch_document_rows(client, "id, content, metadata, embedding", None if full_reload else self.watermark.value)
+        self.polls += 1
+        changed = self.apply_rows(rows, replace=full_reload)
+        if changed or full_reload:
+            self.rebuild()
+        self.last_refresh = time.time()
+        return changed
+
+    def save(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        ids = list(self.vectors.keys())
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            vectors=np.stack([self.vectors[doc_id] for doc_id in ids]) if ids else np.zeros((0, 0), np.float32),
+            rows=np.array(json.dumps([self.rows[doc_id] for doc_id in ids], ensure_ascii=False, default=str)),
+            watermark=np.array(self.watermark.value or "")
+        )
+        os.replace(tmp_path, path)
+
+    def load(self, path: str) -> bool:
+        if not os.path.exists(path):
+            return False
+        data = np.load(path)
+        rows = json.loads(str(data["rows"]))
+        self.rows = {row["id"]: row for row in rows}
+        self.vectors = {row["id"]: vector for row, vector in zip(rows, data["vectors"])}
+        self.watermark = Watermark(str(data["watermark"]) or None)
+        self.rebuild()
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "local_index_documents": len(self.snapshot.ids),
+            "local_index_mode": self.mode,
+            "local_index_age_s": round(time.time() - self.last_refresh, 1) if self.last_refresh else None,
+        }
+
+
+local_index = LocalVectorIndex() if RETRIEVAL_BACKEND == "local" else None
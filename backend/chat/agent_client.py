@@ -0,0 +1,45 @@
+import asyncio
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+_client = None
+_loop = None
+_session = None
+
+
+def agent_client():
+    """
+    Keep-alive HTTP client to the AI agent, shared by every async chat turn of the process.
+    Under ASGI there is one event loop per process, so connections are reused across turns;
+    each async view call under WSGI (runserver) runs in a loop of its own and gets a new client.
+    """
+    global _client, _loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _loop is not loop:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.AI_AGENT_TIMEOUT_SECONDS, connect=5),
+            limits=httpx.Limits(
+                max_connections=settings.AI_AGENT_POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.AI_AGENT_POOL_MAX_KEEPALIVE,
+            ),
+        )
+        _loop = loop
+    return _client
+
+
+def agent_session():
+    """
+    Keep-alive requests.Session to the AI agent for the sync views, shared by the worker's
+    threads, so each thread reuses a pooled connection instead of opening one per turn.
+    """
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=settings.AI_AGENT_POOL_MAX_KEEPALIVE)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _session = session
+    return _session
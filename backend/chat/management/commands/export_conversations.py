@@ -0,0 +1,86 @@
+import hashlib
+import json
+import re
+import secrets
+
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_datetime
+
+from chat.models import AIChatSession
+
+# Personal data that can appear in free text; model names and specs (E20, 1450 mm) are kept
+EMAIL = re.compile(r'[\w.+-]+@[\w-]+\.[\w.-]+')
+URL = re.compile(r'https?://\S+|www\.\S+')
+PHONE = re.compile(r'\+?\d[\d\s().-]{7,}\d')
+LONG_NUMBER = re.compile(r'\b\d{9,}\b')
+
+
+def anonymise(text):
+    text = EMAIL.sub('<email>', text)
+    text = URL.sub('<url>', text)
+    text = PHONE.sub('<phone>', text)
+    return LONG_NUMBER.sub('<number>', text)
+
+
+class Command(BaseCommand):
+    help = (
+        "Exports anonymised conversations as JSONL (one session per line) for the agent's replay "
+        "benchmark: user messages in turn order with their offsets from the session start, and the "
+        "session's offset from the first exported session."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Destination .jsonl file')
+        parser.add_argument('--since', help='Only sessions created at or after this ISO datetime')
+        parser.add_argument('--until', help='Only sessions created before this ISO datetime')
+        parser.add_argument('--limit', type=int, help='Maximum number of sessions')
+        parser.add_argument('--min-turns', type=int, default=1, help='Skip sessions with fewer user messages')
+        parser.add_argument('--include-deleted', action='store_true')
+        parser.add_argument('--salt', help='Salt for the hashed session ids (random by default, so exports are unlinkable)')
+
+    def handle(self, *args, **options):
+        salt = options['salt'] or secrets.token_hex(16)
+        sessions = AIChatSession.objects.order_by('created_at')
+        if not options['include_deleted']:
+            sessions = sessions.filter(is_deleted=False)
+        if options['since']:
+            sessions = sessions.filter(created_at__gte=parse_datetime(options['since']))
+        if options['until']:
+            sessions = sessions.filter(created_at__lt=parse_datetime(options['until']))
+        if options['limit']:
+            sessions = sessions[:options['limit']]
+
+        exported = turns = 0
+        origin = None
+        with open(options['output'], 'w', encoding='utf-8') as output:
+            for session in sessions.prefetch_related('interactions').iterator(chunk_size=200):
+                interactions = sorted(session.interactions.all(), key=lambda i: (i.timestamp, i.id))
+                user_messages = [i for i in interactions if i.is_user]
+                if len(user_messages) < options['min_turns']:
+                    continue
+
+                start = user_messages[0].timestamp
+                origin = origin or start
+                answers = {}
+                for previous, interaction in zip(interactions, interactions[1:]):
+                    if previous.is_user and not interaction.is_user:
+                        answers[previous.id] = len(interaction.message)
+
+                record = {
+                    'session': hashlib.sha256(f"{salt}:{session.id}".encode()).hexdigest()[:16],
+                    'offset_s': round((start - origin).total_seconds(), 3),
+                    'turns': [
+                        {
+                            'offset_s': round((message.timestamp - start).total_seconds(), 3),
+                            'message': anonymise(message.message),
+                            # Length only: the replay regenerates answers, this is for comparison
+                            'answer_chars': answers.get(message.id),
+                        }
+                        for message in user_messages
+                    ],
+                }
+                output.write(json.dumps(record, ensure_ascii=False) + '\n')
+                exported += 1
+                turns += len(user_messages)
+
+        self.stdout.write(self.style.SUCCESS(f"Exported {exported} sessions ({turns} turns) to {options['output']}"))
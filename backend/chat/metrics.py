@@ -0,0 +1,65 @@
+import os
+import time
+
+from django.db import connection
+from django.http import HttpResponse
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30)
+
+CHAT_REQUEST_SECONDS = Histogram('chat_request_duration_seconds', 'Wall time per chat request', ['view'], buckets=BUCKETS)
+CHAT_AGENT_SECONDS = Histogram('chat_agent_call_duration_seconds', 'Time spent waiting on the AI agent', ['view'], buckets=BUCKETS)
+CHAT_DB_SECONDS = Histogram('chat_db_duration_seconds', 'Time spent in database queries per chat request', ['view'], buckets=BUCKETS)
+CHAT_DB_QUERIES = Histogram('chat_db_queries', 'Database queries per chat request', ['view'], buckets=(1, 2, 4, 6, 8, 10, 15, 20, 30, 50))
+CHAT_AGENT_ERRORS = Counter('chat_agent_errors_total', 'Failed calls to the AI agent', ['view'])
+CHAT_IN_FLIGHT = Gauge('chat_requests_in_flight', 'Chat requests currently being served', ['view'])
+
+
+class QueryTimer:
+    """
+    Accumulates the time spent in database queries on the current connection.
+    Can be entered several times to cover separate segments of one request.
+    """
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.queries = 0
+        self._wrappers = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.monotonic()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.monotonic() - start
+            self.queries += 1
+
+    def __enter__(self):
+        wrapper = connection.execute_wrapper(self)
+        wrapper.__enter__()
+        self._wrappers.append(wrapper)
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._wrappers.pop().__exit__(*exc_info)
+
+    @property
+    def ms(self):
+        return round(self.seconds * 1000, 2)
+
+    def observe(self, view, metrics):
+        """Reports the accumulated DB time in the response metrics and the histograms."""
+        metrics['backend_db_ms'] = self.ms
+        metrics['backend_db_queries'] = self.queries
+        CHAT_DB_SECONDS.labels(view).observe(self.seconds)
+        CHAT_DB_QUERIES.labels(view).observe(self.queries)
+
+
+def metrics_view(request):
+    """Prometheus scrape target; aggregates across workers when PROMETHEUS_MULTIPROC_DIR is set."""
+    registry = REGISTRY
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
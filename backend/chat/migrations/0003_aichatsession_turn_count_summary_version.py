@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_aichatsession_is_deleted_aichatsession_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aichatsession',
+            name='turn_count',
+            field=models.PositiveIntegerField(default=0, help_text='Number of user turns sent to the AI agent'),
+        ),
+        migrations.AddField(
+            model_name='aichatsession',
+            name='summary_version',
+            field=models.PositiveIntegerField(default=0, help_text='Turn the current summary was generated for'),
+        ),
+    ]
@@ -9,6 +9,8 @@ class AIChatSession(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     summary = models.TextField(blank=True, null=True, help_text="AI generated summary of the conversation")
     is_deleted = models.BooleanField(default=False)
+    turn_count = models.PositiveIntegerField(default=0, help_text="Number of user turns sent to the AI agent")
+    summary_version = models.PositiveIntegerField(default=0, help_text="Turn the current summary was generated for")
 
     def __str__(self):
         return f"Session {self.id} - {self.created_at}"
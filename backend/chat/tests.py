@@ -0,0 +1,82 @@
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import path
+
+from .views import AsyncChatStreamView, AsyncChatView, ChatStreamView, ChatView, parse_sse
+
+# Statements per turn inside the chat views and how many transactions they run in
+QUERY_BUDGET = {
+    'chat': {'new': (3, 1), 'follow_up': (5, 1)},
+    'chat-stream': {'new': (4, 2), 'follow_up': (6, 2)},
+}
+# The session and user lookups of the session and auth middleware
+MIDDLEWARE_QUERIES = 2
+
+VIEWS = {
+    'sync': {'chat': ChatView, 'chat-stream': ChatStreamView},
+    'async': {'chat': AsyncChatView, 'chat-stream': AsyncChatStreamView},
+}
+
+# Both variants of each view, whichever CHAT_ASYNC_VIEW selects in chat.urls
+urlpatterns = [
+    path(f'{variant}/{name}/', view.as_view())
+    for variant, views in VIEWS.items() for name, view in views.items()
+]
+
+
+async def read_async_stream(content):
+    return b''.join([chunk async for chunk in content])
+
+
+@override_settings(ROOT_URLCONF=__name__, MOCK_AI_RESPONSE=True, TRACING_ENABLED=False)
+class ChatTurnQueriesTest(TestCase):
+    """Queries per chat turn, first turn of a session and follow-ups, with the AI agent mocked."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('chat-test')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def post_turn(self, url, name, kind, session_id=None):
+        """Posts one turn to `url`, checking its queries against QUERY_BUDGET; returns the session id."""
+        statements, transactions = QUERY_BUDGET[name][kind]
+        payload = {'message': '¿Cuál es la capacidad de carga del E20?'}
+        if session_id:
+            payload['session_id'] = session_id
+        # Inside the test's transaction each of the view's transactions is a SAVEPOINT and a RELEASE
+        with self.assertNumQueries(MIDDLEWARE_QUERIES + statements + 2 * transactions):
+            response = self.client.post(url, payload, content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            data = self.final_event(response) if response.streaming else response.json()
+        self.assertEqual(data['metrics']['backend_db_queries'], statements + 2 * transactions)
+        return str(data['session_id'])
+
+    def assert_turn_queries(self, variant, name):
+        url = f'/{variant}/{name}/'
+        session_id = self.post_turn(url, name, 'new')
+        for _ in range(2):
+            self.assertEqual(self.post_turn(url, name, 'follow_up', session_id), session_id)
+
+    @staticmethod
+    def final_event(response):
+        if response.is_async:
+            content = async_to_sync(read_async_stream)(response.streaming_content)
+        else:
+            content = b''.join(response.streaming_content)
+        lines = content.decode('utf-8').splitlines()
+        return next(data for event, data in parse_sse(lines) if event == 'done')
+
+    def test_chat_view(self):
+        self.assert_turn_queries('sync', 'chat')
+
+    def test_async_chat_view(self):
+        self.assert_turn_queries('async', 'chat')
+
+    def test_chat_stream_view(self):
+        self.assert_turn_queries('sync', 'chat-stream')
+
+    def test_async_chat_stream_view(self):
+        self.assert_turn_queries('async', 'chat-stream')
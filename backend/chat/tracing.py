@@ -0,0 +1,176 @@
+import os
+import json
+import time
+import uuid
+import queue
+import atexit
+import inspect
+import logging
+import logging.handlers
+import threading
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    def __init__(self, trace_id, name, parent_id=None, **attributes):
+        self.trace_id = trace_id
+        self.name = name
+        self.parent_id = parent_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.start_time = time.time()
+        self.start = time.monotonic()
+        self.duration_ms = None
+        self.attributes = attributes
+        self.error = None
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start_time': round(self.start_time, 6),
+            'duration_ms': self.duration_ms,
+            'attributes': self.attributes,
+            'error': self.error,
+        }
+
+
+current_span = ContextVar('current_span', default=None)
+# Spans of requests whose root span is still open, for the slow-request dump
+active_traces = {}
+
+
+def trace_headers():
+    """W3C traceparent for the current span, so the agent continues the same trace."""
+    span_ = current_span.get()
+    if span_ is None:
+        return {}
+    return {'traceparent': f"00-{span_.trace_id}-{span_.span_id}-01"}
+
+
+# Spans are handed to a queue and appended to the log by a listener thread, off the request path
+span_log = logging.getLogger('chat.tracing.spans')
+span_log.propagate = False
+_span_listener = None
+_span_log_lock = threading.Lock()
+
+
+def _start_span_log():
+    global _span_listener
+    with _span_log_lock:
+        if _span_listener is not None:
+            return
+        try:
+            os.makedirs(os.path.dirname(settings.TRACE_SPAN_LOG) or '.', exist_ok=True)
+        except OSError as e:
+            logger.error(f"Error creating span log directory: {e}")
+        file_handler = logging.FileHandler(settings.TRACE_SPAN_LOG, encoding='utf-8', delay=True)
+        file_handler.terminator = ''
+        records = queue.SimpleQueue()
+        span_log.addHandler(logging.handlers.QueueHandler(records))
+        span_log.setLevel(logging.INFO)
+        _span_listener = logging.handlers.QueueListener(records, file_handler)
+        _span_listener.start()
+        # Drains what is still queued at exit
+        atexit.register(_span_listener.stop)
+
+
+def export(spans):
+    if not settings.TRACE_SPAN_LOG or not spans:
+        return
+    if _span_listener is None:
+        _start_span_log()
+    span_log.info(''.join(json.dumps(s.to_dict(), default=str) + '\n' for s in spans))
+
+
+def format_tree(spans):
+    ids = {s.span_id for s in spans}
+    children = {}
+    for s in sorted(spans, key=lambda s: s.start):
+        children.setdefault(s.parent_id if s.parent_id in ids else None, []).append(s)
+    origin = min(s.start for s in spans)
+    lines = []
+
+    def walk(parent_id, depth):
+        for s in children.get(parent_id, []):
+            error = f" ERROR {s.error}" if s.error else ""
+            lines.append(f"{'  ' * depth}+{(s.start - origin) * 1000:.1f} ms {s.name} ({s.duration_ms} ms){error}")
+            walk(s.span_id, depth + 1)
+
+    walk(None, 0)
+    return '\n'.join(lines)
+
+
+@contextmanager
+def span(name, **attributes):
+    """Child span of the current one; a no-op outside a trace."""
+    parent = current_span.get()
+    if not settings.TRACING_ENABLED or parent is None:
+        yield None
+        return
+    child = Span(parent.trace_id, name, parent.span_id, **attributes)
+    token = current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = repr(e)
+        raise
+    finally:
+        child.duration_ms = round((time.monotonic() - child.start) * 1000, 2)
+        current_span.reset(token)
+        trace = active_traces.get(child.trace_id)
+        if trace is not None:
+            trace.append(child)
+        else:
+            export([child])
+
+
+@contextmanager
+def start_trace(name, trace_id=None, parent_id=None, **attributes):
+    """
+    Root span of a request (a new trace id unless `trace_id` is given).
+    On exit the spans are exported, and dumped as a tree when slower than SLOW_REQUEST_THRESHOLD_MS.
+    """
+    if not settings.TRACING_ENABLED:
+        yield None
+        return
+    root = Span(trace_id or uuid.uuid4().hex, name, parent_id, **attributes)
+    active_traces.setdefault(root.trace_id, [])
+    token = current_span.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.error = repr(e)
+        raise
+    finally:
+        root.duration_ms = round((time.monotonic() - root.start) * 1000, 2)
+        current_span.reset(token)
+        spans = active_traces.pop(root.trace_id, []) + [root]
+        export(spans)
+        if root.duration_ms >= settings.SLOW_REQUEST_THRESHOLD_MS:
+            logger.warning(f"Slow request {root.trace_id} ({root.duration_ms:.0f} ms):\n{format_tree(spans)}")
+
+
+def traced(name):
+    """Decorator: runs the function (or coroutine function) inside a span called `name`."""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,8 +1,11 @@
+from django.conf import settings
 from django.urls import path
-from .views import ChatView, SessionListView, SessionDetailView, LoginView, LogoutView, CheckAuthView, DeleteSessionView
+from .views import AsyncChatView, AsyncChatStreamView, ChatView, ChatStreamView, SummaryCallbackView, SessionListView, SessionDetailView, LoginView, LogoutView, CheckAuthView, DeleteSessionView
 
 urlpatterns = [
-    path('', ChatView.as_view(), name='chat'),
+    path('', (AsyncChatView if settings.CHAT_ASYNC_VIEW else ChatView).as_view(), name='chat'),
+    path('stream/', (AsyncChatStreamView if settings.CHAT_ASYNC_VIEW else ChatStreamView).as_view(), name='chat-stream'),
+    path('summary-callback/', SummaryCallbackView.as_view(), name='summary-callback'),
     path('sessions/', SessionListView.as_view(), name='session-list'),
     path('sessions/<uuid:id>/', SessionDetailView.as_view(), name='session-detail'),
     path('sessions/<uuid:id>/delete/', DeleteSessionView.as_view(), name='session-delete'),
@@ -1,6 +1,16 @@
-import requests
+import hmac
+import json
+import time
+import asyncio
 import logging
+from contextlib import nullcontext
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import F
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views import View
 from django.contrib.auth import authenticate, login, logout
 from django.views.decorators.csrf import ensure_csrf_cookie
 from django.utils.decorators import method_decorator
@@ -9,7 +19,10 @@ from rest_framework.response import Response
 from rest_framework import status
 from rest_framework import generics
 from rest_framework.permissions import IsAuthenticated
+from .agent_client import agent_client, agent_session
+from .metrics import CHAT_AGENT_ERRORS, CHAT_AGENT_SECONDS, CHAT_IN_FLIGHT, CHAT_REQUEST_SECONDS, QueryTimer
 from .models import AIChatSession, ChatInteraction
+from .tracing import span, start_trace, trace_headers, traced
 from .serializers import AIChatSessionSerializer, ChatInteractionSerializer, AIChatSessionDetailSerializer
 
 logger = logging.getLogger(__name__)
@@ -36,89 +49,543 @@ class CheckAuthView(APIView):
              return Response({'username': request.user.username, 'is_authenticated': True})
         return Response({'is_authenticated': False, 'username': None}, status=status.HTTP_200_OK)
 
+@traced('db.get_session')
+def find_session(user, session_id):
+    """The user's session `session_id`, or None if it does not exist or was deleted."""
+    try:
+        # Ensure user owns the session and it is not deleted
+        return AIChatSession.objects.get(id=session_id, user=user, is_deleted=False)
+    except AIChatSession.DoesNotExist:
+        return None
+
+@traced('wait_for_pending_summary')
+def wait_for_pending_summary(session):
+    """
+    The summary of the previous turn may still be on its way from the agent callback.
+    Waits up to SUMMARY_WAIT_TIMEOUT_SECONDS for it, then continues with what is stored.
+    """
+    deadline = time.monotonic() + settings.SUMMARY_WAIT_TIMEOUT_SECONDS
+    while session.summary_version < session.turn_count and time.monotonic() < deadline:
+        time.sleep(settings.SUMMARY_WAIT_POLL_SECONDS)
+        session.refresh_from_db(fields=['summary', 'summary_version'])
+
+@traced('wait_for_pending_summary')
+async def await_pending_summary(session, db):
+    """wait_for_pending_summary for the async view: sleeps without holding a thread or a connection."""
+    deadline = time.monotonic() + settings.SUMMARY_WAIT_TIMEOUT_SECONDS
+    while session.summary_version < session.turn_count and time.monotonic() < deadline:
+        await asyncio.sleep(settings.SUMMARY_WAIT_POLL_SECONDS)
+        await run_in_db(db, session.refresh_from_db, fields=['summary', 'summary_version'])
+
+def reserve_turn(session):
+    """Reserves the next turn number for the session."""
+    # One statement when no other turn of the session got in since it was loaded
+    turn = session.turn_count + 1
+    if AIChatSession.objects.filter(id=session.id, turn_count=session.turn_count).update(turn_count=turn):
+        session.turn_count = turn
+        return turn
+    AIChatSession.objects.filter(id=session.id).update(turn_count=F('turn_count') + 1)
+    session.refresh_from_db(fields=['turn_count'])
+    return session.turn_count
+
+@traced('db.save_summary')
+def save_summary(session, summary, turn):
+    """Stores the summary for `turn` unless a newer turn's summary is already stored."""
+    updated = AIChatSession.objects.filter(id=session.id, summary_version__lt=turn).update(
+        summary=summary, summary_version=turn
+    )
+    if updated:
+        session.summary = summary
+        session.summary_version = turn
+
+@traced('db.recent_turns')
+def recent_turns(session):
+    """Last AI_AGENT_HISTORY_MESSAGES messages of the session, oldest first, for the agent's verbatim window."""
+    interactions = session.interactions.order_by('-timestamp', '-id').values('is_user', 'message')[:settings.AI_AGENT_HISTORY_MESSAGES]
+    return list(reversed(interactions))
+
+@traced('db.open_turn')
+def open_turn(user, session, message, store_message):
+    """
+    Pre-call writes, in one short transaction when there are two: creates the session when
+    `session` is None (with its first turn already reserved) or reserves the next turn, and
+    stores the user's message if `store_message`. The recent history is read first, so it excludes the message.
+    Returns (session, turn, history, user interaction or None).
+    """
+    history = recent_turns(session) if session is not None else []
+    user_interaction = None
+    # A single write is atomic on its own; BEGIN/COMMIT would only add two round trips
+    with transaction.atomic() if store_message else nullcontext():
+        if session is None:
+            # Initial temporary summary (can be updated by AI later)
+            session = AIChatSession.objects.create(
+                user=user, turn_count=1, summary=f"New conversation started: {message[:30]}..."
+            )
+            turn = 1
+        else:
+            turn = reserve_turn(session)
+        if store_message:
+            user_interaction = ChatInteraction.objects.create(session=session, is_user=True, message=message)
+    return session, turn, history, user_interaction
+
+@traced('db.close_turn')
+def close_turn(session, turn, answer, summary, summary_pending, message=None):
+    """
+    Post-call writes, in one transaction when there are two: the summary (unless it arrives
+    later through the callback) and, in a single insert, the user's `message` (when it was not stored before
+    the call) and the AI's answer. Returns (user interaction or None, AI interaction).
+    """
+    interactions = [ChatInteraction(session=session, is_user=True, message=message)] if message is not None else []
+    interactions.append(ChatInteraction(session=session, is_user=False, message=answer))
+    with transaction.atomic() if not summary_pending else nullcontext():
+        if not summary_pending:
+            save_summary(session, summary or session.summary, turn)
+        ChatInteraction.objects.bulk_create(interactions)
+    return (interactions[0] if message is not None else None), interactions[-1]
+
+async def run_in_db(db, func, *args, **kwargs):
+    """
+    Runs the ORM block `func` from an async view, timing its queries on `db`. Every block of
+    a request runs on the request's one sync thread, so they share its DB connection, which
+    Django closes when the request finishes.
+    """
+    def block():
+        with db:
+            return func(*args, **kwargs)
+    return await sync_to_async(block)()
+
+async def release_db_connection():
+    """
+    Closes the request's DB connection before the agent call: a turn waiting seconds on the
+    agent must not hold an idle Postgres connection, or a few hundred turns would exhaust
+    max_connections. The writes after the call reconnect once.
+    """
+    # `connection` is looked up on the sync thread: resolved here it is the event loop's own.
+    # Inside an outer transaction (a TestCase) the connection has to stay open.
+    def close():
+        if not connection.in_atomic_block:
+            connection.close()
+    await sync_to_async(close)()
+
+def read_chat_body(request):
+    """(session_id, message) from an async view's JSON body, or None if it is not a JSON object."""
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    return data.get('session_id'), data.get('message')
+
+def agent_payload(session, message, turn, history, trace_id=None):
+    return {
+        'message': message,
+        'summary': session.summary,
+        'recent_turns': history,
+        'session_id': str(session.id),
+        'turn': turn,
+        # The agent answers right away and posts the summary to SummaryCallbackView
+        'defer_summary': settings.AI_AGENT_DEFER_SUMMARY,
+        'trace_id': trace_id,
+    }
+
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+class SSEParser:
+    """Incremental Server-Sent Events parser: fed one line at a time, returns each complete (event, data)."""
+
+    def __init__(self):
+        self.event, self.data = None, []
+
+    def feed(self, line):
+        if not line:
+            complete = (self.event, json.loads("\n".join(self.data))) if self.event and self.data else None
+            self.event, self.data = None, []
+            return complete
+        if line.startswith('event:'):
+            self.event = line[len('event:'):].strip()
+        elif line.startswith('data:'):
+            self.data.append(line[len('data:'):].strip())
+        return None
+
+def parse_sse(lines):
+    """Yields (event, data) pairs from an iterator of Server-Sent Events lines."""
+    parser = SSEParser()
+    for line in lines:
+        complete = parser.feed(line)
+        if complete is not None:
+            yield complete
+
+def event_stream_response(events, root):
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    if root is not None:
+        response['X-Trace-Id'] = root.trace_id
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+class ChatTurn:
+    """
+    One chat turn from open_turn until its answer is stored, shared by the sync and async
+    views: they only differ in how they reach the database and the agent, and call these
+    steps in the same order.
+    """
+
+    def __init__(self, view, root, session, turn, history, user_interaction):
+        self.view = view
+        self.session = session
+        self.turn = turn
+        self.history = history
+        self.user_interaction = user_interaction
+        self.ai_interaction = None
+        # A streamed body runs after post() returns, so it is traced as a continuation of the same trace
+        self.trace = (root.trace_id, root.span_id) if root is not None else (None, None)
+        self.metrics = {'trace_id': root.trace_id} if root is not None else {}
+        self.answer = []
+        self.summary = session.summary
+        self.summary_pending = False
+        self.parser = SSEParser()
+        self.started = time.monotonic()
+
+    def payload(self, message):
+        return agent_payload(self.session, message, self.turn, self.history, self.trace[0])
+
+    def mock(self, message):
+        self.answer = [f"This is a mocked response to: '{message}'. The backend is running in mock mode."]
+        self.summary = f"Summary updated for session {self.session.id} (Mock)"
+        self.metrics.update({"mock_mode": True})
+
+    def mock_events(self, message):
+        """`mock`, streamed one word per token event."""
+        self.mock(message)
+        words = self.answer[0].split(' ')
+        self.answer = [word + ' ' for word in words]
+        return [format_sse('token', {'text': word + ' '}) for word in words]
+
+    def apply_response(self, data):
+        """Takes the answer, summary and metrics of the agent's JSON response."""
+        self.answer = [data.get('answer', 'No answer received.')]
+        self.summary = data.get('summary', self.session.summary)
+        self.summary_pending = data.get('summary_pending', False)
+        self.metrics.update(data.get('metrics', {}))
+
+    def agent_line(self, line):
+        """
+        Folds one line of the agent's stream into the turn. Returns the event to forward to the
+        browser, if the line completed one ("done" is replaced by the backend's own once stored).
+        """
+        complete = self.parser.feed(line)
+        if complete is None:
+            return None
+        event, data = complete
+        if event == 'done':
+            self.apply_response(data)
+            return None
+        if event == 'error':
+            raise RuntimeError(data.get('detail', 'AI Agent stream error'))
+        if event == 'token':
+            if not self.answer:
+                self.metrics["backend_time_to_first_token_ms"] = round((time.monotonic() - self.started) * 1000, 2)
+            self.answer.append(data.get('text', ''))
+        return format_sse(event, data)
+
+    def fail(self, error):
+        """Agent call failed: the turn is stored with what was received, or an apology."""
+        logger.error(f"Error calling AI Agent ({self.view}): {error}")
+        CHAT_AGENT_ERRORS.labels(self.view).inc()
+        if not self.answer:
+            self.answer = ["Sorry, I am having trouble connecting to the AI brain right now."]
+        return format_sse('error', {'detail': 'AI Agent stream error'})
+
+    def agent_done(self):
+        agent_seconds = time.monotonic() - self.started
+        CHAT_AGENT_SECONDS.labels(self.view).observe(agent_seconds)
+        self.metrics["backend_total_processing_ms"] = round(agent_seconds * 1000, 2)
+
+    def close(self, message=None):
+        """Blocking: stores the answer (and `message`, if it was not stored before the call)."""
+        answer = "".join(self.answer) or 'No answer received.'
+        user_interaction, self.ai_interaction = close_turn(
+            self.session, self.turn, answer, self.summary, self.summary_pending, message
+        )
+        self.user_interaction = user_interaction or self.user_interaction
+
+    def result(self):
+        return {
+            'session_id': self.session.id,
+            'summary': self.session.summary,
+            'question_id': self.user_interaction.id,
+            'answer_id': self.ai_interaction.id,
+            'answer': self.ai_interaction.message,
+            'summary_pending': self.summary_pending,
+            'metrics': self.metrics
+        }
+
+    def session_event(self):
+        return format_sse('session', {'session_id': str(self.session.id), 'question_id': self.user_interaction.id})
+
+    def done_event(self):
+        return format_sse('done', {**self.result(), 'session_id': str(self.session.id)})
+
 class ChatView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
+        with start_trace('backend.chat', user_id=request.user.id) as root, \
+                CHAT_IN_FLIGHT.labels('chat').track_inprogress(), CHAT_REQUEST_SECONDS.labels('chat').time():
+            response = self.handle(request, root)
+        if root is not None:
+            response['X-Trace-Id'] = root.trace_id
+        return response
+
+    def handle(self, request, root):
         session_id = request.data.get('session_id')
         message = request.data.get('message')
 
         if not message:
             return Response({'error': 'Message is required'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Get or Create Session
-        if session_id:
-            try:
-                # Ensure user owns the session and it is not deleted
-                session = AIChatSession.objects.get(id=session_id, user=request.user, is_deleted=False)
-            except AIChatSession.DoesNotExist:
-                return Response({'error': 'Session not found'}, status=status.HTTP_404_NOT_FOUND)
+        db = QueryTimer()
+        with db:
+            session = None
+            if session_id:
+                session = find_session(request.user, session_id)
+                if session is None:
+                    return Response({'error': 'Session not found'}, status=status.HTTP_404_NOT_FOUND)
+                wait_for_pending_summary(session)
+
+            # Create the session or reserve the turn; the user interaction is saved with the answer
+            turn = ChatTurn('chat', root, *open_turn(request.user, session, message, store_message=False))
+
+        if settings.MOCK_AI_RESPONSE:
+            turn.mock(message)
         else:
-            session = AIChatSession.objects.create(user=request.user)
-            # Initial temporary summary (can be updated by AI later)
-            session.summary = f"New conversation started: {message[:30]}..."
-            session.save()
+            try:
+                with span('agent.call'):
+                    response = agent_session().post(settings.AI_AGENT_URL, json=turn.payload(message), headers=trace_headers(),
+                                                    timeout=settings.AI_AGENT_TIMEOUT_SECONDS)
+                    response.raise_for_status()
+                    turn.apply_response(response.json())
+            except Exception as e:
+                turn.fail(e)
+        turn.agent_done()
 
-        # Save User Interaction
-        user_interaction = ChatInteraction.objects.create(
-            session=session,
-            is_user=True,
-            message=message
-        )
+        with db:
+            # Update Session Summary and save both interactions
+            turn.close(message)
+        db.observe('chat', turn.metrics)
+        return Response(turn.result())
 
-        # AI Response Logic
-        ai_response_text = ""
-        ai_summary = session.summary
-        metrics = {}
-        import time
-        start_backend = time.time()
+class AsyncChatView(View):
+    """
+    ChatView for ASGI, with the same request and response. The agent call is awaited on the
+    process-wide keep-alive client and the database work runs in short blocks around it, so
+    a turn waiting on the agent holds neither a thread nor a database connection.
+    """
+
+    async def post(self, request):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=status.HTTP_403_FORBIDDEN)
+
+        with start_trace('backend.chat', user_id=user.id) as root, \
+                CHAT_IN_FLIGHT.labels('chat').track_inprogress(), CHAT_REQUEST_SECONDS.labels('chat').time():
+            response = await self.handle(request, user, root)
+        if root is not None:
+            response['X-Trace-Id'] = root.trace_id
+        return response
+
+    async def handle(self, request, user, root):
+        body = read_chat_body(request)
+        if body is None:
+            return JsonResponse({'error': 'Invalid JSON body'}, status=status.HTTP_400_BAD_REQUEST)
+        session_id, message = body
+
+        if not message:
+            return JsonResponse({'error': 'Message is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        db = QueryTimer()
+        session = None
+        if session_id:
+            session = await run_in_db(db, find_session, user, session_id)
+            if session is None:
+                return JsonResponse({'error': 'Session not found'}, status=status.HTTP_404_NOT_FOUND)
+            await await_pending_summary(session, db)
+        turn = ChatTurn('chat', root, *await run_in_db(db, open_turn, user, session, message, False))
+        await release_db_connection()
 
         if settings.MOCK_AI_RESPONSE:
-            ai_response_text = f"This is a mocked response to: '{message}'. The backend is running in mock mode."
-            ai_summary = f"Summary updated for session {session.id} (Mock)"
-            metrics = {"mock_mode": True}
+            turn.mock(message)
         else:
             try:
-                # Call External N8N Agent
-                payload = {
-                    'message': message,
-                    'summary': session.summary,
-                    # Add any other context needed
-                }
-                response = requests.post(settings.AI_AGENT_URL, json=payload, timeout=30)
+                with span('agent.call'):
+                    response = await agent_client().post(settings.AI_AGENT_URL, json=turn.payload(message), headers=trace_headers())
+                    response.raise_for_status()
+                    turn.apply_response(response.json())
+            except Exception as e:
+                turn.fail(e)
+        turn.agent_done()
+
+        await run_in_db(db, turn.close, message)
+        db.observe('chat', turn.metrics)
+        return JsonResponse(turn.result())
+
+class ChatStreamView(APIView):
+    """
+    Streaming variant of ChatView.
+    Proxies the agent's Server-Sent Events to the browser and persists the
+    AI interaction and summary once the stream ends.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        session_id = request.data.get('session_id')
+        message = request.data.get('message')
+
+        if not message:
+            return Response({'error': 'Message is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        db = QueryTimer()
+        with start_trace('backend.chat_stream', user_id=request.user.id) as root, db:
+            session = None
+            if session_id:
+                session = find_session(request.user, session_id)
+                if session is None:
+                    return Response({'error': 'Session not found'}, status=status.HTTP_404_NOT_FOUND)
+                wait_for_pending_summary(session)
+
+            # The question id goes out with the first event, so the user interaction is saved now
+            turn = ChatTurn('chat_stream', root, *open_turn(request.user, session, message, store_message=True))
+
+        return event_stream_response(self.event_stream(turn, message, db), root)
+
+    def event_stream(self, turn, message, db):
+        with start_trace('backend.chat_stream.body', *turn.trace), \
+                CHAT_IN_FLIGHT.labels('chat_stream').track_inprogress(), CHAT_REQUEST_SECONDS.labels('chat_stream').time():
+            yield turn.session_event()
+            try:
+                if settings.MOCK_AI_RESPONSE:
+                    yield from turn.mock_events(message)
+                else:
+                    yield from self.proxy_agent_stream(turn, message)
+            finally:
+                # Runs on normal completion and when the browser disconnects mid-stream
+                turn.agent_done()
+                with db:
+                    turn.close()
+                db.observe('chat_stream', turn.metrics)
+            yield turn.done_event()
+
+    def proxy_agent_stream(self, turn, message):
+        try:
+            with span('agent.call'), agent_session().post(
+                settings.AI_AGENT_STREAM_URL, json=turn.payload(message), headers=trace_headers(), stream=True, timeout=(5, 30)
+            ) as response:
                 response.raise_for_status()
-                data = response.json()
-                
-                ai_response_text = data.get('answer', 'No answer received.')
-                ai_summary = data.get('summary', session.summary)
-                metrics = data.get('metrics', {})
+                response.encoding = 'utf-8'
+                for line in response.iter_lines(decode_unicode=True):
+                    event = turn.agent_line(line)
+                    if event is not None:
+                        yield event
+        except Exception as e:
+            yield turn.fail(e)
 
-            except Exception as e:
-                logger.error(f"Error calling AI Agent: {e}")
-                ai_response_text = "Sorry, I am having trouble connecting to the AI brain right now."
-        
-        metrics["backend_total_processing_ms"] = round((time.time() - start_backend) * 1000, 2)
-
-        # Update Session Summary
-        if ai_summary:
-            session.summary = ai_summary
-            session.save()
+class AsyncChatStreamView(View):
+    """
+    ChatStreamView for ASGI, with the same request and events. The body is an async generator
+    reading the agent's stream on the process-wide keep-alive client, so a streaming turn
+    holds no thread while tokens arrive, and no DB connection between its writes.
+    """
 
-        # Save AI Interaction
-        ai_interaction = ChatInteraction.objects.create(
-            session=session,
-            is_user=False,
-            message=ai_response_text
-        )
+    async def post(self, request):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=status.HTTP_403_FORBIDDEN)
+
+        body = read_chat_body(request)
+        if body is None:
+            return JsonResponse({'error': 'Invalid JSON body'}, status=status.HTTP_400_BAD_REQUEST)
+        session_id, message = body
+        if not message:
+            return JsonResponse({'error': 'Message is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        db = QueryTimer()
+        with start_trace('backend.chat_stream', user_id=user.id) as root:
+            session = None
+            if session_id:
+                session = await run_in_db(db, find_session, user, session_id)
+                if session is None:
+                    return JsonResponse({'error': 'Session not found'}, status=status.HTTP_404_NOT_FOUND)
+                await await_pending_summary(session, db)
+
+            # The question id goes out with the first event, so the user interaction is saved now
+            turn = ChatTurn('chat_stream', root, *await run_in_db(db, open_turn, user, session, message, True))
+            await release_db_connection()
+
+        return event_stream_response(self.event_stream(turn, message, db), root)
+
+    async def event_stream(self, turn, message, db):
+        with start_trace('backend.chat_stream.body', *turn.trace), \
+                CHAT_IN_FLIGHT.labels('chat_stream').track_inprogress(), CHAT_REQUEST_SECONDS.labels('chat_stream').time():
+            yield turn.session_event()
+            try:
+                if settings.MOCK_AI_RESPONSE:
+                    for event in turn.mock_events(message):
+                        yield event
+                else:
+                    async for event in self.proxy_agent_stream(turn, message):
+                        yield event
+            finally:
+                # Runs on normal completion and when the browser disconnects mid-stream
+                turn.agent_done()
+                await run_in_db(db, turn.close)
+                db.observe('chat_stream', turn.metrics)
+            yield turn.done_event()
+
+    async def proxy_agent_stream(self, turn, message):
+        try:
+            with span('agent.call'):
+                async with agent_client().stream(
+                    'POST', settings.AI_AGENT_STREAM_URL, json=turn.payload(message), headers=trace_headers()
+                ) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        event = turn.agent_line(line)
+                        if event is not None:
+                            yield event
+        except Exception as e:
+            yield turn.fail(e)
+
+class SummaryCallbackView(APIView):
+    """
+    Receives summaries the AI agent generated after it already answered.
+    Authenticated with the shared agent token; updates for a turn older than the
+    stored summary are discarded so late or out-of-order deliveries cannot regress it.
+    """
+    authentication_classes = []
+    permission_classes = []
+
+    def post(self, request):
+        token = request.headers.get('X-Agent-Token', '')
+        expected = settings.AI_AGENT_CALLBACK_TOKEN
+        if not expected or not hmac.compare_digest(token, expected):
+            return Response({'error': 'Forbidden'}, status=status.HTTP_403_FORBIDDEN)
+
+        session_id = request.data.get('session_id')
+        turn = request.data.get('turn')
+        summary = request.data.get('summary')
+        if not session_id or not isinstance(turn, int) or summary is None:
+            return Response({'error': 'session_id, turn and summary are required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            updated = AIChatSession.objects.filter(id=session_id, summary_version__lt=turn).update(
+                summary=summary, summary_version=turn
+            )
+        except (ValueError, ValidationError):
+            return Response({'error': 'Invalid session_id'}, status=status.HTTP_400_BAD_REQUEST)
 
-        return Response({
-            'session_id': session.id,
-            'summary': session.summary,
-            'question_id': user_interaction.id,
-            'answer_id': ai_interaction.id,
-            'answer': ai_response_text,
-            'metrics': metrics
-        })
+        return Response({'updated': bool(updated)}, status=status.HTTP_200_OK)
 
 class SessionListView(generics.ListAPIView):
     permission_classes = [IsAuthenticated]
@@ -0,0 +1,13 @@
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+application = get_asgi_application()
+
+# runserver serves static files (admin CSS) in development; so does the ASGI app when DEBUG is on
+if settings.DEBUG:
+    application = ASGIStaticFilesHandler(application)
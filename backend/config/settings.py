@@ -60,6 +60,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'config.wsgi.application'
+ASGI_APPLICATION = 'config.asgi.application'
 
 
 # Database
@@ -135,4 +136,24 @@ SESSION_COOKIE_SECURE = False # Dev only
 
 # AI Agent Settings
 AI_AGENT_URL = os.environ.get('AI_AGENT_URL', 'https://webhook.site/placeholder')
+AI_AGENT_STREAM_URL = os.environ.get('AI_AGENT_STREAM_URL', AI_AGENT_URL.rstrip('/') + '/stream')
 MOCK_AI_RESPONSE = os.environ.get('MOCK_AI_RESPONSE', 'False') == 'True'
+# Deferred summaries: the agent answers first and posts the summary to /api/chat/summary-callback/
+AI_AGENT_DEFER_SUMMARY = os.environ.get('AI_AGENT_DEFER_SUMMARY', 'True') == 'True'
+AI_AGENT_CALLBACK_TOKEN = os.environ.get('AI_AGENT_CALLBACK_TOKEN', '')
+SUMMARY_WAIT_TIMEOUT_SECONDS = float(os.environ.get('SUMMARY_WAIT_TIMEOUT_SECONDS', '3'))
+SUMMARY_WAIT_POLL_SECONDS = 0.1
+# Recent messages sent verbatim alongside the summary (the agent re-summarises only every few turns)
+AI_AGENT_HISTORY_MESSAGES = int(os.environ.get('AI_AGENT_HISTORY_MESSAGES', '6'))
+AI_AGENT_TIMEOUT_SECONDS = float(os.environ.get('AI_AGENT_TIMEOUT_SECONDS', '30'))
+# Chat turns are served by the async views under ASGI (uvicorn config.asgi:application); False
+# serves the sync views, under WSGI (gunicorn config.wsgi), which hold a worker thread per turn
+CHAT_ASYNC_VIEW = os.environ.get('CHAT_ASYNC_VIEW', 'True') == 'True'
+# Keep-alive pool to the agent, shared by all turns of the process (per thread pool size for the sync views)
+AI_AGENT_POOL_MAX_CONNECTIONS = int(os.environ.get('AI_AGENT_POOL_MAX_CONNECTIONS', '200'))
+AI_AGENT_POOL_MAX_KEEPALIVE = int(os.environ.get('AI_AGENT_POOL_MAX_KEEPALIVE', '50'))
+
+# Request tracing: spans exported as JSONL, slow requests logged with their span tree
+TRACING_ENABLED = os.environ.get('TRACING_ENABLED', 'True') == 'True'
+TRACE_SPAN_LOG = os.environ.get('TRACE_SPAN_LOG', str(BASE_DIR / '.cache' / 'spans.jsonl'))
+SLOW_REQUEST_THRESHOLD_MS = float(os.environ.get('SLOW_REQUEST_THRESHOLD_MS', '5000'))
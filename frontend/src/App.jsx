@@ -129,24 +129,58 @@ function App() {
         setInputText('');
         setMessages(prev => [...prev, { id: Date.now(), text, sender: 'user' }]);
 
+        const aiMessageId = `stream-${Date.now()}`;
+        setMessages(prev => [...prev, { id: aiMessageId, text: '', sender: 'ai' }]);
+        const updateAiMessage = (patch) => setMessages(prev => prev.map(m => m.id === aiMessageId ? { ...m, ...patch(m) } : m));
+
         try {
-            const res = await axios.post(API_BASE_URL + '/', {
-                message: text,
-                session_id: selectedSessionId
+            // Streaming endpoint: Server-Sent Events over a POST body, read with fetch
+            const res = await fetch(`${API_BASE_URL}/stream/`, {
+                method: 'POST',
+                credentials: 'include',
+                headers: { 'Content-Type': 'application/json', 'X-CSRFToken': getCookie('csrftoken') || '' },
+                body: JSON.stringify({ message: text, session_id: selectedSessionId })
             });
-            if (!selectedSessionId) {
-                setSelectedSessionId(res.data.session_id);
-                fetchSessions();
-            }
-            setMessages(prev => [...prev, { id: res.data.answer_id, text: res.data.answer, sender: 'ai' }]);
-            
-            if (res.data.metrics) {
-                console.group("🚀 Performance Metrics");
-                console.table(res.data.metrics);
-                console.groupEnd();
+            if (!res.ok || !res.body) throw new Error(`HTTP ${res.status}`);
+
+            const reader = res.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+
+            const handleEvent = (event, data) => {
+                if (event === 'session' && !selectedSessionId) {
+                    setSelectedSessionId(data.session_id);
+                } else if (event === 'token') {
+                    updateAiMessage(m => ({ text: m.text + data.text }));
+                } else if (event === 'done') {
+                    updateAiMessage(() => ({ id: data.answer_id, text: data.answer }));
+                    if (!selectedSessionId) fetchSessions();
+                    if (data.metrics) {
+                        console.group("🚀 Performance Metrics");
+                        console.table(data.metrics);
+                        console.groupEnd();
+                    }
+                }
+            };
+
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                const frames = buffer.split('\n\n');
+                buffer = frames.pop();
+                for (const frame of frames) {
+                    let event = 'message';
+                    const dataLines = [];
+                    for (const line of frame.split('\n')) {
+                        if (line.startsWith('event:')) event = line.slice(6).trim();
+                        else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+                    }
+                    if (dataLines.length) handleEvent(event, JSON.parse(dataLines.join('\n')));
+                }
             }
         } catch (e) {
-            setMessages(prev => [...prev, { id: Date.now(), text: "Error de conexión", sender: 'ai', isError: true }]);
+            updateAiMessage(() => ({ text: "Error de conexión", isError: true }));
         }
     };
 